@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
 
+from utils import iniciar_preaquecimento, render_preaquecimento, preimportar_modulos
+
 # ============= CONFIGURAÇÃO DA PÁGINA =============
 st.set_page_config(
     page_title="Dashboard de Frota",
@@ -58,6 +60,10 @@ uploaded_file = st.sidebar.file_uploader(
 if uploaded_file is not None:
     st.session_state['uploaded_file'] = uploaded_file
     st.sidebar.success("✅ Arquivo carregado!")
+    
+    # Geocodificação e rotas do mapa em segundo plano
+    iniciar_preaquecimento(uploaded_file)
+    render_preaquecimento()
 else:
     if 'uploaded_file' in st.session_state:
         del st.session_state['uploaded_file']
@@ -207,3 +213,6 @@ st.markdown("""
     </p>
 </div>
 """, unsafe_allow_html=True)
+
+# Bibliotecas de mapa e gráficos carregadas em segundo plano para as próximas páginas
+preimportar_modulos()
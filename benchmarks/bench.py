@@ -0,0 +1,207 @@
+"""Benchmarks dos caminhos de dados do dashboard sobre planilhas sintéticas
+
+Uso:
+    python benchmarks/bench.py                                # 1k, 10k, 100k e 1M viagens
+    python benchmarks/bench.py --tamanhos 1000 10000          # só alguns tamanhos
+    python benchmarks/bench.py --casos load_all_data mapa     # casos que contêm os termos
+    python benchmarks/bench.py --salvar-baseline              # grava os tempos em baseline.json
+    python benchmarks/bench.py --rede --latencia 0.05         # inclui geocodificação/roteamento via stub local
+
+Compara com baseline.json e sai com código 1 se algum caso ficar mais lento que
+baseline × tolerância. As planilhas geradas ficam em benchmarks/.dados/ para reuso.
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import sys
+import time
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(PASTA, '..')))
+sys.path.insert(0, PASTA)
+
+from streamlit import logger
+logger.set_log_level('error')
+
+import utils
+from gerar_planilha import CIDADES, gerar_dados, salvar_planilha
+from servidores_stub import ServidorStub
+
+BASELINE = os.path.join(PASTA, 'baseline.json')
+DADOS = os.path.join(PASTA, '.dados')
+TAMANHOS = [1_000, 10_000, 100_000, 1_000_000]
+RUIDO_MINIMO = 0.005  # s; diferenças menores que isso não contam como regressão
+
+
+def medir(funcao, repeticoes=5, orcamento=2.0):
+    """Melhor tempo (s) de até `repeticoes` execuções, parando ao estourar `orcamento` segundos"""
+    tempos = []
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - t0)
+        if time.perf_counter() - inicio > orcamento:
+            break
+    return min(tempos)
+
+
+def planilha(n):
+    """Caminho da planilha sintética com `n` viagens (gerada na primeira vez)"""
+    os.makedirs(DADOS, exist_ok=True)
+    caminho = os.path.join(DADOS, f'viagens_{n}.xlsx')
+    if not os.path.exists(caminho):
+        print(f"   gerando {caminho}...", flush=True)
+        salvar_planilha(gerar_dados(n, seed=0), caminho)
+    return caminho
+
+
+def cache_geocodes():
+    """Cache de coordenadas já quente com as cidades do gerador (nenhuma consulta ao Nominatim)"""
+    cache = utils.CacheLRU(max_itens=len(CIDADES) * 2)
+    for cidade, uf, lat, lon, _ in CIDADES:
+        cache.set((cidade, uf), (lat, lon))
+    return cache
+
+
+def casos(n, incluir=lambda nome: True):
+    """[(nome, função sem argumentos)] para `n` viagens; o preparo fica fora da medição"""
+    df = gerar_dados(n, seed=0)[0]
+    inicio, fim = df['DATA_INICIO_VIAGEM'].min(), df['DATA_RETORNO'].max()
+    motorista = df['MOTORISTA'].mode()[0]
+    veiculo = df['MODELO_VEICULO'].mode()[0]
+    
+    df_com_coords, coords = utils.get_viagens_com_coords(df, cache=cache_geocodes())
+    df_mapa = df_com_coords.dropna(subset=['lat_origem', 'lon_origem', 'lat_destino', 'lon_destino'])
+    df_cidades = utils.agregar_por_cidade(df)
+    load_all_data = inspect.unwrap(utils.load_all_data)  # sem o span e sem o st.cache_data
+    caminho = planilha(n) if incluir('load_all_data') else None
+    
+    todos = [
+        ('load_all_data', lambda: load_all_data(caminho)),
+        ('apply_filters', lambda: utils.filtrar_viagens(df, inicio, fim, motorista=motorista)),
+        ('agregar_por_cidade', lambda: utils.agregar_por_cidade(df)),
+        ('mapa/coordenadas', lambda: utils.get_viagens_com_coords(df, cache=cache_geocodes())),
+        ('mapa/contar_visitas', lambda: utils.contar_visitas_por_cidade(df, coords)),
+        ('mapa/construir', lambda: utils.construir_mapa(df_mapa, coords)),
+        ('mapa/construir_agregado', lambda: utils.construir_mapa(df_mapa, coords, agregar=True)),
+        ('insights_gerais', lambda: utils.insights_gerais(df)),
+        ('insights_motorista', lambda: utils.insights_motorista(df[df['MOTORISTA'] == motorista])),
+        ('insights_veiculo', lambda: utils.insights_veiculo(df[df['MODELO_VEICULO'] == veiculo])),
+        ('insights_cidade', lambda: utils.insights_cidade(df_cidades)),
+    ]
+    return [(nome, funcao) for nome, funcao in todos if incluir(nome)]
+
+
+def casos_rede(n, roteador, max_viagens, incluir=lambda nome: True):
+    """Casos ponta a ponta contra o stub (Nominatim + ORS locais), com até `max_viagens` viagens
+    
+    Os casos "frio" começam com caches vazios a cada execução; "quente" reusa o
+    cache preenchido e não deve gerar nenhuma requisição. `roteador` aponta para
+    o stub e é o mesmo em todas as repetições (o pool já está de pé).
+    """
+    df = gerar_dados(n, seed=0)[0].head(max_viagens)
+    
+    df_com_coords, coords = utils.get_viagens_com_coords(df, cache=utils.CacheLRU(max_itens=20000))
+    sequencias = utils.sequencias_de_paradas(df_com_coords, coords)
+    df_mapa = df_com_coords.dropna(subset=['lat_origem', 'lon_origem', 'lat_destino', 'lon_destino'])
+    
+    cache_quente = utils.get_cache_rotas()
+    utils.calcular_trechos_pendentes(sequencias, 'stub', roteador=roteador, cache=cache_quente)
+    
+    todos = [
+        ('rede/geocodificar_frio', lambda: utils.get_viagens_com_coords(df, cache=utils.CacheLRU(max_itens=20000))),
+        ('rede/rotear_frio', lambda: utils.calcular_trechos_pendentes(
+            sequencias, 'stub', roteador=roteador, cache=utils.CacheLRU(max_itens=50000))),
+        ('rede/rotear_quente', lambda: utils.calcular_trechos_pendentes(
+            sequencias, 'stub', roteador=roteador, cache=cache_quente)),
+        ('rede/mapa_rotas_reais', lambda: utils.construir_mapa(df_mapa, coords, rota_real=True)),
+    ]
+    return [(nome, funcao) for nome, funcao in todos if incluir(nome)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=TAMANHOS)
+    parser.add_argument('--casos', nargs='+', help="Só casos cujo nome contém algum destes termos")
+    parser.add_argument('--tolerancia', type=float, default=1.5, help="Regressão se tempo > baseline × tolerância")
+    parser.add_argument('--salvar-baseline', action='store_true')
+    parser.add_argument('--rede', action='store_true', help="Inclui casos de geocodificação e roteamento via stub local")
+    parser.add_argument('--latencia', type=float, default=0.02, help="Latência do stub (s)")
+    parser.add_argument('--rede-viagens', type=int, default=300, help="Viagens usadas nos casos de rede")
+    args = parser.parse_args()
+    
+    stub = roteador = None
+    if args.rede:
+        stub = ServidorStub(latencia=args.latencia).iniciar()
+        roteador = utils.RoteadorORS('stub', base_url=stub.url, por_minuto=10 ** 6, por_dia=10 ** 9)
+        utils.NOMINATIM_DOMINIO = f"localhost:{stub.porta}"
+        utils.NOMINATIM_ESQUEMA = 'http'
+        utils.NOMINATIM_INTERVALO = 0.0
+    
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding='utf-8') as f:
+            baseline = json.load(f)
+    referencia = baseline.get('resultados', {})
+    
+    def incluir(nome):
+        return not args.casos or any(termo in nome for termo in args.casos)
+    
+    resultados = {}
+    regressoes = []
+    for n in args.tamanhos:
+        print(f"\n📦 {n:,} viagens".replace(',', '.'), flush=True)
+        resultados[str(n)] = {}
+        lista = casos(n, incluir)
+        if stub is not None:
+            lista += casos_rede(n, roteador, args.rede_viagens, incluir)
+        
+        for nome, funcao in lista:
+            antes = stub.resumo() if stub is not None else {}
+            tempo = medir(funcao)
+            resultados[str(n)][nome] = round(tempo, 5)
+            
+            anterior = referencia.get(str(n), {}).get(nome)
+            marca = ''
+            if anterior:
+                marca = f"  (baseline {anterior:.4f}s, {tempo / anterior:.2f}×)"
+                if tempo > anterior * args.tolerancia and tempo - anterior > RUIDO_MINIMO:
+                    regressoes.append((n, nome, anterior, tempo))
+                    marca += '  ⚠️ REGRESSÃO'
+            if nome.startswith('rede/'):
+                depois = stub.resumo()
+                requisicoes = sum(
+                    c['requisicoes'] - antes.get(servico, {}).get('requisicoes', 0) for servico, c in depois.items()
+                )
+                marca += f"  [{requisicoes} req]"
+                if nome.endswith('_quente') and requisicoes:
+                    regressoes.append((n, f"{nome} fez {requisicoes} requisições com o cache quente", 0, tempo))
+                    marca += '  ⚠️ CACHE'
+            print(f"   {nome:<26} {tempo:9.4f}s{marca}", flush=True)
+    
+    if roteador is not None:
+        roteador.executor.shutdown()
+    
+    if args.salvar_baseline:
+        for n, tempos in resultados.items():
+            referencia.setdefault(n, {}).update(tempos)
+        baseline = {
+            'maquina': f"{platform.system()} {platform.machine()} • Python {platform.python_version()}",
+            'resultados': referencia,
+        }
+        with open(BASELINE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Baseline gravada em {BASELINE}")
+    
+    if regressoes:
+        print(f"\n❌ {len(regressoes)} regressão(ões) acima de {args.tolerancia}× a baseline:")
+        for n, nome, anterior, tempo in regressoes:
+            print(f"   {n} • {nome}: {anterior:.4f}s → {tempo:.4f}s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
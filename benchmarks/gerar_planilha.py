@@ -0,0 +1,209 @@
+"""Gera planilhas sintéticas no formato do CONSOLIDADO_DESPESAS
+
+Uso:
+    python benchmarks/gerar_planilha.py --viagens 10000 --motoristas 40 --veiculos 25 --saida dados.xlsx
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+# Cidade, UF, lat, lon, população (mil) — o peso do sorteio segue a população
+CIDADES = [
+    ('São Paulo', 'SP', -23.5505, -46.6333, 11450), ('Rio de Janeiro', 'RJ', -22.9068, -43.1729, 6211),
+    ('Brasília', 'DF', -15.7939, -47.8828, 2817), ('Fortaleza', 'CE', -3.7319, -38.5267, 2428),
+    ('Salvador', 'BA', -12.9714, -38.5014, 2418), ('Belo Horizonte', 'MG', -19.9167, -43.9345, 2315),
+    ('Manaus', 'AM', -3.1190, -60.0217, 2063), ('Curitiba', 'PR', -25.4284, -49.2733, 1773),
+    ('Recife', 'PE', -8.0476, -34.8770, 1488), ('Goiânia', 'GO', -16.6869, -49.2648, 1437),
+    ('Porto Alegre', 'RS', -30.0346, -51.2177, 1332), ('Belém', 'PA', -1.4558, -48.4902, 1303),
+    ('Guarulhos', 'SP', -23.4538, -46.5333, 1291), ('Campinas', 'SP', -22.9099, -47.0626, 1139),
+    ('São Luís', 'MA', -2.5307, -44.3068, 1037), ('Maceió', 'AL', -9.6498, -35.7089, 957),
+    ('Campo Grande', 'MS', -20.4697, -54.6201, 898), ('Teresina', 'PI', -5.0920, -42.8038, 866),
+    ('João Pessoa', 'PB', -7.1195, -34.8450, 833), ('Natal', 'RN', -5.7945, -35.2110, 751),
+    ('Ribeirão Preto', 'SP', -21.1775, -47.8103, 698), ('Uberlândia', 'MG', -18.9186, -48.2772, 713),
+    ('Sorocaba', 'SP', -23.5015, -47.4526, 723), ('Contagem', 'MG', -19.9320, -44.0539, 621),
+    ('Aracaju', 'SE', -10.9472, -37.0731, 602), ('Feira de Santana', 'BA', -12.2664, -38.9663, 616),
+    ('Cuiabá', 'MT', -15.6014, -56.0979, 650), ('Joinville', 'SC', -26.3045, -48.8487, 616),
+    ('Juiz de Fora', 'MG', -21.7642, -43.3503, 540), ('Londrina', 'PR', -23.3045, -51.1696, 555),
+    ('Aparecida de Goiânia', 'GO', -16.8198, -49.2469, 527), ('Porto Velho', 'RO', -8.7612, -63.9004, 460),
+    ('Serra', 'ES', -20.1286, -40.3078, 520), ('Florianópolis', 'SC', -27.5954, -48.5480, 537),
+    ('Vitória', 'ES', -20.3155, -40.3128, 322), ('Santos', 'SP', -23.9608, -46.3336, 418),
+    ('São José dos Campos', 'SP', -23.1896, -45.8841, 697), ('Macapá', 'AP', 0.0349, -51.0694, 442),
+    ('Maringá', 'PR', -23.4210, -51.9331, 409), ('Caxias do Sul', 'RS', -29.1634, -51.1797, 463),
+    ('Montes Claros', 'MG', -16.7350, -43.8617, 414), ('Anápolis', 'GO', -16.3281, -48.9530, 398),
+    ('Piracicaba', 'SP', -22.7253, -47.6492, 423), ('Cascavel', 'PR', -24.9555, -53.4552, 348),
+    ('Rio Branco', 'AC', -9.9747, -67.8243, 364), ('Boa Vista', 'RR', 2.8235, -60.6758, 413),
+    ('Palmas', 'TO', -10.1844, -48.3336, 302), ('Dourados', 'MS', -22.2231, -54.8120, 243),
+    ('Chapecó', 'SC', -27.1004, -52.6152, 254), ('Petrolina', 'PE', -9.3891, -40.5030, 386),
+    ('Rondonópolis', 'MT', -16.4673, -54.6372, 244), ('Passo Fundo', 'RS', -28.2620, -52.4064, 206),
+    ('Imperatriz', 'MA', -5.5264, -47.4917, 273), ('Marabá', 'PA', -5.3686, -49.1178, 266),
+    ('Sinop', 'MT', -11.8642, -55.5093, 196), ('Barreiras', 'BA', -12.1439, -44.9968, 159),
+]
+
+MODELOS = ['Volvo FH 540', 'Scania R 450', 'Mercedes Actros 2651', 'DAF XF 530', 'Iveco S-Way 480',
+           'Volkswagen Meteor 29.520', 'Mercedes Axor 2544', 'Volvo VM 330']
+NOMES = ['Ana', 'Bruno', 'Carlos', 'Daniela', 'Eduardo', 'Fernanda', 'Gustavo', 'Helena', 'Igor', 'Juliana',
+         'Leonardo', 'Mariana', 'Nicolas', 'Otávio', 'Patrícia', 'Rafael', 'Sabrina', 'Thiago', 'Vanessa', 'Wagner']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Ferreira', 'Costa', 'Rodrigues', 'Almeida']
+ITENS_MANUTENCAO = ['Troca de óleo e filtros', 'Pneus dianteiros', 'Revisão de freios', 'Alinhamento e balanceamento',
+                    'Embreagem', 'Suspensão', 'Sistema elétrico', 'Revisão geral']
+
+
+def coords_cidades():
+    """{cidade: (lat, lon)} das cidades sorteáveis (o servidor stub responde a geocodificação com elas)"""
+    return {cidade: (lat, lon) for cidade, _, lat, lon, _ in CIDADES}
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(a))
+
+
+def gerar_dados(n_viagens, n_motoristas=30, n_veiculos=20, seed=0, inicio='2023-01-01', dias=730):
+    """As seis abas como DataFrames: (viagens, abastecimentos, avarias, hospedagens, frota, manutenções)"""
+    rng = np.random.default_rng(seed)
+    
+    nomes = np.array([c[0] for c in CIDADES], dtype=object)
+    ufs = np.array([c[1] for c in CIDADES], dtype=object)
+    lat = np.array([c[2] for c in CIDADES])
+    lon = np.array([c[3] for c in CIDADES])
+    pesos = np.array([c[4] for c in CIDADES], dtype=float)
+    pesos /= pesos.sum()
+    
+    motoristas = np.array([
+        f"{NOMES[i % len(NOMES)]} {SOBRENOMES[(i // len(NOMES)) % len(SOBRENOMES)]}"
+        + (f" {i // (len(NOMES) * len(SOBRENOMES)) + 1}" if i >= len(NOMES) * len(SOBRENOMES) else '')
+        for i in range(n_motoristas)
+    ], dtype=object)
+    placas = np.array([
+        f"{''.join(rng.choice(list('ABCDEFGHJKLMNPRSTUVWXYZ'), 3))}{rng.integers(0, 10)}"
+        f"{rng.choice(list('ABCDEFGHIJ'))}{rng.integers(10, 100)}"
+        for _ in range(n_veiculos)
+    ], dtype=object)
+    modelos = rng.choice(MODELOS, n_veiculos)
+    
+    # Cada motorista tem uma base (origem mais frequente)
+    base_motorista = rng.choice(len(CIDADES), n_motoristas, p=pesos)
+    
+    mot = rng.integers(0, n_motoristas, n_viagens)
+    veic = rng.integers(0, n_veiculos, n_viagens)
+    origem = np.where(rng.random(n_viagens) < 0.8, base_motorista[mot], rng.choice(len(CIDADES), n_viagens, p=pesos))
+    
+    # 1 a 4 destinos por viagem
+    n_destinos = rng.choice([1, 2, 3, 4], n_viagens, p=[0.55, 0.25, 0.13, 0.07])
+    destinos = rng.choice(len(CIDADES), (n_viagens, 4), p=pesos)
+    
+    # Distância: linha reta pelas paradas + retorno, com fator de estrada e ruído
+    seq = np.column_stack([origem, destinos, origem])
+    km = np.zeros(n_viagens)
+    for k in range(5):
+        ativo = k < n_destinos + 1
+        a = seq[:, k]
+        b = np.where(k < n_destinos, seq[:, k + 1], origem)
+        km += np.where(ativo, _haversine_km(lat[a], lon[a], lat[b], lon[b]), 0)
+    km = np.maximum(km * rng.normal(1.3, 0.12, n_viagens), 20).round(1)
+    
+    km_l = rng.normal(2.6, 0.35, n_viagens).clip(1.5, 4.0).round(2)
+    litros = (km / km_l).round(1)
+    preco_diesel = rng.normal(5.9, 0.3, n_viagens).clip(5.0, 7.0)
+    custo_combustivel = (litros * preco_diesel).round(2)
+    dias_viagem = np.maximum(1, np.ceil(km / rng.uniform(450, 700, n_viagens))).astype(int)
+    custo_avarias = np.where(rng.random(n_viagens) < 0.08, rng.gamma(2, 250, n_viagens), 0).round(2)
+    custo_hospedagem = ((dias_viagem - 1) * rng.uniform(90, 180, n_viagens)).round(2)
+    
+    data_inicio = pd.Timestamp(inicio) + pd.to_timedelta(rng.integers(0, dias, n_viagens), unit='D')
+    ordem = np.argsort(data_inicio.values, kind='stable')
+    
+    viagens = pd.DataFrame({
+        'ID_VIAGEM': np.arange(1, n_viagens + 1),
+        'DATA_INICIO_VIAGEM': data_inicio.values[ordem],
+        'DATA_RETORNO': (data_inicio + pd.to_timedelta(dias_viagem, unit='D')).values[ordem],
+        'MOTORISTA': motoristas[mot][ordem],
+        'PLACA': placas[veic][ordem],
+        'MODELO_VEICULO': modelos[veic][ordem],
+        'CIDADE_DE_PARTIDA': nomes[origem][ordem],
+        'UF_PARTIDA': ufs[origem][ordem],
+    })
+    for i in range(4):
+        presente = (i < n_destinos)[ordem]
+        viagens[f'CIDADE_DE_DESTINO_{i + 1}'] = np.where(presente, nomes[destinos[:, i]][ordem], None)
+        viagens[f'UF_DESTINO_{i + 1}'] = np.where(presente, ufs[destinos[:, i]][ordem], None)
+    
+    viagens['KM_TOTAL_PERCORRIDO'] = km[ordem]
+    viagens['DIAS_TOTAL_VIAGEM'] = dias_viagem[ordem]
+    viagens['TOTAL_LITROS_DIESEL'] = litros[ordem]
+    viagens['TOTAL_KM/LITRO'] = km_l[ordem]
+    viagens['CUSTO_TOTAL_COMBUSTIVEL'] = custo_combustivel[ordem]
+    viagens['CUSTO_TOTAL_AVARIAS'] = custo_avarias[ordem]
+    viagens['CUSTO_TOTAL_HOSPEDAGEM'] = custo_hospedagem[ordem]
+    viagens['GASTO_FINAL_TOTAL'] = (custo_combustivel + custo_avarias + custo_hospedagem)[ordem].round(2)
+    
+    # Abastecimentos: ~1 a cada 800 km
+    n_abast = np.maximum(1, (viagens['KM_TOTAL_PERCORRIDO'] // 800).astype(int).to_numpy())
+    idx = np.repeat(np.arange(n_viagens), n_abast)
+    abastecimentos = pd.DataFrame({
+        'ID_VIAGEM': viagens['ID_VIAGEM'].to_numpy()[idx],
+        'DATA_ABASTECIMENTO': viagens['DATA_INICIO_VIAGEM'].to_numpy()[idx],
+        'PLACA': viagens['PLACA'].to_numpy()[idx],
+        'LITROS': (viagens['TOTAL_LITROS_DIESEL'].to_numpy() / n_abast)[idx].round(1),
+        'VALOR': (viagens['CUSTO_TOTAL_COMBUSTIVEL'].to_numpy() / n_abast)[idx].round(2),
+    })
+    
+    com_avaria = viagens[viagens['CUSTO_TOTAL_AVARIAS'] > 0]
+    avarias = pd.DataFrame({
+        'ID_VIAGEM': com_avaria['ID_VIAGEM'],
+        'DATA': com_avaria['DATA_INICIO_VIAGEM'],
+        'DESCRICAO': rng.choice(['Pneu furado', 'Farol quebrado', 'Retrovisor', 'Lona rasgada'], len(com_avaria)),
+        'VALOR': com_avaria['CUSTO_TOTAL_AVARIAS'],
+    })
+    
+    com_hospedagem = viagens[viagens['CUSTO_TOTAL_HOSPEDAGEM'] > 0]
+    hospedagens = pd.DataFrame({
+        'ID_VIAGEM': com_hospedagem['ID_VIAGEM'],
+        'CIDADE': com_hospedagem['CIDADE_DE_DESTINO_1'],
+        'DIARIAS': com_hospedagem['DIAS_TOTAL_VIAGEM'] - 1,
+        'VALOR': com_hospedagem['CUSTO_TOTAL_HOSPEDAGEM'],
+    })
+    
+    frota = pd.DataFrame({
+        'PLACA': placas,
+        'MODELO_VEICULO': modelos,
+        'ANO': rng.integers(2012, 2025, n_veiculos),
+    })
+    
+    n_manut = max(1, n_viagens // 20)
+    manutencoes = pd.DataFrame({
+        'DATA_REVISAO': pd.Timestamp(inicio) + pd.to_timedelta(rng.integers(0, dias, n_manut), unit='D'),
+        'VEICULO - PLACA': placas[rng.integers(0, n_veiculos, n_manut)],
+        'ITENS': rng.choice(ITENS_MANUTENCAO, n_manut),
+        'VALOR': rng.gamma(2, 600, n_manut).round(2),
+        'RESPONSAVEL_DESPESA': rng.choice(['Empresa', 'Motorista', 'Seguradora'], n_manut, p=[0.8, 0.1, 0.1]),
+    }).sort_values('DATA_REVISAO')
+    
+    return viagens, abastecimentos, avarias, hospedagens, frota, manutencoes
+
+
+def salvar_planilha(abas, destino):
+    """Grava as seis abas com os nomes esperados por `load_all_data`"""
+    nomes = ['DADOS_VIAGEM', 'ABASTECIMENTOS', 'AVARIAS_VIAGEM', 'HOSPEDAGENS', 'FROTA', 'DESPESAS_MANUTENCOES']
+    with pd.ExcelWriter(destino) as writer:
+        for nome, df in zip(nomes, abas):
+            df.to_excel(writer, sheet_name=nome, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--viagens', type=int, default=1000)
+    parser.add_argument('--motoristas', type=int, default=30)
+    parser.add_argument('--veiculos', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--saida', default='dados_sinteticos.xlsx')
+    args = parser.parse_args()
+    
+    abas = gerar_dados(args.viagens, args.motoristas, args.veiculos, args.seed)
+    salvar_planilha(abas, args.saida)
+    print(f"✅ {args.saida}: {args.viagens} viagens, {args.motoristas} motoristas, {args.veiculos} veículos")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""Servidor HTTP local que imita o Nominatim e o OpenRouteService
+
+Respostas determinísticas (mesma consulta → mesmas coordenadas e geometria),
+com latência, taxa de erro e limitação por HTTP 429 configuráveis. Para
+apontar o dashboard para ele:
+
+    python benchmarks/servidores_stub.py --porta 8090 --latencia 0.2 --taxa-429 0.05
+    NOMINATIM_DOMINIO=localhost:8090 NOMINATIM_ESQUEMA=http NOMINATIM_INTERVALO=0 \\
+    ORS_BASE_URL=http://localhost:8090 ORS_API_KEY=stub streamlit run Home.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import unicodedata
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from gerar_planilha import coords_cidades
+
+FATOR_ESTRADA = 1.25
+VELOCIDADE_KMH = 70.0
+PASSO_GEOMETRIA_KM = 5.0
+MAX_PONTOS_TRECHO = 200
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode()
+    return texto.strip().lower()
+
+
+COORDS_CONHECIDAS = {_normalizar(cidade): latlon for cidade, latlon in coords_cidades().items()}
+
+
+def _semente(texto):
+    return int(hashlib.md5(texto.encode()).hexdigest()[:8], 16)
+
+
+def coordenadas(consulta):
+    """(lat, lon) de 'Cidade, UF, Brasil': real se a cidade é conhecida, senão um ponto fixo no Brasil"""
+    cidade = _normalizar(consulta.split(',')[0])
+    if cidade in COORDS_CONHECIDAS:
+        return COORDS_CONHECIDAS[cidade]
+    h = _semente(cidade)
+    return -30.0 + (h % 2800) / 100, -56.0 + (h // 2800 % 1800) / 100
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(a))
+
+
+def geometria_trecho(a, b):
+    """Polilinha [(lon, lat), ...] entre a e b (lon, lat), com uma sinuosidade determinística"""
+    km = float(_haversine_km(a[1], a[0], b[1], b[0]))
+    n = int(min(MAX_PONTOS_TRECHO, max(2, km / PASSO_GEOMETRIA_KM)))
+    t = np.linspace(0, 1, n)
+    fase = _semente(f"{a}{b}") % 628 / 100
+    desvio = 0.02 * np.sin(t * np.pi * 3 + fase) * np.sin(t * np.pi)
+    lon = a[0] + (b[0] - a[0]) * t - (b[1] - a[1]) * desvio
+    lat = a[1] + (b[1] - a[1]) * t + (b[0] - a[0]) * desvio
+    return np.column_stack([lon, lat]).round(6).tolist()
+
+
+def rota(coordinates):
+    """FeatureCollection no formato de /v2/directions/{perfil}/geojson"""
+    geometria, way_points, segmentos = [], [0], []
+    for a, b in zip(coordinates, coordinates[1:]):
+        pontos = geometria_trecho(a, b)
+        geometria.extend(pontos if not geometria else pontos[1:])
+        way_points.append(len(geometria) - 1)
+        metros = float(_haversine_km(a[1], a[0], b[1], b[0])) * FATOR_ESTRADA * 1000
+        segmentos.append({'distance': round(metros, 1), 'duration': round(metros / 1000 / VELOCIDADE_KMH * 3600, 1)})
+    
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': geometria},
+            'properties': {
+                'segments': segmentos,
+                'way_points': way_points,
+                'summary': {
+                    'distance': sum(s['distance'] for s in segmentos),
+                    'duration': sum(s['duration'] for s in segmentos),
+                },
+            },
+        }],
+    }
+
+
+def matriz(corpo):
+    """Resposta de /v2/matrix/{perfil} (distâncias na unidade pedida, durações em s)"""
+    locais = np.asarray(corpo['locations'], dtype=float)
+    origens = locais[corpo.get('sources', list(range(len(locais))))]
+    destinos = locais[corpo.get('destinations', list(range(len(locais))))]
+    
+    km = _haversine_km(origens[:, None, 1], origens[:, None, 0], destinos[None, :, 1], destinos[None, :, 0]) * FATOR_ESTRADA
+    distancias = km * (1000 if corpo.get('units', 'm') == 'm' else 1)
+    
+    resposta = {}
+    metricas = corpo.get('metrics', ['duration'])
+    if 'distance' in metricas:
+        resposta['distances'] = distancias.round(2).tolist()
+    if 'duration' in metricas:
+        resposta['durations'] = (km / VELOCIDADE_KMH * 3600).round(1).tolist()
+    return resposta
+
+
+class ServidorStub:
+    """Nominatim (/search) e ORS (/v2/directions, /v2/matrix) num único servidor local
+    
+    `latencia` em segundos (±50% de variação), `taxa_erro` e `taxa_429` entre 0 e 1,
+    `limite_minuto` responde 429 acima de N requisições por minuto. `contadores`
+    (também em GET /stats) registra requisições, erros e 429 por serviço.
+    """
+    
+    def __init__(self, porta=0, latencia=0.0, taxa_erro=0.0, taxa_429=0.0, limite_minuto=None, seed=0):
+        self.latencia = latencia
+        self.taxa_erro = taxa_erro
+        self.taxa_429 = taxa_429
+        self.limite_minuto = limite_minuto
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._janela = deque()
+        self.contadores = {}
+        
+        servidor = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+            
+            def _responder(self, status, corpo):
+                dados = json.dumps(corpo).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+            
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/stats':
+                    return self._responder(200, servidor.resumo())
+                if url.path != '/search':
+                    return self._responder(404, {'error': 'not found'})
+                
+                falha = servidor._preparar('nominatim')
+                if falha:
+                    return self._responder(*falha)
+                
+                consulta = parse_qs(url.query).get('q', [''])[0]
+                lat, lon = coordenadas(consulta)
+                self._responder(200, [{
+                    'place_id': _semente(consulta),
+                    'lat': f"{lat:.7f}",
+                    'lon': f"{lon:.7f}",
+                    'display_name': consulta,
+                    'boundingbox': [f"{lat - 0.1:.7f}", f"{lat + 0.1:.7f}", f"{lon - 0.1:.7f}", f"{lon + 0.1:.7f}"],
+                }])
+            
+            def do_POST(self):
+                url = urlparse(self.path)
+                corpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                
+                if url.path.startswith('/v2/directions/'):
+                    servico, gerar = 'ors_directions', lambda: rota(corpo['coordinates'])
+                elif url.path.startswith('/v2/matrix/'):
+                    servico, gerar = 'ors_matrix', lambda: matriz(corpo)
+                else:
+                    return self._responder(404, {'error': 'not found'})
+                
+                falha = servidor._preparar(servico)
+                if falha:
+                    return self._responder(*falha)
+                self._responder(200, gerar())
+        
+        self._http = ThreadingHTTPServer(('127.0.0.1', porta), Handler)
+        self._http.daemon_threads = True
+        self.porta = self._http.server_address[1]
+        self._thread = threading.Thread(target=self._http.serve_forever, daemon=True)
+    
+    @property
+    def url(self):
+        return f"http://localhost:{self.porta}"
+    
+    def env(self):
+        """Variáveis de ambiente que apontam o dashboard para este servidor"""
+        return {
+            'NOMINATIM_DOMINIO': f"localhost:{self.porta}",
+            'NOMINATIM_ESQUEMA': 'http',
+            'NOMINATIM_INTERVALO': '0',
+            'ORS_BASE_URL': self.url,
+            'ORS_API_KEY': 'stub',
+        }
+    
+    def _preparar(self, servico):
+        """Conta a requisição, aplica a latência e decide se ela falha: (status, corpo) ou None"""
+        with self._lock:
+            contador = self.contadores.setdefault(servico, {'requisicoes': 0, 'erros': 0, 'http_429': 0})
+            contador['requisicoes'] += 1
+            
+            agora = time.monotonic()
+            while self._janela and agora - self._janela[0] >= 60:
+                self._janela.popleft()
+            self._janela.append(agora)
+            
+            sorteio = self._rng.random()
+            atraso = self.latencia * self._rng.uniform(0.5, 1.5)
+            
+            if (self.limite_minuto and len(self._janela) > self.limite_minuto) or sorteio < self.taxa_429:
+                contador['http_429'] += 1
+                falha = (429, {'error': {'code': 429, 'message': 'Rate limit exceeded'}})
+            elif sorteio < self.taxa_429 + self.taxa_erro:
+                contador['erros'] += 1
+                falha = (500, {'error': {'code': 500, 'message': 'Internal server error'}})
+            else:
+                falha = None
+        
+        if atraso:
+            time.sleep(atraso)
+        return falha
+    
+    def resumo(self):
+        with self._lock:
+            return {servico: dict(c) for servico, c in self.contadores.items()}
+    
+    def zerar(self):
+        with self._lock:
+            self.contadores.clear()
+    
+    def iniciar(self):
+        self._thread.start()
+        return self
+    
+    def parar(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--porta', type=int, default=8090)
+    parser.add_argument('--latencia', type=float, default=0.0, help="Segundos por requisição (±50%%)")
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help="Fração de respostas HTTP 500")
+    parser.add_argument('--taxa-429', type=float, default=0.0, help="Fração de respostas HTTP 429")
+    parser.add_argument('--limite-minuto', type=int, default=None, help="HTTP 429 acima de N requisições/min")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    servidor = ServidorStub(args.porta, args.latencia, args.taxa_erro, args.taxa_429, args.limite_minuto, args.seed)
+    servidor.iniciar()
+    print(f"🧪 Stub em {servidor.url} (Ctrl+C para sair). Para usar:")
+    for nome, valor in servidor.env().items():
+        print(f"   export {nome}={valor}")
+    
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        servidor.parar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Tempo de importação do utils e de cada página, com orçamento
+
+Uso:
+    python benchmarks/tempo_importacao.py                       # utils e todas as páginas
+    python benchmarks/tempo_importacao.py --orcamento-ms 150    # orçamento por alvo
+    python benchmarks/tempo_importacao.py --repeticoes 5
+
+Cada alvo é importado num interpretador novo, depois de streamlit, pandas e numpy
+(que o servidor já tem carregados); o tempo medido é só o incremento. Das páginas,
+executa apenas os imports do topo do arquivo. Sai com código 1 se algum alvo
+estourar o orçamento ou carregar no import um dos módulos que devem ser tardios.
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import subprocess
+import sys
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.abspath(os.path.join(PASTA, '..'))
+
+# Dependências geoespaciais e de roteamento: só no primeiro uso
+TARDIOS = ('geopy', 'openrouteservice', 'folium', 'streamlit_folium')
+
+FILHO = """
+import sys, time, json
+sys.path.insert(0, {raiz!r})
+import streamlit, pandas, numpy
+from streamlit import logger
+logger.set_log_level('error')
+antes = set(sys.modules)
+inicio = time.perf_counter()
+exec(compile({codigo!r}, {arquivo!r}, 'exec'), {{'__file__': {arquivo!r}, '__name__': '__importacao__'}})
+tempo = time.perf_counter() - inicio
+print(json.dumps({{'ms': tempo * 1000, 'modulos': sorted(set(sys.modules) - antes)}}))
+"""
+
+
+def imports_do_topo(arquivo):
+    """Código só com os `import`/`from ... import` de nível de módulo (e o ajuste do sys.path)"""
+    with open(arquivo, encoding='utf-8') as f:
+        fonte = f.read()
+    trechos = []
+    for no in ast.parse(fonte).body:
+        eh_path = isinstance(no, ast.Expr) and 'sys.path' in (ast.get_source_segment(fonte, no) or '')
+        if isinstance(no, (ast.Import, ast.ImportFrom)) or eh_path:
+            trechos.append(ast.get_source_segment(fonte, no))
+    return '\n'.join(trechos)
+
+
+def alvos():
+    """[(nome, arquivo, código)]: o utils e cada página"""
+    lista = [('utils', os.path.join(RAIZ, 'utils.py'), 'import utils')]
+    for arquivo in sorted(glob.glob(os.path.join(RAIZ, 'pages', '*.py'))):
+        lista.append((os.path.basename(arquivo), arquivo, imports_do_topo(arquivo)))
+    return lista
+
+
+def medir(arquivo, codigo, repeticoes):
+    """Melhor tempo (ms) de `repeticoes` interpretadores novos e os módulos carregados"""
+    melhor = None
+    for _ in range(repeticoes):
+        saida = subprocess.run(
+            [sys.executable, '-c', FILHO.format(raiz=RAIZ, codigo=codigo, arquivo=arquivo)],
+            capture_output=True, text=True, cwd=RAIZ, check=True
+        )
+        resultado = json.loads(saida.stdout.strip().splitlines()[-1])
+        if melhor is None or resultado['ms'] < melhor['ms']:
+            melhor = resultado
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orcamento-ms', type=float, default=250, help="Tempo máximo de importação por alvo (ms)")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    violacoes = []
+    for nome, arquivo, codigo in alvos():
+        resultado = medir(arquivo, codigo, args.repeticoes)
+        tardios = sorted({m.split('.')[0] for m in resultado['modulos']} & set(TARDIOS))
+
+        marca = ''
+        if resultado['ms'] > args.orcamento_ms:
+            violacoes.append(f"{nome}: {resultado['ms']:.0f} ms > {args.orcamento_ms:.0f} ms")
+            marca += '  ⚠️ ORÇAMENTO'
+        if tardios:
+            violacoes.append(f"{nome}: importa {', '.join(tardios)} no carregamento")
+            marca += f"  ⚠️ {', '.join(tardios)}"
+        print(f"   {nome:<34} {resultado['ms']:7.0f} ms  {len(resultado['modulos']):4d} módulos{marca}", flush=True)
+
+    if violacoes:
+        print(f"\n❌ {len(violacoes)} violação(ões):")
+        for violacao in violacoes:
+            print(f"   {violacao}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
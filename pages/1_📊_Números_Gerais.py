@@ -4,7 +4,7 @@ import plotly.express as px
 import os, sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils import load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced, insights_gerais, render_insights
+from utils import load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced, insights_gerais, render_insights, render_grafico, finalizar_rastro, secao_aberta, calcular_por_filtro
 
 st.set_page_config(page_title="Números Gerais", page_icon="📊", layout="wide")
 st.title("📊 Números Gerais da Frota")
@@ -16,6 +16,21 @@ df_viagens, df_abast, df_avarias, df_hosp, df_frota, df_manut = load_all_data(st
 df_filtrado = apply_filters(df_viagens)
 view_mode = ui_view_mode()
 
+def resumos_por_entidade(df):
+    """Tabelas do modo Completo: viagens, KM, custo e KM/L por motorista e por veículo"""
+    resumos = []
+    for coluna, rotulo in (('MOTORISTA', 'Motorista'), ('MODELO_VEICULO', 'Veículo')):
+        resumo = df.groupby(coluna).agg({
+            'ID_VIAGEM': 'count',
+            'KM_TOTAL_PERCORRIDO': 'sum',
+            'GASTO_FINAL_TOTAL': 'sum',
+            'TOTAL_KM/LITRO': 'mean'
+        }).reset_index()
+        resumo.columns = [rotulo, 'Viagens', 'KM', 'Custo', 'KM/L']
+        resumos.append(resumo)
+    return tuple(resumos)
+
+
 if not df_filtrado.empty:
     
     # ========== KPIs ESSENCIAIS ====s======
@@ -53,37 +68,25 @@ if not df_filtrado.empty:
         hole=0.4,
         color_discrete_sequence=['#1f77b4', '#ff7f0e', '#2ca02c']
     )
-    st.plotly_chart(fig, use_container_width=True)
+    render_grafico(fig)
     
     # ========== MODO COMPLETO ==========
     if view_mode == "Completo":
-        with section_advanced():
-            st.subheader("📋 Resumo por Motorista")
-            
-            df_mot = df_filtrado.groupby('MOTORISTA').agg({
-                'ID_VIAGEM': 'count',
-                'KM_TOTAL_PERCORRIDO': 'sum',
-                'GASTO_FINAL_TOTAL': 'sum',
-                'TOTAL_KM/LITRO': 'mean'
-            }).reset_index()
-            df_mot.columns = ['Motorista', 'Viagens', 'KM', 'Custo', 'KM/L']
-            
-            st.dataframe(df_mot, use_container_width=True)
-            
-            st.subheader("🚙 Resumo por Veículo")
-            
-            df_veic = df_filtrado.groupby('MODELO_VEICULO').agg({
-                'ID_VIAGEM': 'count',
-                'KM_TOTAL_PERCORRIDO': 'sum',
-                'GASTO_FINAL_TOTAL': 'sum',
-                'TOTAL_KM/LITRO': 'mean'
-            }).reset_index()
-            df_veic.columns = ['Veículo', 'Viagens', 'KM', 'Custo', 'KM/L']
-            
-            st.dataframe(df_veic, use_container_width=True)
+        secao = section_advanced(key="avancado_numeros")
+        if secao_aberta(secao):
+            with secao:
+                df_mot, df_veic = calcular_por_filtro('numeros/resumos', df_filtrado, resumos_por_entidade)
+                
+                st.subheader("📋 Resumo por Motorista")
+                st.dataframe(df_mot, use_container_width=True)
+                
+                st.subheader("🚙 Resumo por Veículo")
+                st.dataframe(df_veic, use_container_width=True)
     
     # ========== INSIGHTS ==========
     render_insights(insights_gerais(df_filtrado))
 
 else:
     st.warning("⚠️ Nenhum dado com os filtros atuais.")
+
+finalizar_rastro("Números Gerais")
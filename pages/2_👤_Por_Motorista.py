@@ -4,7 +4,7 @@ import plotly.express as px
 import os, sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils import load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced, insights_motorista, render_insights
+from utils import load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced, insights_motorista, render_insights, render_grafico, finalizar_rastro, secao_aberta, secao_independente, tabela_paginada, figura
 
 st.set_page_config(page_title="Por Motorista", page_icon="👤", layout="wide")
 st.title("👤 Análise por Motorista")
@@ -15,8 +15,10 @@ df_viagens, *_ = load_all_data(st.session_state['uploaded_file'])
 df_filtrado = apply_filters(df_viagens)
 view_mode = ui_view_mode()
 
-if not df_filtrado.empty:
-    
+# Trocar a seleção reexecuta só esta seção, sobre o df_filtrado da última execução completa
+@secao_independente("Por Motorista")
+def secao_motorista(df_filtrado, view_mode):
+    """Seletor, KPIs, gráfico, histórico e insights do motorista escolhido"""
     # Seleção de motorista
     motoristas = sorted(df_filtrado['MOTORISTA'].dropna().unique().tolist())
     motorista = st.selectbox("🔍 Selecione o motorista:", motoristas)
@@ -36,8 +38,11 @@ if not df_filtrado.empty:
     # ========== GRÁFICO PRINCIPAL ==========
     st.subheader("⛽ Eficiência por Viagem")
     
-    fig = px.bar(
+    # Uma barra por viagem: históricos longos são reduzidos aos extremos de cada faixa
+    fig = figura(
+        px.bar,
         df_mot,
+        reduzir='minmax',
         x='ID_VIAGEM',
         y='TOTAL_KM/LITRO',
         hover_data=['CIDADE_DE_DESTINO_1', 'KM_TOTAL_PERCORRIDO'],
@@ -45,23 +50,30 @@ if not df_filtrado.empty:
         color='TOTAL_KM/LITRO',
         color_continuous_scale='Greens'
     )
-    st.plotly_chart(fig, use_container_width=True)
+    render_grafico(fig)
     
     # ========== MODO COMPLETO ==========
     if view_mode == "Completo":
-        with section_advanced():
-            st.subheader("📋 Histórico Completo")
-            
-            st.dataframe(
-                df_mot[['ID_VIAGEM', 'DATA_INICIO_VIAGEM', 'DATA_RETORNO', 
-                       'CIDADE_DE_PARTIDA', 'CIDADE_DE_DESTINO_1',
-                       'KM_TOTAL_PERCORRIDO', 'TOTAL_KM/LITRO', 'GASTO_FINAL_TOTAL']]
-                .sort_values('DATA_INICIO_VIAGEM', ascending=False),
-                use_container_width=True
-            )
+        secao = section_advanced(key="avancado_motorista")
+        if secao_aberta(secao):
+            with secao:
+                st.subheader("📋 Histórico Completo")
+                
+                tabela_paginada(
+                    df_mot[['ID_VIAGEM', 'DATA_INICIO_VIAGEM', 'DATA_RETORNO', 
+                           'CIDADE_DE_PARTIDA', 'CIDADE_DE_DESTINO_1',
+                           'KM_TOTAL_PERCORRIDO', 'TOTAL_KM/LITRO', 'GASTO_FINAL_TOTAL']],
+                    key="historico_motorista",
+                    ordem='DATA_INICIO_VIAGEM'
+                )
     
     # ========== INSIGHTS ==========
     render_insights(insights_motorista(df_mot))
 
+
+if not df_filtrado.empty:
+    secao_motorista(df_filtrado, view_mode)
 else:
     st.warning("⚠️ Nenhum dado disponível.")
+
+finalizar_rastro("Por Motorista")
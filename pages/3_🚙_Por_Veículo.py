@@ -5,7 +5,7 @@ import plotly.graph_objects as go
 import os, sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils import load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced, insights_veiculo, render_insights
+from utils import load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced, insights_veiculo, render_insights, render_grafico, finalizar_rastro, secao_aberta, secao_independente, tabela_paginada
 
 st.set_page_config(page_title="Por Veículo", page_icon="🚙", layout="wide")
 st.title("🚙 Análise por Veículo")
@@ -16,8 +16,10 @@ df_viagens, *_ = load_all_data(st.session_state['uploaded_file'])
 df_filtrado = apply_filters(df_viagens)
 view_mode = ui_view_mode()
 
-if not df_filtrado.empty:
-    
+# Trocar a seleção reexecuta só esta seção, sobre o df_filtrado da última execução completa
+@secao_independente("Por Veículo")
+def secao_veiculo(df_filtrado, view_mode):
+    """Seletor, KPIs, aproveitamento, histórico e insights do veículo escolhido"""
     veiculos = sorted(df_filtrado['MODELO_VEICULO'].dropna().unique().tolist())
     veiculo = st.selectbox("🔍 Selecione o veículo:", veiculos)
     
@@ -61,21 +63,28 @@ if not df_filtrado.empty:
             ]
         }
     ))
-    st.plotly_chart(fig_gauge, use_container_width=True)
+    render_grafico(fig_gauge)
     
     # ========== MODO COMPLETO ==========
     if view_mode == "Completo":
-        with section_advanced():
-            st.subheader("📋 Histórico de Viagens")
-            st.dataframe(
-                df_veic[['ID_VIAGEM', 'DATA_INICIO_VIAGEM', 'MOTORISTA', 
-                        'KM_TOTAL_PERCORRIDO', 'TOTAL_KM/LITRO', 'GASTO_FINAL_TOTAL']]
-                .sort_values('DATA_INICIO_VIAGEM', ascending=False),
-                use_container_width=True
-            )
+        secao = section_advanced(key="avancado_veiculo")
+        if secao_aberta(secao):
+            with secao:
+                st.subheader("📋 Histórico de Viagens")
+                tabela_paginada(
+                    df_veic[['ID_VIAGEM', 'DATA_INICIO_VIAGEM', 'MOTORISTA', 
+                            'KM_TOTAL_PERCORRIDO', 'TOTAL_KM/LITRO', 'GASTO_FINAL_TOTAL']],
+                    key="historico_veiculo",
+                    ordem='DATA_INICIO_VIAGEM'
+                )
     
     # ========== INSIGHTS ==========
     render_insights(insights_veiculo(df_veic))
 
+
+if not df_filtrado.empty:
+    secao_veiculo(df_filtrado, view_mode)
 else:
     st.warning("⚠️ Nenhum dado disponível.")
+
+finalizar_rastro("Por Veículo")
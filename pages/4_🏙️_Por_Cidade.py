@@ -4,7 +4,9 @@ import plotly.express as px
 import os, sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils import load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced, insights_cidade, render_insights
+from utils import (load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced,
+                   insights_cidade, render_insights, agregar_por_cidade, matriz_od, corredores, pivot_od, METRICAS_OD,
+                   render_grafico, finalizar_rastro, secao_aberta, calcular_por_filtro)
 
 st.set_page_config(page_title="Por Cidade", page_icon="🏙️", layout="wide")
 st.title("🏙️ Análise por Cidade")
@@ -18,35 +20,7 @@ view_mode = ui_view_mode()
 if not df_filtrado.empty:
     
     # Preparar dados de cidades
-    cidades_data = []
-    for _, viagem in df_filtrado.iterrows():
-        if pd.notna(viagem['CIDADE_DE_PARTIDA']):
-            cidades_data.append({
-                'cidade': viagem['CIDADE_DE_PARTIDA'],
-                'km': viagem['KM_TOTAL_PERCORRIDO'],
-                'combustivel': viagem['CUSTO_TOTAL_COMBUSTIVEL'],
-                'dias': viagem['DIAS_TOTAL_VIAGEM']
-            })
-        
-        for i in range(1, 5):
-            col = f'CIDADE_DE_DESTINO_{i}'
-            if col in viagem.index and pd.notna(viagem[col]):
-                cidades_data.append({
-                    'cidade': viagem[col],
-                    'km': viagem['KM_TOTAL_PERCORRIDO'],
-                    'combustivel': viagem['CUSTO_TOTAL_COMBUSTIVEL'],
-                    'dias': viagem['DIAS_TOTAL_VIAGEM']
-                })
-    
-    df_cidades = pd.DataFrame(cidades_data)
-    df_cidades_agg = df_cidades.groupby('cidade').agg({
-        'km': 'sum',
-        'combustivel': 'sum',
-        'dias': 'sum'
-    }).reset_index()
-    df_cidades_agg.columns = ['Cidade', 'KM Total', 'Custo Combustível', 'Dias Total']
-    df_cidades_agg['Visitas'] = df_cidades.groupby('cidade').size().values
-    df_cidades_agg = df_cidades_agg.sort_values('KM Total', ascending=False)
+    df_cidades_agg = agregar_por_cidade(df_filtrado)
     
     # ========== KPIs ==========
     render_kpis([
@@ -72,16 +46,66 @@ if not df_filtrado.empty:
     )
     fig.update_traces(texttemplate='%{text:,.0f} km', textposition='outside')
     fig.update_xaxes(tickangle=-45)
-    st.plotly_chart(fig, use_container_width=True)
+    render_grafico(fig)
+    
+    # ========== FLUXOS ENTRE CIDADES ==========
+    st.subheader("🔀 Principais Corredores")
+    
+    metrica_od = st.selectbox(
+        "Métrica dos fluxos",
+        list(METRICAS_OD),
+        format_func=METRICAS_OD.get,
+        key="metrica_od"
+    )
+    
+    # A métrica só escolhe a coluna: a matriz fica memoizada por filtro
+    od = calcular_por_filtro('cidades/od', df_filtrado, matriz_od)
+    df_corredores = corredores(od, metrica_od, n=10)
+    
+    if df_corredores.empty:
+        st.info("ℹ️ Nenhum trecho entre cidades diferentes no período.")
+    else:
+        df_corredores['Corredor'] = df_corredores['CIDADE_A'] + ' ↔ ' + df_corredores['CIDADE_B']
+        fig = px.bar(
+            df_corredores.melt(id_vars='Corredor', value_vars=['IDA', 'VOLTA'], var_name='Sentido', value_name='Valor'),
+            x='Valor',
+            y='Corredor',
+            color='Sentido',
+            orientation='h',
+            title=f"Top 10 corredores por {METRICAS_OD[metrica_od]} (ida = A → B)"
+        )
+        fig.update_yaxes(categoryorder='total ascending')
+        render_grafico(fig)
     
     # ========== MODO COMPLETO ==========
     if view_mode == "Completo":
-        with section_advanced():
-            st.subheader("📋 Todas as Cidades")
-            st.dataframe(df_cidades_agg, use_container_width=True)
+        secao = section_advanced(key="avancado_cidades")
+        if secao_aberta(secao):
+            with secao:
+                st.subheader("📋 Todas as Cidades")
+                st.dataframe(df_cidades_agg, use_container_width=True)
+                
+                if not df_corredores.empty:
+                    st.subheader("↔️ Assimetria dos Corredores")
+                    st.dataframe(
+                        df_corredores[['CIDADE_A', 'CIDADE_B', 'IDA', 'VOLTA', 'TOTAL', 'ASSIMETRIA']],
+                        use_container_width=True
+                    )
+                    
+                    st.subheader("🗺️ Matriz Origem–Destino")
+                    matriz = pivot_od(od, metrica_od, n=15)
+                    fig = px.imshow(
+                        matriz,
+                        labels=dict(x="Destino", y="Origem", color=METRICAS_OD[metrica_od]),
+                        color_continuous_scale='Blues',
+                        aspect='auto'
+                    )
+                    render_grafico(fig)
     
     # ========== INSIGHTS ==========
     render_insights(insights_cidade(df_cidades_agg))
 
 else:
     st.warning("⚠️ Nenhum dado disponível.")
+
+finalizar_rastro("Por Cidade")
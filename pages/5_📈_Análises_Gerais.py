@@ -4,7 +4,7 @@ import plotly.express as px
 import os, sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils import load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced, insights_gerais, render_insights
+from utils import load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced, insights_gerais, render_insights, render_grafico, finalizar_rastro, secao_aberta, calcular_por_filtro, figura
 
 st.set_page_config(page_title="Análises Gerais", page_icon="📈", layout="wide")
 st.title("📈 Análises Gerais")
@@ -15,6 +15,15 @@ df_viagens, *_ = load_all_data(st.session_state['uploaded_file'])
 df_filtrado = apply_filters(df_viagens)
 view_mode = ui_view_mode()
 
+def evolucao_mensal(df):
+    """KM e gasto somados por mês de início da viagem"""
+    df_tempo = df.groupby(
+        df['DATA_INICIO_VIAGEM'].dt.to_period('M')
+    ).agg({'KM_TOTAL_PERCORRIDO': 'sum', 'GASTO_FINAL_TOTAL': 'sum'}).reset_index()
+    df_tempo['DATA_INICIO_VIAGEM'] = df_tempo['DATA_INICIO_VIAGEM'].astype(str)
+    return df_tempo
+
+
 if not df_filtrado.empty:
     
     # ========== COMPARAÇÃO MOTORISTAS ==========
@@ -33,12 +42,12 @@ if not df_filtrado.empty:
     with col1:
         fig1 = px.bar(df_mot, x='Motorista', y='KM', 
                      title="KM por Motorista", color='KM')
-        st.plotly_chart(fig1, use_container_width=True)
+        render_grafico(fig1)
     
     with col2:
         fig2 = px.bar(df_mot, x='Motorista', y='KM/L', 
                      title="Eficiência por Motorista", color='KM/L')
-        st.plotly_chart(fig2, use_container_width=True)
+        render_grafico(fig2)
     
     # ========== COMPARAÇÃO VEÍCULOS ==========
     st.subheader("🚙 Comparação entre Veículos")
@@ -52,23 +61,24 @@ if not df_filtrado.empty:
     
     fig3 = px.pie(df_veic, values='KM', names='Veículo', 
                   title="Distribuição de KM por Veículo")
-    st.plotly_chart(fig3, use_container_width=True)
+    render_grafico(fig3)
     
     # ========== MODO COMPLETO ==========
     if view_mode == "Completo":
-        with section_advanced():
-            st.subheader("📊 Evolução Temporal")
-            df_tempo = df_filtrado.groupby(
-                df_filtrado['DATA_INICIO_VIAGEM'].dt.to_period('M')
-            ).agg({'KM_TOTAL_PERCORRIDO': 'sum', 'GASTO_FINAL_TOTAL': 'sum'}).reset_index()
-            df_tempo['DATA_INICIO_VIAGEM'] = df_tempo['DATA_INICIO_VIAGEM'].astype(str)
-            
-            fig4 = px.line(df_tempo, x='DATA_INICIO_VIAGEM', y='KM_TOTAL_PERCORRIDO',
-                          markers=True, title="KM ao longo do tempo")
-            st.plotly_chart(fig4, use_container_width=True)
+        secao = section_advanced(key="avancado_analises")
+        if secao_aberta(secao):
+            with secao:
+                st.subheader("📊 Evolução Temporal")
+                df_tempo = calcular_por_filtro('analises/evolucao_mensal', df_filtrado, evolucao_mensal)
+                
+                fig4 = figura(px.line, df_tempo, reduzir='lttb', x='DATA_INICIO_VIAGEM', y='KM_TOTAL_PERCORRIDO',
+                              markers=True, title="KM ao longo do tempo")
+                render_grafico(fig4)
     
     # ========== INSIGHTS ==========
     render_insights(insights_gerais(df_filtrado))
 
 else:
     st.warning("⚠️ Nenhum dado disponível.")
+
+finalizar_rastro("Análises Gerais")
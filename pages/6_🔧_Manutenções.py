@@ -4,7 +4,7 @@ import plotly.express as px
 import os, sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils import load_all_data, check_data_loaded, ui_view_mode, render_kpis, section_advanced, render_insights
+from utils import load_all_data, check_data_loaded, ui_view_mode, render_kpis, section_advanced, render_insights, render_grafico, finalizar_rastro, secao_aberta, tabela_paginada
 
 st.set_page_config(page_title="Manutenções", page_icon="🔧", layout="wide")
 st.title("🔧 Despesas com Manutenções")
@@ -89,17 +89,19 @@ if df_manut is not None and not df_manut.empty:
         )
         fig.update_traces(texttemplate='R$ %{text:,.0f}', textposition='outside')
         fig.update_xaxes(tickangle=-45)
-        st.plotly_chart(fig, use_container_width=True)
+        render_grafico(fig)
         
         # ========== MODO COMPLETO ==========
         if view_mode == "Completo":
-            with section_advanced():
-                st.subheader("📋 Histórico Completo de Manutenções")
-                st.dataframe(
-                    df_manut_filt[['DATA_REVISAO', 'VEICULO - PLACA', 'ITENS', 'VALOR', 'RESPONSAVEL_DESPESA']]
-                    .sort_values('DATA_REVISAO', ascending=False),
-                    use_container_width=True
-                )
+            secao = section_advanced(key="avancado_manutencoes")
+            if secao_aberta(secao):
+                with secao:
+                    st.subheader("📋 Histórico Completo de Manutenções")
+                    tabela_paginada(
+                        df_manut_filt[['DATA_REVISAO', 'VEICULO - PLACA', 'ITENS', 'VALOR', 'RESPONSAVEL_DESPESA']],
+                        key="historico_manutencoes",
+                        ordem='DATA_REVISAO'
+                    )
         
         # ========== INSIGHTS ==========
         st.markdown("---")
@@ -144,3 +146,5 @@ _{len(df_manut_filt)} manutenções realizadas_
 
 else:
     st.info("ℹ️ Nenhum dado de manutenção disponível.")
+
+finalizar_rastro("Manutenções")
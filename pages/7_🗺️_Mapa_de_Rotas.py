@@ -1,17 +1,20 @@
 import streamlit as st
 import pandas as pd
-import folium
-from streamlit_folium import st_folium
-import plotly.express as px
 import os, sys
-import numpy as np
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils import (load_all_data, check_data_loaded, apply_filters, ui_view_mode, 
-                   render_kpis, section_advanced, get_viagens_com_coords, 
-                   get_rota_real)
+from utils import (load_all_data, check_data_loaded, apply_filters, ui_view_mode,
+                   render_kpis, section_advanced, get_viagens_com_coords, montar_paradas,
+                   get_distancias_viagens, calcular_distancias_pendentes, get_roteador, calcular_trechos_pendentes,
+                   trechos_da_viagem, sequencias_de_paradas, construir_mapa, get_cache_mapas,
+                   get_cache_rotas, get_cache_distancias,
+                   hash_viagens, hash_conteudo, CotaEsgotada, ORS_API_KEY, ZOOM_MARCADORES, LIMITES_DIFERENCA_KM,
+                   render_grafico, finalizar_rastro, span, guardar_na_sessao, obter_da_sessao, secao_aberta,
+                   figura)
 
 st.set_page_config(page_title="Mapa de Rotas", page_icon="🗺️", layout="wide")
+
+ZOOM_INICIAL = 5
 st.title("🗺️ Mapa de Rotas da Frota")
 
 check_data_loaded()
@@ -24,7 +27,46 @@ api_key = st.sidebar.text_input(
     "OpenRouteService API Key",
     type="password",
     help="Cole sua API Key para ver rotas reais nas rodovias"
+) or ORS_API_KEY
+
+# Guardada para o pré-carregamento de rotas em novos uploads
+if api_key:
+    st.session_state['ors_api_key'] = api_key
+
+modo_desenho = st.sidebar.radio(
+    "🧩 Desenho das rotas",
+    ["Trechos individuais", "Arestas agregadas"],
+    help="Arestas agregadas: trechos repetidos viram uma linha só, com espessura pela métrica"
 )
+agregar = modo_desenho == "Arestas agregadas"
+metrica_aresta = {"Viagens": 'VIAGENS', "KM": 'KM', "Custo": 'CUSTO'}[
+    st.sidebar.selectbox("📐 Peso das arestas", ["Viagens", "KM", "Custo"], disabled=not agregar)
+]
+
+linha_do_tempo = {"Desligada": None, "Diária": 'D', "Semanal": 'W'}[
+    st.sidebar.selectbox(
+        "⏯️ Linha do tempo",
+        ["Desligada", "Diária", "Semanal"],
+        help="Anima as viagens por dia/semana entre DATA_INICIO_VIAGEM e DATA_RETORNO"
+    )
+]
+
+camadas = {
+    "Marcadores": 'marcadores',
+    "Marcadores agrupados": 'agrupados',
+    "Densidade (hexágonos)": 'hexagonos',
+    "Mapa de calor": 'calor'
+}
+camada_paradas = camadas[st.sidebar.selectbox(
+    "📍 Camada de paradas",
+    list(camadas),
+    index=1,
+    help=f"Exceto em 'Marcadores', as cidades individuais aparecem a partir do zoom {ZOOM_MARCADORES}"
+)]
+peso_paradas = {"Visitas": 'VISITAS', "KM": 'KM', "Custo": 'CUSTO'}[
+    st.sidebar.selectbox("⚖️ Peso da densidade", ["Visitas", "KM", "Custo"],
+                         disabled=camada_paradas in ('marcadores', 'agrupados'))
+]
 
 usar_rotas_reais = st.sidebar.checkbox(
     "Usar rotas reais",
@@ -39,10 +81,7 @@ if usar_rotas_reais and api_key:
     
     # Botão para limpar cache de rotas
     if st.sidebar.button("🔄 Recalcular Rotas"):
-        if 'rotas_trechos' in st.session_state:
-            del st.session_state['rotas_trechos']
-        if 'mapa_processado' in st.session_state:
-            st.session_state['mapa_processado'] = False
+        st.session_state['recalcular_rotas'] = True
         st.rerun()
 else:
     st.sidebar.info("ℹ️ Usando linhas retas")
@@ -59,27 +98,115 @@ st.info("""
 Este mapa mostra **todas as rotas e paradas** da frota. Com API Key, você vê as rotas reais pelas rodovias!
 """)
 
-if not df_filtrado.empty:
+def detalhe_viagem(id_viagem):
+    """Dados do popup de uma viagem, montados só quando ela é clicada (memo por filtro e rotas)"""
+    chave_memo = ('detalhes', filtro_key, bool(api_key), estado_trechos)
+    memo = obter_da_sessao(chave_memo) or {}
+    if id_viagem in memo:
+        return memo[id_viagem]
     
-    # Criar chave única para o estado atual
-    filtro_key = f"{len(df_filtrado)}_{df_filtrado['ID_VIAGEM'].min()}_{df_filtrado['ID_VIAGEM'].max()}_{usar_rotas_reais}"
+    linhas = df_mapa[df_mapa['ID_VIAGEM'] == id_viagem]
+    if linhas.empty:
+        return None
+    viagem = linhas.iloc[0]
     
-    if 'mapa_filtro_key' not in st.session_state or st.session_state['mapa_filtro_key'] != filtro_key:
-        st.session_state['mapa_filtro_key'] = filtro_key
-        st.session_state['mapa_processado'] = False
-        if 'rotas_trechos' in st.session_state:
-            del st.session_state['rotas_trechos']
+    paradas = montar_paradas(viagem, coords_cache)
+    pontos = [(p['lat'], p['lon']) for p in paradas]
     
-    # Geocodificar viagens
-    if not st.session_state.get('mapa_processado', False):
-        with st.spinner("📍 Carregando coordenadas das cidades..."):
-            df_com_coords, coords_cache = get_viagens_com_coords(df_filtrado)
-            st.session_state['df_com_coords'] = df_com_coords
-            st.session_state['coords_cache'] = coords_cache
-            st.session_state['mapa_processado'] = True
+    if usar_rotas_reais and api_key:
+        trechos = trechos_da_viagem(pontos)
+        tipo_rota = "🛣️ Rota real pelas rodovias"
     else:
-        df_com_coords = st.session_state['df_com_coords']
-        coords_cache = st.session_state['coords_cache']
+        trechos = [{'distancia': None, 'tempo': None} for _ in pontos[1:]]
+        tipo_rota = "📏 Linha reta"
+    
+    calculados = [t for t in trechos if t['distancia']]
+    if calculados:
+        km_real = sum(t['distancia'] for t in calculados)
+        tempo_real = sum(t['tempo'] or 0 for t in calculados)
+    elif id_viagem in km_matriz:
+        km_real, tempo_real = km_matriz[id_viagem]
+    else:
+        km_real, tempo_real = None, None
+    
+    detalhe = {
+        'id': id_viagem,
+        'cor': cores_motoristas.get(viagem['MOTORISTA'], '#1f77b4'),
+        'tipo_rota': tipo_rota,
+        'motorista': str(viagem['MOTORISTA']),
+        'veiculo': str(viagem['MODELO_VEICULO']),
+        'paradas': [p['nome'] for p in paradas],
+        'trechos': [(t['distancia'], t['tempo']) for t in trechos],
+        'km_registrado': float(viagem['KM_TOTAL_PERCORRIDO']),
+        'km_real': km_real,
+        'tempo_real': tempo_real,
+        'custo': float(viagem['GASTO_FINAL_TOTAL']),
+        'km_l': float(viagem['TOTAL_KM/LITRO']),
+    }
+    # Novo dict a cada clique: o armazém mede o tamanho de novo ao guardar
+    guardar_na_sessao(chave_memo, {**memo, id_viagem: detalhe})
+    return detalhe
+
+
+def render_detalhe_trecho(detalhe, i):
+    """Painel com o que antes ia embutido no popup de cada trecho"""
+    paradas = detalhe['paradas']
+    if not 0 <= i < len(detalhe['trechos']):
+        return
+    dist_trecho, tempo_trecho = detalhe['trechos'][i]
+    
+    st.markdown(f"#### <span style='color: {detalhe['cor']};'>Viagem #{detalhe['id']}</span>", unsafe_allow_html=True)
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        texto = f"""
+**🛣️ Tipo:** {detalhe['tipo_rota']}  
+**👤 Motorista:** {detalhe['motorista']}  
+**🚗 Veículo:** {detalhe['veiculo']}  
+**📍 Rota Completa ({len(paradas)} paradas):**  
+_{' → '.join(paradas)}_  
+**🎯 Trecho Atual ({i + 1}/{len(paradas) - 1}):** {paradas[i]} → {paradas[i + 1]}
+        """
+        if dist_trecho:
+            texto += f"""  
+**📏 Distância do trecho:** {dist_trecho:.0f} km  
+**⏱️ Tempo do trecho:** {tempo_trecho:.1f}h
+            """
+        st.markdown(texto)
+    
+    with col2:
+        texto = f"""
+**📊 Total da Viagem Completa:**  
+**KM Registrado:** {detalhe['km_registrado']:,.0f} km  
+"""
+        if detalhe['km_real'] is not None:
+            diferenca = detalhe['km_real'] - detalhe['km_registrado']
+            cor_diff = ("green" if abs(diferenca) < LIMITES_DIFERENCA_KM[0]
+                        else "orange" if abs(diferenca) < LIMITES_DIFERENCA_KM[1] else "red")
+            texto += f"""**🛣️ KM Real (calculado):** {detalhe['km_real']:,.0f} km  
+**📊 Diferença:** :{cor_diff}[{diferenca:+.0f} km]  
+**⏱️ Tempo Total Estimado:** {detalhe['tempo_real']:.1f}h  
+"""
+        texto += f"""**💰 Custo Total:** R$ {detalhe['custo']:,.2f}  
+**⛽ KM/L:** {detalhe['km_l']:.2f}
+"""
+        st.markdown(texto)
+
+
+if not df_filtrado.empty:
+    
+    # Chave do estado atual: hash do conjunto de viagens filtradas + modo de rota
+    filtro_key = f"{hash_viagens(df_filtrado)}_{usar_rotas_reais}"
+    
+    # Geocodificar viagens (a sessão guarda só a chave; o resultado fica no armazém compartilhado)
+    geocodificado = None
+    if st.session_state.get('mapa_filtro_key') == filtro_key and not st.session_state.get('recalcular_rotas'):
+        geocodificado = obter_da_sessao(('coordenadas', filtro_key))
+    if geocodificado is None:
+        with st.spinner("📍 Carregando coordenadas das cidades..."):
+            geocodificado = guardar_na_sessao(('coordenadas', filtro_key), get_viagens_com_coords(df_filtrado))
+        st.session_state['mapa_filtro_key'] = filtro_key
+    df_com_coords, coords_cache = geocodificado
     
     df_mapa = df_com_coords.dropna(subset=['lat_origem', 'lon_origem', 'lat_destino', 'lon_destino'])
     
@@ -104,247 +231,148 @@ if not df_filtrado.empty:
         # ========== MAPA PRINCIPAL ==========
         st.subheader("🗺️ Mapa Interativo com Todas as Rotas")
         
-        center_lat = float(df_mapa[['lat_origem', 'lat_destino']].mean().mean())
-        center_lon = float(df_mapa[['lon_origem', 'lon_destino']].mean().mean())
-        
-        m = folium.Map(
-            location=[center_lat, center_lon],
-            zoom_start=5,
-            tiles='OpenStreetMap'
-        )
+        rota_real = usar_rotas_reais and bool(api_key)
+        recalcular = st.session_state.pop('recalcular_rotas', False)
         
-        # Contador de visitas por cidade (considerando TODAS as paradas)
-        visitas_por_cidade = {}
-        for cidade in coords_cache.keys():
-            count = 0
-            for _, viagem in df_mapa.iterrows():
-                # Contar origem
-                if viagem['CIDADE_DE_PARTIDA'] == cidade:
-                    count += 1
-                # Contar todos os destinos
-                for i in range(1, 5):
-                    col = f'CIDADE_DE_DESTINO_{i}'
-                    if col in viagem.index and viagem[col] == cidade:
-                        count += 1
-            visitas_por_cidade[cidade] = count
+        # Paradas de cada viagem: só mudam com o filtro ou as coordenadas (memo no armazém)
+        hash_coords = hash_conteudo(sorted(coords_cache.items()))
+        sequencias = {}
+        if api_key:
+            sequencias = obter_da_sessao(('sequencias', filtro_key, hash_coords))
+            if sequencias is None:
+                sequencias = guardar_na_sessao(
+                    ('sequencias', filtro_key, hash_coords), sequencias_de_paradas(df_mapa, coords_cache)
+                )
         
-        # Marcadores das cidades
-        for cidade, (lat, lon) in coords_cache.items():
-            if lat and lon:
-                visitas = visitas_por_cidade.get(cidade, 0)
-                
-                if visitas > 0:  # Só mostrar cidades com visitas
-                    radius = float(5 + (visitas * 2))
-                    
-                    folium.CircleMarker(
-                        location=[float(lat), float(lon)],
-                        radius=radius,
-                        popup=folium.Popup(f"<b>{cidade}</b><br>{visitas} visitas", max_width=200),
-                        tooltip=str(cidade),
-                        color='#1f77b4',
-                        fill=True,
-                        fillColor='#1f77b4',
-                        fillOpacity=0.6
-                    ).add_to(m)
+        # Mesmo conjunto de viagens + mesmas opções = mapa pronto do cache. Com API Key, a chave
+        # inclui a versão do cache de trechos (rotas ou matriz): um mapa incompleto (cota, falha)
+        # é refeito assim que novos trechos chegam ao cache (ex.: pelo pré-aquecimento)
+        cache_trechos = get_cache_rotas() if rota_real else get_cache_distancias()
         
-        # Cores para motoristas
-        motoristas_unicos = df_mapa['MOTORISTA'].unique().tolist()
-        cores = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#FFA07A', '#98D8C8', '#F38181', '#AA96DA', '#95E1D3']
-        cores_motoristas = {
-            motorista: cores[i % len(cores)] 
-            for i, motorista in enumerate(motoristas_unicos)
-        }
+        def chave_do_mapa():
+            return (filtro_key, hash_coords,
+                    agregar, metrica_aresta, camada_paradas, peso_paradas, linha_do_tempo,
+                    bool(api_key), ZOOM_INICIAL, cache_trechos.versao if api_key else None)
         
-        # ========== ADICIONAR ROTAS (COM MÚLTIPLAS PARADAS) ==========
-        total_trechos = 0
+        cache_mapas = get_cache_mapas()
+        chave_mapa = chave_do_mapa()
+        mapa_pronto = None if recalcular else cache_mapas.get(chave_mapa)
         
-        for idx, viagem in df_mapa.iterrows():
-            cor = cores_motoristas.get(viagem['MOTORISTA'], '#1f77b4')
-            
-            id_viagem = int(viagem['ID_VIAGEM'])
-            motorista = str(viagem['MOTORISTA'])
-            veiculo = str(viagem['MODELO_VEICULO'])
-            km_registrado = float(viagem['KM_TOTAL_PERCORRIDO'])
-            custo = float(viagem['GASTO_FINAL_TOTAL'])
-            km_l = float(viagem['TOTAL_KM/LITRO'])
-            
-            # ========== CONSTRUIR SEQUÊNCIA DE PARADAS ==========
-            paradas = []
-            
-            # Adicionar origem
-            if pd.notna(viagem['lat_origem']) and pd.notna(viagem['lon_origem']):
-                paradas.append({
-                    'nome': str(viagem['CIDADE_DE_PARTIDA']),
-                    'lat': float(viagem['lat_origem']),
-                    'lon': float(viagem['lon_origem'])
-                })
-            
-            # Adicionar todos os destinos (1, 2, 3, 4)
-            for i in range(1, 5):
-                col_cidade = f'CIDADE_DE_DESTINO_{i}'
-                if col_cidade in viagem.index and pd.notna(viagem[col_cidade]):
-                    cidade = str(viagem[col_cidade])
-                    if cidade in coords_cache:
-                        lat, lon = coords_cache[cidade]
-                        if lat and lon:
-                            paradas.append({
-                                'nome': cidade,
-                                'lat': float(lat),
-                                'lon': float(lon)
-                            })
-            
-            # Se não tem paradas suficientes, pular
-            if len(paradas) < 2:
-                continue
-            
-            # Construir string da rota completa
-            rota_completa = ' → '.join([p['nome'] for p in paradas])
+        if mapa_pronto is None:
+            # Rotas reais: todas as viagens pendentes do filtro em paralelo, antes de desenhar
+            if rota_real:
+                barra = st.progress(0.0, text="🚛 Verificando rotas em cache...")
+                try:
+                    calcular_trechos_pendentes(
+                        sequencias, api_key,
+                        recalcular=recalcular,
+                        progresso=lambda feitas, total: barra.progress(
+                            feitas / total, text=f"🚛 Calculando rotas: {feitas}/{total} viagens"
+                        )
+                    )
+                except CotaEsgotada as e:
+                    st.warning(f"⚠️ {e}. Trechos restantes exibidos em linha reta.")
+                barra.empty()
             
-            # ========== TRAÇAR ROTAS ENTRE CADA PAR DE PARADAS ==========
-            distancia_total_real = 0
-            tempo_total_real = 0
-            trechos_calculados = 0
+            # Sem rotas reais mas com API Key: KM rodoviário de todas as viagens via matriz
+            km_matriz = {}
+            if api_key and not usar_rotas_reais:
+                with st.spinner("📏 Estimando distâncias rodoviárias..."):
+                    try:
+                        calcular_distancias_pendentes(sequencias, api_key)
+                    except CotaEsgotada as e:
+                        st.warning(f"⚠️ {e}. KM rodoviário exibido só para as viagens já calculadas.")
+                    km_matriz = get_distancias_viagens(sequencias)
             
-            for i in range(len(paradas) - 1):
-                origem = paradas[i]
-                destino = paradas[i + 1]
-                total_trechos += 1
-                
-                # Determinar se usar rota real ou linha reta
-                if usar_rotas_reais and api_key:
-                    # Gerar ID único para este trecho
-                    trecho_id = f"{id_viagem}_{i}"
-                    
-                    # Verificar se já calculamos este trecho
-                    if 'rotas_trechos' not in st.session_state:
-                        st.session_state['rotas_trechos'] = {}
-                    
-                    if trecho_id in st.session_state['rotas_trechos']:
-                        trecho_info = st.session_state['rotas_trechos'][trecho_id]
-                        rota_coords = trecho_info['coords']
-                        dist_trecho = trecho_info['distancia']
-                        tempo_trecho = trecho_info['tempo']
-                    else:
-                        # Calcular rota real para este trecho
-                        with st.spinner(f"🚛 Calculando trecho {i+1}/{len(paradas)-1} da viagem #{id_viagem}..."):
-                            rota_coords, dist_trecho, tempo_trecho = get_rota_real(
-                                origem['lat'], origem['lon'],
-                                destino['lat'], destino['lon'],
-                                api_key
-                            )
-                        
-                        # Salvar no cache de trechos
-                        st.session_state['rotas_trechos'][trecho_id] = {
-                            'coords': rota_coords,
-                            'distancia': dist_trecho,
-                            'tempo': tempo_trecho
-                        }
-                    
-                    tipo_rota = "🛣️ Rota real pelas rodovias"
-                    weight = 3
-                    
-                    if dist_trecho:
-                        distancia_total_real += dist_trecho
-                        tempo_total_real += tempo_trecho if tempo_trecho else 0
-                        trechos_calculados += 1
-                else:
-                    # Linha reta
-                    rota_coords = [(origem['lat'], origem['lon']), (destino['lat'], destino['lon'])]
-                    dist_trecho = None
-                    tipo_rota = "📏 Linha reta"
-                    weight = 2
-                
-                # ========== POPUP COM INFORMAÇÕES ==========
-                popup_html = f"""
-                <div style="font-family: Arial; font-size: 12px; min-width: 300px;">
-                    <b style="font-size: 14px; color: {cor};">Viagem #{id_viagem}</b><br>
-                    <hr style="margin: 5px 0;">
-                    <b>🛣️ Tipo:</b> {tipo_rota}<br>
-                    <b>👤 Motorista:</b> {motorista}<br>
-                    <b>🚗 Veículo:</b> {veiculo}<br>
-                    <hr style="margin: 5px 0;">
-                    <b>📍 Rota Completa ({len(paradas)} paradas):</b><br>
-                    <i style="font-size: 11px;">{rota_completa}</i><br>
-                    <hr style="margin: 5px 0;">
-                    <b>🎯 Trecho Atual ({i+1}/{len(paradas)-1}):</b><br>
-                    <span style="color: {cor};">⬤</span> {origem['nome']} → {destino['nome']}<br>
-                """
-                
-                if dist_trecho:
-                    popup_html += f"""
-                    <b>📏 Distância do trecho:</b> {dist_trecho:.0f} km<br>
-                    <b>⏱️ Tempo do trecho:</b> {tempo_trecho:.1f}h<br>
-                    """
-                
-                popup_html += f"""
-                    <hr style="margin: 5px 0;">
-                    <b>📊 Total da Viagem Completa:</b><br>
-                    <b>KM Registrado:</b> {km_registrado:,.0f} km<br>
-                """
-                
-                if trechos_calculados > 0:
-                    diferenca = distancia_total_real - km_registrado
-                    cor_diff = "green" if abs(diferenca) < 50 else "orange" if abs(diferenca) < 100 else "red"
-                    popup_html += f"""
-                    <b>🛣️ KM Real (calculado):</b> {distancia_total_real:,.0f} km<br>
-                    <b>📊 Diferença:</b> <span style="color: {cor_diff};">{diferenca:+.0f} km</span><br>
-                    <b>⏱️ Tempo Total Estimado:</b> {tempo_total_real:.1f}h<br>
-                    """
-                
-                popup_html += f"""
-                    <b>💰 Custo Total:</b> R$ {custo:,.2f}<br>
-                    <b>⛽ KM/L:</b> {km_l:.2f}<br>
-                </div>
-                """
-                
-                # ========== DESENHAR LINHA DA ROTA ==========
-                folium.PolyLine(
-                    locations=rota_coords,
-                    color=cor,
-                    weight=weight,
-                    opacity=0.7,
-                    popup=folium.Popup(popup_html, max_width=400),
-                    tooltip=f"Viagem #{id_viagem}: {origem['nome']} → {destino['nome']}"
-                ).add_to(m)
+            # O mapa é desenhado com os trechos que estão no cache agora
+            chave_mapa = chave_do_mapa()
+            with st.spinner("🗺️ Montando mapa..."):
+                mapa_pronto = construir_mapa(
+                    df_mapa, coords_cache,
+                    agregar=agregar, metrica=metrica_aresta,
+                    rota_real=rota_real, zoom=ZOOM_INICIAL,
+                    camada_paradas=camada_paradas, peso_paradas=peso_paradas,
+                    linha_do_tempo=linha_do_tempo
+                )
+            mapa_pronto['km_matriz'] = km_matriz
+            cache_mapas.set(chave_mapa, mapa_pronto)
         
-        # Legenda
-        legenda_html = f'''
-        <div style="position: fixed; 
-                    bottom: 50px; right: 50px; 
-                    background-color: white; 
-                    border: 2px solid grey; 
-                    border-radius: 5px;
-                    padding: 10px;
-                    font-size: 14px;
-                    z-index: 9999;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.2);">
-            <b>🚗 Motoristas ({len(cores_motoristas)})</b><br>
-        '''
-        for motorista, cor in cores_motoristas.items():
-            legenda_html += f'<span style="color: {cor}; font-size: 18px;">●</span> {motorista}<br>'
+        m = mapa_pronto['mapa']
+        visitas_por_cidade = mapa_pronto['visitas_por_cidade']
+        cores_motoristas = mapa_pronto['cores_motoristas']
+        total_trechos = mapa_pronto['total_trechos']
+        arestas = mapa_pronto['arestas']
+        km_matriz = mapa_pronto['km_matriz']
+        estado_trechos = chave_mapa[-1]
         
-        legenda_html += '<hr style="margin: 5px 0;">'
-        legenda_html += f'<b>📊 Estatísticas:</b><br>'
-        legenda_html += f'Trechos totais: {total_trechos}<br>'
-        
-        if usar_rotas_reais:
-            legenda_html += f'<span style="color: green;">🛣️</span> Rotas reais ativas<br>'
-        else:
-            legenda_html += f'<span style="color: gray;">📏</span> Linhas retas<br>'
-        
-        legenda_html += '</div>'
-        
-        m.get_root().html.add_child(folium.Element(legenda_html))
+        if rota_real:
+            roteador = get_roteador(api_key)
+            if roteador is not None:
+                cota = roteador.cota.resumo()
+                st.sidebar.caption(
+                    f"📶 Cota ORS: {cota['ultimo_minuto']}/{cota['por_minuto']} no último minuto • "
+                    f"{cota['hoje']}/{cota['por_dia']} hoje"
+                )
         
         # Renderizar
-        st_folium(m, width=None, height=600, returned_objects=[], key="mapa_rotas")
+        with span('mapa/render'):
+            from streamlit_folium import st_folium  # ~0,5 s no primeiro uso: só depois dos KPIs na tela
+            saida_mapa = st_folium(m, width=None, height=600, returned_objects=["last_active_drawing"], key="mapa_rotas")
+        clicado = ((saida_mapa or {}).get('last_active_drawing') or {}).get('properties') or {}
+        
+        # ========== DETALHE DO TRECHO CLICADO ==========
+        if 'id_viagem' in clicado:
+            detalhe = detalhe_viagem(int(clicado['id_viagem']))
+            if detalhe:
+                render_detalhe_trecho(detalhe, int(clicado['trecho']) - 1)
         
         st.markdown("---")
         if usar_rotas_reais:
             st.success(f"🛣️ **{total_trechos} trechos** mapeados com rotas reais! Clique nas linhas para detalhes.")
+        elif not agregar:
+            st.caption("💡 Clique em um trecho para ver os detalhes da viagem.")
         else:
             st.caption("💡 **Dica:** Configure a API Key na sidebar para ver rotas reais nas rodovias com múltiplas paradas!")
         
+        # ========== LINHA DO TEMPO ==========
+        frames = mapa_pronto['frames']
+        if frames is not None and len(frames['inicios']):
+            st.subheader("⏯️ Viagens em Andamento por Período")
+            st.caption("Use o controle de tempo no canto do mapa para reproduzir a movimentação da frota.")
+            import plotly.express as px
+            fig_tempo = figura(
+                px.area,
+                pd.DataFrame({'Período': frames['inicios'], 'Viagens ativas': frames['ativas']}),
+                reduzir='lttb',
+                x='Período',
+                y='Viagens ativas'
+            )
+            render_grafico(fig_tempo)
+        
+        # ========== DETALHE DAS ARESTAS ==========
+        if agregar and arestas is not None and not arestas.empty:
+            st.subheader("🔎 Viagens por Aresta")
+            opcoes = arestas.index.tolist()
+            # Clique numa aresta do mapa já seleciona ela aqui
+            clicada = arestas.index[
+                (arestas['ORIGEM'].astype(str) == clicado.get('origem')) &
+                (arestas['DESTINO'].astype(str) == clicado.get('destino'))
+            ]
+            escolhida = st.selectbox(
+                "Selecione a aresta:",
+                opcoes,
+                index=opcoes.index(clicada[0]) if len(clicada) else 0,
+                format_func=lambda i: f"{arestas.at[i, 'ORIGEM']} → {arestas.at[i, 'DESTINO']} "
+                                      f"({arestas.at[i, 'VIAGENS']} viagens)"
+            )
+            st.dataframe(
+                df_mapa[df_mapa['ID_VIAGEM'].isin(arestas.at[escolhida, 'IDS'])]
+                [['ID_VIAGEM', 'DATA_INICIO_VIAGEM', 'MOTORISTA', 'MODELO_VEICULO',
+                  'KM_TOTAL_PERCORRIDO', 'GASTO_FINAL_TOTAL']],
+                use_container_width=True,
+                hide_index=True
+            )
+        
         # ========== PREPARAR DADOS DE ANÁLISE (ANTES DO MODO COMPLETO) ==========
         paradas_por_viagem = []
         for _, viagem in df_mapa.iterrows():
@@ -363,67 +391,69 @@ if not df_filtrado.empty:
         
                 # ========== MODO COMPLETO ==========
         if view_mode == "Completo":
-            with section_advanced():
-                
-                st.subheader("🏙️ Ranking de Cidades por Visitas")
-                
-                # Criar tabela de cidades
-                df_cidades_rank = pd.DataFrame([
-                    {'Cidade': cidade, 'Visitas': visitas}
-                    for cidade, visitas in visitas_por_cidade.items()
-                    if visitas > 0
-                ]).sort_values('Visitas', ascending=False)
-                
-                # Adicionar informações extras se disponível
-                if not df_cidades_rank.empty:
-                    # Adicionar coluna de ranking
-                    df_cidades_rank.insert(0, 'Ranking', range(1, len(df_cidades_rank) + 1))
+            secao = section_advanced(key="avancado_mapa")
+            if secao_aberta(secao):
+                with secao:
                     
-                    st.dataframe(
-                        df_cidades_rank,
-                        use_container_width=True,
-                        hide_index=True,
-                        column_config={
-                            "Ranking": st.column_config.NumberColumn(
-                                "🏆 Ranking",
-                                help="Posição no ranking de visitas"
-                            ),
-                            "Cidade": st.column_config.TextColumn(
-                                "🏙️ Cidade",
-                                help="Nome da cidade"
-                            ),
-                            "Visitas": st.column_config.NumberColumn(
-                                "📊 Visitas",
-                                help="Número total de visitas (origem + destinos)"
-                            )
-                        }
-                    )
-                    
-                    # Estatísticas rápidas abaixo da tabela
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        st.metric(
-                            "🥇 Cidade Líder",
-                            df_cidades_rank.iloc[0]['Cidade'],
-                            f"{df_cidades_rank.iloc[0]['Visitas']} visitas"
-                        )
+                    st.subheader("🏙️ Ranking de Cidades por Visitas")
                     
-                    with col2:
-                        total_visitas = df_cidades_rank['Visitas'].sum()
-                        st.metric(
-                            "📍 Total de Visitas",
-                            f"{total_visitas}",
-                            f"{len(df_cidades_rank)} cidades"
-                        )
+                    # Criar tabela de cidades
+                    df_cidades_rank = pd.DataFrame([
+                        {'Cidade': cidade, 'Visitas': visitas}
+                        for cidade, visitas in visitas_por_cidade.items()
+                        if visitas > 0
+                    ]).sort_values('Visitas', ascending=False)
                     
-                    with col3:
-                        media_visitas = df_cidades_rank['Visitas'].mean()
-                        st.metric(
-                            "📊 Média de Visitas",
-                            f"{media_visitas:.1f}",
-                            "por cidade"
+                    # Adicionar informações extras se disponível
+                    if not df_cidades_rank.empty:
+                        # Adicionar coluna de ranking
+                        df_cidades_rank.insert(0, 'Ranking', range(1, len(df_cidades_rank) + 1))
+                        
+                        st.dataframe(
+                            df_cidades_rank,
+                            use_container_width=True,
+                            hide_index=True,
+                            column_config={
+                                "Ranking": st.column_config.NumberColumn(
+                                    "🏆 Ranking",
+                                    help="Posição no ranking de visitas"
+                                ),
+                                "Cidade": st.column_config.TextColumn(
+                                    "🏙️ Cidade",
+                                    help="Nome da cidade"
+                                ),
+                                "Visitas": st.column_config.NumberColumn(
+                                    "📊 Visitas",
+                                    help="Número total de visitas (origem + destinos)"
+                                )
+                            }
                         )
+                        
+                        # Estatísticas rápidas abaixo da tabela
+                        col1, col2, col3 = st.columns(3)
+                        
+                        with col1:
+                            st.metric(
+                                "🥇 Cidade Líder",
+                                df_cidades_rank.iloc[0]['Cidade'],
+                                f"{df_cidades_rank.iloc[0]['Visitas']} visitas"
+                            )
+                        
+                        with col2:
+                            total_visitas = df_cidades_rank['Visitas'].sum()
+                            st.metric(
+                                "📍 Total de Visitas",
+                                f"{total_visitas}",
+                                f"{len(df_cidades_rank)} cidades"
+                            )
+                        
+                        with col3:
+                            media_visitas = df_cidades_rank['Visitas'].mean()
+                            st.metric(
+                                "📊 Média de Visitas",
+                                f"{media_visitas:.1f}",
+                                "por cidade"
+                            )
 
         
         # ========== INSIGHTS ==========
@@ -483,3 +513,5 @@ _{cidades_com_visitas} com visitas registradas_
 
 else:
     st.warning("⚠️ Nenhum dado disponível com os filtros aplicados.")
+
+finalizar_rastro("Mapa de Rotas")
@@ -0,0 +1,164 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import os, sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import (load_all_data, check_data_loaded, apply_filters, ui_view_mode, render_kpis, section_advanced,
+                   render_insights, coords_conhecidas, conferencia_km, FATOR_ESTRADA,
+                   reconciliacao_rotas, resumo_reconciliacao, render_grafico, finalizar_rastro, secao_aberta)
+
+st.set_page_config(page_title="Conferência de KM", page_icon="📏", layout="wide")
+st.title("📏 Conferência de KM")
+
+check_data_loaded()
+
+df_viagens, *_ = load_all_data(st.session_state['uploaded_file'])
+df_filtrado = apply_filters(df_viagens)
+view_mode = ui_view_mode()
+
+# ========== PARÂMETROS ==========
+st.sidebar.subheader("📏 Tolerância")
+razao_min, razao_max = st.sidebar.slider(
+    "Faixa aceitável (registrado ÷ estimado)",
+    0.1, 3.0, (0.8, 1.5), step=0.05,
+    key="faixa_km"
+)
+fator_estrada = st.sidebar.number_input(
+    "Fator de estrada", 1.0, 2.0, FATOR_ESTRADA, step=0.05,
+    help="Quanto a rota por estrada costuma ser maior que a linha reta",
+    key="fator_estrada"
+)
+com_retorno = st.sidebar.checkbox("Incluir retorno à origem", value=True, key="km_retorno")
+
+if not df_filtrado.empty:
+    
+    coords = coords_conhecidas(df_filtrado)
+    df_conf = conferencia_km(df_filtrado, coords, razao_min, razao_max, fator_estrada, com_retorno)
+    
+    sem_coords = (df_conf['STATUS'] == 'Sem coordenadas').sum()
+    if sem_coords:
+        st.caption(f"⏳ {sem_coords} viagens sem coordenadas para todas as cidades — "
+                   "aguarde o pré-carregamento ou abra o Mapa de Rotas.")
+    
+    avaliadas = df_conf[df_conf['STATUS'].isin(['OK', 'Abaixo', 'Acima'])]
+    
+    # ========== KPIs ==========
+    render_kpis([
+        {"label": "🧾 Avaliadas", "value": f"{len(avaliadas)}"},
+        {"label": "✅ Dentro da faixa", "value": f"{(avaliadas['STATUS'] == 'OK').sum()}"},
+        {"label": "⬆️ Acima", "value": f"{(avaliadas['STATUS'] == 'Acima').sum()}"},
+        {"label": "⬇️ Abaixo", "value": f"{(avaliadas['STATUS'] == 'Abaixo').sum()}"}
+    ])
+    
+    st.markdown("---")
+    
+    if not avaliadas.empty:
+        
+        # ========== GRÁFICO PRINCIPAL ==========
+        st.subheader("📊 Distribuição da Razão Registrado ÷ Estimado")
+        
+        fig = px.histogram(
+            avaliadas,
+            x='RAZAO',
+            color='STATUS',
+            nbins=40,
+            color_discrete_map={'OK': '#2ca02c', 'Acima': '#d62728', 'Abaixo': '#ff7f0e'}
+        )
+        fig.add_vline(x=razao_min, line_dash='dash')
+        fig.add_vline(x=razao_max, line_dash='dash')
+        render_grafico(fig)
+        
+        # ========== VIAGENS FORA DA FAIXA ==========
+        st.subheader("🚩 Viagens Fora da Faixa")
+        
+        fora = avaliadas[avaliadas['STATUS'] != 'OK']
+        if fora.empty:
+            st.success("✅ Todas as viagens avaliadas estão dentro da faixa.")
+        else:
+            st.dataframe(
+                fora.assign(DESVIO=(fora['RAZAO'] - 1).abs()).sort_values('DESVIO', ascending=False)
+                .drop(columns='DESVIO'),
+                use_container_width=True
+            )
+        
+        # ========== MODO COMPLETO ==========
+        if view_mode == "Completo":
+            secao = section_advanced(key="avancado_km")
+            if secao_aberta(secao):
+                with secao:
+                    st.subheader("📋 Todas as Viagens")
+                    st.dataframe(df_conf, use_container_width=True)
+                    
+                    if 'MOTORISTA' in avaliadas.columns:
+                        st.subheader("👤 Fora da Faixa por Motorista")
+                        df_mot = avaliadas.groupby('MOTORISTA').agg(
+                            Viagens=('ID_VIAGEM', 'count'),
+                            Fora=('STATUS', lambda s: (s != 'OK').sum()),
+                            Razao_Media=('RAZAO', 'mean')
+                        ).reset_index().sort_values('Fora', ascending=False)
+                        st.dataframe(df_mot, use_container_width=True)
+        
+        # ========== INSIGHTS ==========
+        pior = avaliadas.loc[(avaliadas['RAZAO'] - 1).abs().idxmax()]
+        render_insights([
+            {
+                "icon": "🚩",
+                "title": "Maior Desvio",
+                "desc": f"Viagem #{int(pior['ID_VIAGEM'])}: {pior['KM_TOTAL_PERCORRIDO']:,.0f} km registrados",
+                "extra": f"Estimado: {pior['KM_ESTIMADO']:,.0f} km • razão {pior['RAZAO']:.2f}"
+            },
+            {
+                "icon": "📐",
+                "title": "Razão Mediana",
+                "desc": f"{avaliadas['RAZAO'].median():.2f}",
+                "extra": f"{len(avaliadas)} viagens com estimativa"
+            }
+        ])
+    
+    else:
+        st.info("ℹ️ Nenhuma viagem com coordenadas suficientes para avaliar.")
+    
+    # ========== RECONCILIAÇÃO COM ROTAS ==========
+    st.markdown("---")
+    st.subheader("🛣️ Reconciliação com Rotas Calculadas")
+    st.caption("Usa apenas rotas já calculadas (pré-carregamento ou Mapa de Rotas); nenhuma requisição é feita.")
+    
+    df_rec = reconciliacao_rotas(df_filtrado, coords)
+    com_rota = df_rec[df_rec['FAIXA'] != 'Sem rota']
+    
+    if com_rota.empty:
+        st.info("ℹ️ Nenhuma viagem com todas as rotas em cache.")
+    else:
+        render_kpis([
+            {"label": "🛣️ Com rota", "value": f"{len(com_rota)} de {len(df_rec)}"},
+            {"label": "🟢 Verde", "value": f"{(com_rota['FAIXA'] == 'Verde').sum()}"},
+            {"label": "🟠 Laranja", "value": f"{(com_rota['FAIXA'] == 'Laranja').sum()}"},
+            {"label": "🔴 Vermelho", "value": f"{(com_rota['FAIXA'] == 'Vermelho').sum()}"}
+        ])
+        
+        agrupar_por = st.radio(
+            "Agrupar por",
+            ["Viagem", "Motorista", "Veículo"],
+            horizontal=True,
+            key="rec_agrupar"
+        )
+        
+        if agrupar_por == "Viagem":
+            df_exibir = com_rota
+        else:
+            df_exibir = resumo_reconciliacao(com_rota, 'MOTORISTA' if agrupar_por == "Motorista" else 'MODELO_VEICULO')
+        
+        st.dataframe(df_exibir, use_container_width=True)
+        st.download_button(
+            "📥 Exportar CSV",
+            df_exibir.to_csv(index=False, sep=';', decimal=',').encode('utf-8-sig'),
+            file_name=f"reconciliacao_km_{agrupar_por.lower()}.csv",
+            mime="text/csv",
+            key="rec_csv"
+        )
+
+else:
+    st.warning("⚠️ Nenhum dado disponível.")
+
+finalizar_rastro("Conferência de KM")
@@ -0,0 +1,103 @@
+import streamlit as st
+import pandas as pd
+import os, sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import (render_kpis, estatisticas_caches, limpar_camada, memoria_sessao, get_armazem, fmt_bytes, fmt_num,
+                   ARMAZEM_MAX_MB, ARMAZEM_COTA_SESSAO_MB, ARMAZEM_OCIOSO_S, CACHES_ADMIN)
+
+st.set_page_config(page_title="Caches", page_icon="🧰", layout="wide")
+st.title("🧰 Caches")
+
+def limpar_selecionada():
+    """Callback do botão: limpa antes de a página recalcular as estatísticas"""
+    if not (CACHES_ADMIN and st.session_state.get('confirmar_limpeza')):
+        return
+    camada = st.session_state['camada_limpar']
+    st.session_state['camada_limpa'] = (camada, limpar_camada(camada))
+    st.session_state['confirmar_limpeza'] = False
+
+
+# ========== CAMADAS ==========
+df_caches = estatisticas_caches()
+
+consultas = (df_caches['acertos'] + df_caches['falhas']).sum()
+render_kpis([
+    {"label": "🗂️ Camadas", "value": f"{len(df_caches)}"},
+    {"label": "📦 Entradas", "value": fmt_num(df_caches['entradas'].fillna(0).sum())},
+    {"label": "💾 Memória estimada", "value": fmt_bytes(df_caches['bytes'].fillna(0).sum())},
+    {"label": "🎯 Taxa de acerto", "value": f"{df_caches['acertos'].sum() / consultas:.0%}" if consultas else "—"}
+])
+
+st.markdown("---")
+st.subheader("📊 Por Camada")
+
+st.dataframe(
+    df_caches.assign(bytes=df_caches['bytes'].map(lambda v: fmt_bytes(v) if pd.notna(v) else "—"))
+    .rename(columns={
+        'camada': 'Camada', 'tipo': 'Tipo', 'entradas': 'Entradas', 'bytes': 'Tamanho',
+        'acertos': 'Acertos', 'falhas': 'Falhas', 'taxa_acerto': 'Taxa de acerto',
+        'despejos': 'Despejos (LRU)', 'expiradas': 'Expiradas (TTL)'
+    }),
+    hide_index=True,
+    use_container_width=True
+)
+st.caption("Acertos e falhas contam desde o início do servidor; os LRU compartilhados valem para todas as sessões.")
+
+# ========== LIMPEZA ==========
+st.subheader("🧹 Limpar uma Camada")
+
+if not CACHES_ADMIN:
+    # Os caches são compartilhados por todas as sessões: limpar afeta todos os usuários
+    st.caption("🔒 Somente leitura. Defina `CACHES_ADMIN=1` no servidor para liberar a limpeza.")
+else:
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        camada = st.selectbox("Camada", df_caches['camada'].tolist(), key="camada_limpar")
+        confirmar = st.checkbox(
+            "Confirmo: a camada será esvaziada para todas as sessões",
+            key="confirmar_limpeza"
+        )
+    with col2:
+        st.write("")
+        st.button("Limpar", key="limpar_camada", type="primary", on_click=limpar_selecionada, disabled=not confirmar)
+    
+    if 'camada_limpa' in st.session_state:
+        limpa, ok = st.session_state.pop('camada_limpa')
+        if ok:
+            st.success(f"✅ Camada '{limpa}' esvaziada.")
+        else:
+            st.error(f"❌ Camada '{limpa}' não encontrada.")
+
+# ========== ARMAZÉM DE SESSÕES ==========
+st.subheader("🧑‍🤝‍🧑 Sessões no Armazém Compartilhado")
+st.caption(
+    f"Orçamento de {ARMAZEM_MAX_MB:,.0f} MB no servidor e {ARMAZEM_COTA_SESSAO_MB:,.0f} MB por sessão; "
+    f"sessões ociosas há mais de {ARMAZEM_OCIOSO_S / 60:.0f} min perdem seus dados."
+)
+
+df_armazem = get_armazem().por_sessao()
+if df_armazem.empty:
+    st.info("ℹ️ Nenhuma sessão com dados no armazém.")
+else:
+    st.dataframe(
+        df_armazem.assign(bytes=df_armazem['bytes'].map(fmt_bytes))
+        .rename(columns={'sessao': 'Sessão', 'referencias': 'Referências', 'bytes': 'Tamanho', 'ociosa_s': 'Ociosa (s)'}),
+        hide_index=True,
+        use_container_width=True
+    )
+
+# ========== SESSÃO ==========
+st.subheader("👤 Memória desta Sessão")
+
+df_sessao = memoria_sessao()
+if df_sessao.empty:
+    st.info("ℹ️ Nenhum dado guardado nesta sessão.")
+else:
+    st.caption(f"Total estimado: {fmt_bytes(df_sessao['bytes'].sum())}")
+    st.dataframe(
+        df_sessao.assign(bytes=df_sessao['bytes'].map(fmt_bytes))
+        .rename(columns={'chave': 'Chave', 'tipo': 'Tipo', 'bytes': 'Tamanho'}),
+        hide_index=True,
+        use_container_width=True
+    )
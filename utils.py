@@ -1,13 +1,189 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+import os
+import io
+import sys
+import hashlib
 import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+from contextlib import contextmanager
+import functools
+import importlib.util
+import json
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:
+    get_script_run_ctx = None
+
+# ===================== DESEMPENHO =====================
+
+PERF_LOG = os.environ.get('PERF_LOG')  # Caminho do log JSONL por execução (desligado se vazio)
+_lock_perf_log = threading.Lock()
+
+
+def _em_sessao():
+    """True quando executando no script de uma sessão (não em threads de fundo ou benchmarks)"""
+    return get_script_run_ctx is not None and get_script_run_ctx(suppress_warning=True) is not None
+
+
+def _rastro_atual():
+    """Acumulador de spans da execução atual da página, ou None fora de uma sessão"""
+    if not _em_sessao():
+        return None
+    return st.session_state.get('_rastro')
+
+
+@contextmanager
+def span(nome):
+    """Mede um trecho de código e acumula o tempo em `nome` na execução atual"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        rastro = _rastro_atual()
+        if rastro is not None:
+            total = rastro['spans'].setdefault(nome, [0.0, 0])
+            total[0] += time.perf_counter() - inicio
+            total[1] += 1
+
+
+def rastrear(nome=None):
+    """Decorator: envolve a função num `span` (nome padrão: nome da função)"""
+    def decorador(funcao):
+        rotulo = nome or funcao.__name__
+        
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with span(rotulo):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+_contadores_cache_data = {}
+_funcoes_cache_data = {}
+_lock_contadores = threading.Lock()
+
+
+def cache_data_observado(**opcoes):
+    """`st.cache_data` com contagem de chamadas e falhas (falha = corpo executado)"""
+    def decorador(funcao):
+        contadores = _contadores_cache_data.setdefault(funcao.__name__, {'chamadas': 0, 'falhas': 0})
+        
+        @functools.wraps(funcao)
+        def corpo(*args, **kwargs):
+            with _lock_contadores:
+                contadores['falhas'] += 1
+            return funcao(*args, **kwargs)
+        
+        cacheada = st.cache_data(**opcoes)(corpo)
+        
+        @functools.wraps(funcao)
+        def chamada(*args, **kwargs):
+            with _lock_contadores:
+                contadores['chamadas'] += 1
+            return cacheada(*args, **kwargs)
+        
+        chamada.clear = cacheada.clear
+        _funcoes_cache_data[funcao.__name__] = chamada
+        return chamada
+    return decorador
+
+
+def contadores_caches():
+    """{camada: (acertos, falhas)} de todas as camadas de cache"""
+    contadores = {nome: (cache.acertos, cache.falhas) for nome, cache in _camadas_lru().items()}
+    with _lock_contadores:
+        for nome, c in _contadores_cache_data.items():
+            contadores[nome] = (c['chamadas'] - c['falhas'], c['falhas'])
+    return contadores
+
+
+def iniciar_rastro():
+    """Zera o acumulador no início de cada execução da página"""
+    st.session_state['_rastro'] = {
+        'inicio': time.perf_counter(),
+        'spans': {},
+        'caches': contadores_caches(),
+    }
+
+
+def resumo_rastro():
+    """Spans e acertos/falhas de cache (delta) da execução atual"""
+    rastro = _rastro_atual()
+    if rastro is None:
+        return None
+    
+    antes = rastro['caches']
+    depois = contadores_caches()
+    return {
+        'total_ms': round((time.perf_counter() - rastro['inicio']) * 1000, 1),
+        'spans': {
+            nome: {'ms': round(segundos * 1000, 1), 'chamadas': chamadas}
+            for nome, (segundos, chamadas) in sorted(rastro['spans'].items(), key=lambda x: -x[1][0])
+        },
+        'caches': {
+            nome: {'acertos': acertos - antes.get(nome, (0, 0))[0], 'falhas': falhas - antes.get(nome, (0, 0))[1]}
+            for nome, (acertos, falhas) in depois.items()
+        },
+    }
+
+
+def _gravar_perf_log(pagina, resumo):
+    registro = {'ts': time.time(), 'pagina': pagina, **resumo}
+    with _lock_perf_log:
+        with open(PERF_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+
+def finalizar_rastro(pagina, painel=True):
+    """Fim da execução: grava o JSONL (se PERF_LOG) e mostra o painel se ligado na sidebar"""
+    preimportar_modulos()
+    resumo = resumo_rastro()
+    if resumo is None:
+        return
+    
+    if PERF_LOG:
+        try:
+            _gravar_perf_log(pagina, resumo)
+        except OSError:
+            pass
+    
+    if not painel or not st.sidebar.toggle("⏱️ Painel de desempenho", key="painel_desempenho"):
+        return
+    
+    with st.sidebar.expander(f"⏱️ {resumo['total_ms']:,.0f} ms nesta execução", expanded=True):
+        if resumo['spans']:
+            st.dataframe(
+                pd.DataFrame([
+                    {'Etapa': nome, 'ms': dados['ms'], 'Chamadas': dados['chamadas'],
+                     '% do total': round(100 * dados['ms'] / resumo['total_ms'], 1) if resumo['total_ms'] else 0}
+                    for nome, dados in resumo['spans'].items()
+                ]),
+                hide_index=True,
+                use_container_width=True
+            )
+        
+        st.caption("Caches (acertos / falhas nesta execução)")
+        st.dataframe(
+            pd.DataFrame([
+                {'Cache': nome, 'Acertos': dados['acertos'], 'Falhas': dados['falhas']}
+                for nome, dados in resumo['caches'].items()
+            ]),
+            hide_index=True,
+            use_container_width=True
+        )
+
 
 # ===================== CACHE & CARREGAMENTO =====================
 
-@st.cache_data
+@rastrear('carregamento')
+@cache_data_observado()
 def load_all_data(uploaded_file):
     """Carrega todas as abas do Excel"""
     try:
@@ -41,6 +217,7 @@ def load_all_data(uploaded_file):
 
 # ===================== FILTROS =====================
 
+@rastrear('filtros')
 def apply_filters(df_viagens):
     """Aplica filtros na sidebar"""
     st.sidebar.header("🔍 Filtros")
@@ -68,7 +245,17 @@ def apply_filters(df_viagens):
     veiculos = ['Todos'] + sorted(df_viagens['MODELO_VEICULO'].dropna().unique().tolist())
     veiculo = st.sidebar.selectbox("🚗 Veículo", veiculos)
     
-    # Aplicar filtros
+    ids_area = filtro_geografico(df_viagens)
+    
+    df = filtrar_viagens(df_viagens, data_inicio, data_fim, motorista, veiculo, ids_area)
+    
+    st.sidebar.info(f"📊 **{len(df)}** viagens")
+    
+    return df
+
+
+def filtrar_viagens(df_viagens, data_inicio, data_fim, motorista='Todos', veiculo='Todos', ids_area=None):
+    """Aplica os filtros da sidebar (sem widgets); `ids_area` None = sem filtro geográfico"""
     df = df_viagens.copy()
     df = df[(df['DATA_INICIO_VIAGEM'] >= pd.to_datetime(data_inicio)) & 
             (df['DATA_RETORNO'] <= pd.to_datetime(data_fim))]
@@ -79,7 +266,8 @@ def apply_filters(df_viagens):
     if veiculo != 'Todos':
         df = df[df['MODELO_VEICULO'] == veiculo]
     
-    st.sidebar.info(f"📊 **{len(df)}** viagens")
+    if ids_area is not None:
+        df = df[df['ID_VIAGEM'].isin(ids_area)]
     
     return df
 
@@ -89,6 +277,9 @@ def check_data_loaded():
     if 'uploaded_file' not in st.session_state:
         st.warning("⚠️ Nenhum arquivo carregado. Volte à página inicial.")
         st.stop()
+    
+    iniciar_rastro()
+    render_preaquecimento()
 
 
 # ===================== UI HELPERS =====================
@@ -115,9 +306,276 @@ def render_kpis(kpis):
         )
 
 
-def section_advanced(title="🔬 Análises Detalhadas"):
-    """Cria expander para seção avançada"""
-    return st.expander(title, expanded=False)
+def section_advanced(title="🔬 Análises Detalhadas", key=None):
+    """Cria expander para seção avançada
+    
+    Com `key`, o expander informa se está aberto (`.open`) e reexecuta a página
+    ao ser aberto, para o conteúdo só ser montado sob demanda (`secao_aberta`).
+    """
+    if key is None:
+        return st.expander(title, expanded=False)
+    try:
+        return st.expander(title, expanded=False, key=key, on_change='rerun')
+    except TypeError:  # Streamlit sem estado no expander: comportamento antigo
+        return st.expander(title, expanded=False)
+
+
+def secao_aberta(secao):
+    """True se o expander está aberto (ou não informa o estado, e então o conteúdo é sempre montado)"""
+    return getattr(secao, 'open', None) is not False
+
+
+def calcular_por_filtro(nome, df, funcao, *args):
+    """`funcao(df, *args)` memoizada por filtro: mesmo arquivo + mesmas viagens + mesmos args
+    
+    O resultado fica no armazém compartilhado (sessões com o mesmo filtro reaproveitam).
+    """
+    arquivo = st.session_state.get('uploaded_file') if _em_sessao() else None
+    chave = ('secao', nome, getattr(arquivo, 'file_id', None), hash_viagens(df), args)
+    resultado = obter_da_sessao(chave)
+    if resultado is None:
+        with span(f'secao/{nome}'):
+            resultado = guardar_na_sessao(chave, funcao(df, *args))
+    return resultado
+
+
+_fragmento = getattr(st, 'fragment', None)
+
+
+def _reexecucao_parcial():
+    """True quando a execução atual roda só fragmentos, não a página inteira"""
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx is not None else None
+    return bool(ctx is not None and getattr(ctx, 'fragment_ids_this_run', None))
+
+
+def secao_independente(pagina):
+    """Decorator: a seção vira um st.fragment (sem ele, função comum)
+    
+    Widgets dentro da seção reexecutam só ela, com os argumentos da última
+    execução completa (ex.: o DataFrame já filtrado). Cada reexecução parcial
+    tem seu próprio rastro, gravado no PERF_LOG como '<pagina> (seção)'.
+    """
+    def decorador(funcao):
+        if _fragmento is None:
+            return funcao
+        
+        @functools.wraps(funcao)
+        def secao(*args, **kwargs):
+            if not _reexecucao_parcial():
+                return funcao(*args, **kwargs)
+            iniciar_rastro()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                # A sidebar não pode ser escrita de dentro de um fragmento
+                finalizar_rastro(f"{pagina} (seção)", painel=False)
+        
+        return _fragmento(secao)
+    return decorador
+
+
+def render_grafico(fig):
+    """Exibe uma figura Plotly (séries longas em WebGL), contando o tempo no span 'graficos'"""
+    with span('graficos'):
+        st.plotly_chart(para_webgl(fig), use_container_width=True)
+
+
+TAMANHOS_PAGINA = (25, 50, 100, 250)
+
+
+def posicoes_ordenadas(df, coluna, decrescente=True, busca='', coluna_busca=None):
+    """Posições (iloc) das linhas que contêm `busca`, na ordem de `coluna` (nulos por último)
+    
+    Só a coluna de ordenação e as de busca são lidas; as demais linhas nunca são copiadas.
+    """
+    posicoes = np.arange(len(df))
+    if busca:
+        colunas = [coluna_busca] if coluna_busca else list(df.columns)
+        encontrada = np.zeros(len(df), dtype=bool)
+        for c in colunas:
+            encontrada |= df[c].astype(str).str.contains(busca, case=False, regex=False, na=False).to_numpy()
+        posicoes = posicoes[encontrada]
+    
+    valores = pd.Series(df[coluna].to_numpy()[posicoes])
+    ordem = valores.sort_values(ascending=not decrescente, kind='stable', na_position='last').index.to_numpy()
+    return posicoes[ordem]
+
+
+def tabela_paginada(df, key, ordem, decrescente=True):
+    """Tabela com busca, filtro por coluna, ordenação e paginação no servidor
+    
+    Só a página atual vai para o navegador; a ordem (com a busca aplicada) fica
+    memoizada no armazém compartilhado, então trocar de página só fatia o índice.
+    """
+    colunas = list(df.columns)
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
+    busca = col1.text_input("🔎 Buscar", key=f"{key}_busca").strip()
+    coluna_busca = col2.selectbox("Em", [None] + colunas, format_func=lambda c: c or "Todas as colunas",
+                                  key=f"{key}_coluna_busca")
+    coluna = col3.selectbox("Ordenar por", colunas, index=colunas.index(ordem), key=f"{key}_ordem")
+    with col4:
+        st.write("")
+        decrescente = st.toggle("↓", value=decrescente, key=f"{key}_desc", help="Ordem decrescente")
+    
+    arquivo = st.session_state.get('uploaded_file')
+    chave = ('tabela', key, getattr(arquivo, 'file_id', None), hash_conteudo(df.index.to_series()),
+             coluna, decrescente, busca, coluna_busca)
+    posicoes = obter_da_sessao(chave)
+    if posicoes is None:
+        with span('tabelas/ordenar'):
+            posicoes = guardar_na_sessao(chave, posicoes_ordenadas(df, coluna, decrescente, busca, coluna_busca))
+    
+    por_pagina = st.session_state.get(f"{key}_por_pagina", TAMANHOS_PAGINA[1])
+    n_paginas = max(1, -(-len(posicoes) // por_pagina))
+    if st.session_state.get(f"{key}_pagina", 1) > n_paginas:
+        st.session_state[f"{key}_pagina"] = n_paginas  # busca ou tamanho mudou: volta para a última página válida
+    pagina = st.session_state.get(f"{key}_pagina", 1)
+    
+    inicio = (pagina - 1) * por_pagina
+    with span('tabelas/pagina'):
+        st.dataframe(df.iloc[posicoes[inicio:inicio + por_pagina]], hide_index=True, use_container_width=True)
+    
+    col1, col2, col3 = st.columns([2, 1, 1])
+    if len(posicoes):
+        col1.caption(f"Linhas {inicio + 1}–{min(inicio + por_pagina, len(posicoes))} de {len(posicoes)}"
+                     + (f" (de {len(df)} no total)" if len(posicoes) < len(df) else ""))
+    else:
+        col1.caption(f"Nenhuma linha contém “{busca}”.")
+    col2.number_input("Página", min_value=1, max_value=n_paginas, step=1, key=f"{key}_pagina")
+    col3.selectbox("Linhas por página", TAMANHOS_PAGINA, index=TAMANHOS_PAGINA.index(TAMANHOS_PAGINA[1]),
+                   key=f"{key}_por_pagina")
+
+
+# ===================== GRÁFICOS =====================
+
+GRAFICO_MAX_PONTOS = int(os.environ.get('GRAFICO_MAX_PONTOS', 2000))  # Acima disso a série é reduzida
+LIMITE_WEBGL = int(os.environ.get('LIMITE_WEBGL', 1000))              # Traços scatter maiores vão para WebGL
+
+
+def lttb(x, y, n):
+    """Índices de `n` pontos pelo Largest-Triangle-Three-Buckets (mantém picos e forma da série)"""
+    tamanho = len(y)
+    if n >= tamanho or n < 3:
+        return np.arange(tamanho)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    
+    # Primeiro e último ficam; o resto vira n-2 buckets
+    bordas = np.linspace(1, tamanho - 1, n - 1).astype(np.int64)
+    escolhidos = np.empty(n, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, tamanho - 1
+    anterior = 0
+    for i in range(n - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        proximo = slice(bordas[i + 1], bordas[i + 2]) if i + 2 < len(bordas) else slice(tamanho - 1, tamanho)
+        mx, my = x[proximo].mean(), y[proximo].mean()
+        areas = np.abs((x[anterior] - mx) * (y[inicio:fim] - y[anterior])
+                       - (x[anterior] - x[inicio:fim]) * (my - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        escolhidos[i + 1] = anterior
+    return escolhidos
+
+
+def minmax_buckets(y, n):
+    """Índices do mínimo e do máximo de cada um de n/2 buckets consecutivos, em ordem"""
+    tamanho = len(y)
+    if n >= tamanho:
+        return np.arange(tamanho)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    n_buckets = max(1, n // 2)
+    bucket = np.arange(tamanho) * n_buckets // tamanho
+    ordem = np.lexsort((y, bucket))  # por bucket e, dentro dele, por y
+    inicio = np.searchsorted(bucket[ordem], np.arange(n_buckets))
+    fim = np.r_[inicio[1:], tamanho]
+    return np.unique(np.r_[ordem[inicio], ordem[fim - 1]])
+
+
+def reduzir_serie(df, x, y, n=GRAFICO_MAX_PONTOS, metodo='lttb'):
+    """Linhas de `df` (na ordem atual) que representam a série x→y com no máximo ~n pontos
+    
+    'lttb' para linhas e áreas; 'minmax' para barras, onde só os extremos importam.
+    Eixos não numéricos (categorias, IDs) usam a posição da linha.
+    """
+    if len(df) <= n:
+        return df
+    if metodo == 'minmax':
+        return df.iloc[minmax_buckets(df[y].to_numpy(), n)]
+    
+    eixo = df[x]
+    if pd.api.types.is_datetime64_any_dtype(eixo):
+        valores_x = eixo.to_numpy().astype('datetime64[ns]').astype(np.int64)
+    elif pd.api.types.is_numeric_dtype(eixo):
+        valores_x = eixo.to_numpy()
+    else:
+        valores_x = np.arange(len(df))
+    return df.iloc[lttb(valores_x, df[y].to_numpy(), n)]
+
+
+def para_webgl(fig, limite=LIMITE_WEBGL):
+    """Figura com os traços scatter acima de `limite` pontos trocados por scattergl
+    
+    Traços empilhados (stackgroup, ex.: px.area) ficam como estão: o WebGL não os suporta.
+    """
+    import plotly.graph_objects as go
+    
+    trocar = [
+        trace.type == 'scatter' and trace.stackgroup is None and trace.y is not None and len(trace.y) > limite
+        for trace in fig.data
+    ]
+    if not any(trocar):
+        return fig
+    
+    traces = []
+    for trace, gl in zip(fig.data, trocar):
+        if gl:
+            propriedades = trace.to_plotly_json()
+            propriedades.pop('type', None)
+            trace = go.Scattergl(propriedades, skip_invalid=True)
+        traces.append(trace)
+    return go.Figure(data=traces, layout=fig.layout)
+
+
+@st.cache_resource
+def get_cache_graficos():
+    """Figuras prontas por (construtor, hash dos dados, parâmetros), compartilhadas entre sessões"""
+    return CacheLRU(max_itens=128)
+
+
+def figura(construtor, df, reduzir=None, ajustar=None, **parametros):
+    """`construtor(df, **parametros)` (ex.: px.bar) com redução de pontos, WebGL e cache por hash dos dados
+    
+    `reduzir` ('lttb' ou 'minmax') reduz a série x→y a GRAFICO_MAX_PONTOS antes de
+    desenhar. `ajustar(fig)` aplica update_* antes de a figura ir para o cache (deve
+    depender só dos dados e parâmetros). Retorna a figura compartilhada: não altere.
+    """
+    chave = (
+        getattr(construtor, '__name__', repr(construtor)),
+        hash_conteudo(df),
+        reduzir,
+        repr(sorted(parametros.items())),
+        getattr(getattr(ajustar, '__code__', None), 'co_filename', None),
+        getattr(getattr(ajustar, '__code__', None), 'co_firstlineno', None),
+    )
+    cache = get_cache_graficos()
+    fig = cache.get(chave)
+    if fig is not None:
+        return fig
+    
+    with span('graficos/construir'):
+        dados = df
+        if reduzir and isinstance(parametros.get('y'), str):
+            dados = reduzir_serie(df, parametros.get('x'), parametros['y'], metodo=reduzir)
+        fig = construtor(dados, **parametros)
+        if ajustar is not None:
+            ajustar(fig)
+        if len(dados) < len(df):
+            fig.add_annotation(
+                xref='paper', yref='paper', x=1, y=1, xanchor='right', yanchor='bottom', showarrow=False,
+                text=f"{len(dados):,} de {len(df):,} pontos".replace(',', '.'), font=dict(size=11, color='gray')
+            )
+        fig = para_webgl(fig)
+    cache.set(chave, fig)
+    return fig
 
 
 # ===================== FORMATAÇÃO =====================
@@ -134,71 +592,516 @@ def fmt_float(v, decimals=2):
     """12.34"""
     return f"{v:.{decimals}f}"
 
+def fmt_bytes(v):
+    """1,5 MB"""
+    for unidade in ['B', 'KB', 'MB', 'GB']:
+        if abs(v) < 1024 or unidade == 'GB':
+            return f"{v:,.1f} {unidade}".replace(",", "X").replace(".", ",").replace("X", ".")
+        v /= 1024
+
+
+# ===================== CACHES COMPARTILHADOS =====================
+
+class CacheLRU:
+    """Dicionário LRU thread-safe compartilhado entre sessões e threads
+    
+    Com `ttl` (segundos), entradas expiradas são tratadas como ausentes. Com
+    `max_bytes`, cada valor é medido (`tamanho_estimado`) ao entrar e as
+    entradas mais antigas saem até o total caber no limite. `versao` muda a
+    cada gravação ou remoção (serve de chave barata para "o conteúdo mudou").
+    """
+    
+    def __init__(self, max_itens, ttl=None, max_bytes=None):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._dados = OrderedDict()
+        self._tamanhos = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.versao = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.despejos = 0
+        self.expiradas = 0
+    
+    def _expirou(self, chave):
+        return self.ttl is not None and self._dados[chave][0] < time.monotonic()
+    
+    def get(self, chave, padrao=None):
+        with self._lock:
+            if chave not in self._dados:
+                self.falhas += 1
+                return padrao
+            if self._expirou(chave):
+                self._descartar(chave)
+                self.expiradas += 1
+                self.falhas += 1
+                return padrao
+            self._dados.move_to_end(chave)
+            self.acertos += 1
+            return self._dados[chave][1]
+    
+    def _descartar(self, chave):
+        del self._dados[chave]
+        self._bytes -= self._tamanhos.pop(chave, 0)
+        self.versao += 1
+    
+    def set(self, chave, valor):
+        expira_em = time.monotonic() + self.ttl if self.ttl is not None else None
+        tamanho = tamanho_estimado(valor) if self.max_bytes is not None else 0
+        with self._lock:
+            if chave in self._dados:
+                self._descartar(chave)
+            self._dados[chave] = (expira_em, valor)
+            self.versao += 1
+            if self.max_bytes is not None:
+                self._tamanhos[chave] = tamanho
+                self._bytes += tamanho
+            while len(self._dados) > self.max_itens or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes and len(self._dados) > 1):
+                self._descartar(next(iter(self._dados)))
+                self.despejos += 1
+    
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._dados and not self._expirou(chave)
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._dados)
+    
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+            self._tamanhos.clear()
+            self._bytes = 0
+            self.versao += 1
+    
+    def estatisticas(self):
+        """Entradas, bytes estimados e contadores de acertos/falhas/despejos/expiradas"""
+        with self._lock:
+            valores = [valor for _, valor in self._dados.values()]
+            contadores = {
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'despejos': self.despejos,
+                'expiradas': self.expiradas,
+            }
+        return {'entradas': len(valores), 'bytes': tamanho_estimado(valores), **contadores}
+
+
+def tamanho_estimado(obj):
+    """Bytes aproximados de um objeto e de tudo o que ele referencia
+    
+    Arrays e DataFrames contam pelo buffer; containers e objetos comuns são
+    percorridos (cada objeto conta uma vez, mesmo se referenciado várias vezes).
+    """
+    vistos = set()
+    pilha = [obj]
+    total = 0
+    while pilha:
+        atual = pilha.pop()
+        if id(atual) in vistos or isinstance(atual, type):
+            continue
+        vistos.add(id(atual))
+        
+        if isinstance(atual, np.ndarray):
+            total += atual.nbytes + 112
+        elif isinstance(atual, (pd.DataFrame, pd.Series, pd.Index)):
+            uso = atual.memory_usage(deep=True)
+            total += int(uso.sum() if hasattr(uso, 'sum') else uso)
+        elif isinstance(atual, io.BytesIO):
+            total += sys.getsizeof(atual) + atual.getbuffer().nbytes
+        elif isinstance(atual, dict):
+            total += sys.getsizeof(atual)
+            pilha.extend(atual.keys())
+            pilha.extend(atual.values())
+        elif isinstance(atual, (list, tuple, set, frozenset, deque)):
+            total += sys.getsizeof(atual)
+            pilha.extend(atual)
+        else:
+            total += sys.getsizeof(atual)
+            if hasattr(atual, '__dict__') and not callable(atual):
+                pilha.append(vars(atual))
+    return total
+
+
+ARMAZEM_MAX_MB = float(os.environ.get('ARMAZEM_MAX_MB', 512))                # Orçamento total do servidor
+ARMAZEM_COTA_SESSAO_MB = float(os.environ.get('ARMAZEM_COTA_SESSAO_MB', 128))  # Máximo por sessão
+ARMAZEM_OCIOSO_S = float(os.environ.get('ARMAZEM_OCIOSO_S', 1800))           # Sessão ociosa perde seus dados
+
+
+class ArmazemSessoes:
+    """Resultados derivados das sessões num só lugar, com orçamento de memória
+    
+    Cada valor é guardado uma vez por chave (sessões com o mesmo filtro
+    compartilham a cópia) e a sessão guarda só a referência. Uma sessão acima
+    da cota solta suas entradas mais antigas; sessões ociosas soltam todas;
+    entradas sem nenhuma sessão saem, e acima de `max_bytes` as menos usadas
+    são despejadas. Quem chama recalcula quando `obter` retorna None.
+    """
+    
+    def __init__(self, max_bytes, cota_sessao, ocioso):
+        self.max_bytes = max_bytes
+        self.cota_sessao = cota_sessao
+        self.ocioso = ocioso
+        self._entradas = OrderedDict()  # chave -> (valor, bytes), ordem de uso
+        self._donos = {}                # sessão -> OrderedDict das chaves referenciadas, ordem de uso
+        self._referencias = {}          # chave -> sessões que a referenciam (contagem de referências)
+        self._bytes = {}                # sessão -> soma dos bytes das chaves referenciadas
+        self._visto = {}                # sessão -> último acesso (monotonic)
+        self._total = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.despejos = 0
+        self.expiradas = 0
+    
+    def _tocar(self, sessao, chave):
+        refs = self._donos.setdefault(sessao, OrderedDict())
+        if chave not in refs:
+            refs[chave] = None
+            self._referencias.setdefault(chave, set()).add(sessao)
+            self._bytes[sessao] = self._bytes.get(sessao, 0) + self._entradas[chave][1]
+        refs.move_to_end(chave)
+        self._entradas.move_to_end(chave)
+    
+    def _remover(self, chave):
+        _, tamanho = self._entradas.pop(chave)
+        self._total -= tamanho
+        for sessao in self._referencias.pop(chave, ()):
+            del self._donos[sessao][chave]
+            self._bytes[sessao] -= tamanho
+    
+    def _soltar(self, sessao, chave):
+        """Sessão deixa de referenciar a chave; entrada órfã sai da memória"""
+        del self._donos[sessao][chave]
+        donos = self._referencias[chave]
+        donos.discard(sessao)
+        self._bytes[sessao] -= self._entradas[chave][1]
+        if not donos:
+            self._remover(chave)
+    
+    def _liberar_ociosas(self, agora):
+        for sessao, visto in list(self._visto.items()):
+            if agora - visto > self.ocioso:
+                for chave in list(self._donos.get(sessao, ())):
+                    self._soltar(sessao, chave)
+                self._donos.pop(sessao, None)
+                self._bytes.pop(sessao, None)
+                del self._visto[sessao]
+                self.expiradas += 1
+    
+    def _aplicar_limites(self, sessao, chave):
+        refs = self._donos[sessao]
+        while self._bytes[sessao] > self.cota_sessao and len(refs) > 1:
+            self._soltar(sessao, next(iter(refs)))
+            self.despejos += 1
+        while self._total > self.max_bytes and len(self._entradas) > 1:
+            antiga = next(iter(self._entradas))
+            if antiga == chave:
+                break
+            self._remover(antiga)
+            self.despejos += 1
+    
+    def guardar(self, sessao, chave, valor):
+        tamanho = tamanho_estimado(valor)
+        agora = time.monotonic()
+        with self._lock:
+            if chave in self._entradas:
+                anterior = self._entradas[chave][1]
+                self._total -= anterior
+                for dono in self._referencias.get(chave, ()):
+                    self._bytes[dono] += tamanho - anterior
+            self._entradas[chave] = (valor, tamanho)
+            self._total += tamanho
+            self._visto[sessao] = agora
+            self._tocar(sessao, chave)
+            self._liberar_ociosas(agora)
+            self._aplicar_limites(sessao, chave)
+        return valor
+    
+    def obter(self, sessao, chave):
+        agora = time.monotonic()
+        with self._lock:
+            self._visto[sessao] = agora
+            if chave not in self._entradas:
+                self.falhas += 1
+                return None
+            self._tocar(sessao, chave)
+            self.acertos += 1
+            self._liberar_ociosas(agora)
+            return self._entradas[chave][0]
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._entradas)
+    
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._donos.clear()
+            self._referencias.clear()
+            self._bytes.clear()
+            self._total = 0
+    
+    def estatisticas(self):
+        """Mesmo formato do CacheLRU.estatisticas (despejos incluem cota/orçamento; expiradas são sessões ociosas)"""
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._total,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'despejos': self.despejos,
+                'expiradas': self.expiradas,
+            }
+    
+    def por_sessao(self):
+        """Referências, bytes e tempo ocioso de cada sessão ativa no armazém"""
+        agora = time.monotonic()
+        with self._lock:
+            linhas = [
+                {
+                    'sessao': sessao[:8],
+                    'referencias': len(self._donos.get(sessao, ())),
+                    'bytes': self._bytes.get(sessao, 0),
+                    'ociosa_s': round(agora - visto),
+                }
+                for sessao, visto in self._visto.items()
+            ]
+        return pd.DataFrame(linhas, columns=['sessao', 'referencias', 'bytes', 'ociosa_s'])
+
+
+@st.cache_resource
+def get_armazem():
+    return ArmazemSessoes(
+        max_bytes=ARMAZEM_MAX_MB * 2**20,
+        cota_sessao=ARMAZEM_COTA_SESSAO_MB * 2**20,
+        ocioso=ARMAZEM_OCIOSO_S,
+    )
+
+
+def _id_sessao():
+    """Identificador da sessão atual ('local' fora de uma sessão do Streamlit)"""
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx is not None else None
+    return ctx.session_id if ctx is not None else 'local'
+
+
+def guardar_na_sessao(chave, valor):
+    """Guarda `valor` no armazém compartilhado em nome da sessão atual e o retorna"""
+    return get_armazem().guardar(_id_sessao(), chave, valor)
+
+
+def obter_da_sessao(chave):
+    """Valor guardado por `guardar_na_sessao`, ou None se foi despejado (recalcular)"""
+    return get_armazem().obter(_id_sessao(), chave)
+
+
+def _camadas_lru():
+    """Caches compartilhados em memória por nome de camada"""
+    return {
+        'geocodes': get_cache_geocodes(),
+        'rotas': get_cache_rotas(),
+        'distancias': get_cache_distancias(),
+        'mapas': get_cache_mapas(),
+        'indices': _cache_indices(),
+        'graficos': get_cache_graficos(),
+        'sessoes': get_armazem(),
+    }
+
+
+def _stats_streamlit_cache_data():
+    """{nome da função: (entradas, bytes)} segundo o próprio st.cache_data (vazio se indisponível)"""
+    try:
+        from streamlit.runtime.caching.cache_data_api import get_data_cache_stats_provider
+        stats = get_data_cache_stats_provider().get_stats()
+    except Exception:
+        return {}
+    
+    if isinstance(stats, dict):
+        stats = [stat for lista in stats.values() for stat in lista]
+    
+    resultado = {}
+    for stat in stats:
+        nome = stat.cache_name.rsplit('.', 1)[-1]
+        entradas, bytes_ = resultado.get(nome, (0, 0))
+        resultado[nome] = (entradas + 1, bytes_ + stat.byte_length)
+    return resultado
+
+
+def estatisticas_caches():
+    """Uma linha por camada de cache (LRU compartilhados e st.cache_data)"""
+    linhas = []
+    for nome, cache in _camadas_lru().items():
+        tipo = 'Armazém de sessões' if isinstance(cache, ArmazemSessoes) else 'LRU compartilhado'
+        linhas.append({'camada': nome, 'tipo': tipo, **cache.estatisticas()})
+    
+    tamanhos = _stats_streamlit_cache_data()
+    for nome, contadores in _contadores_cache_data.items():
+        entradas, bytes_ = tamanhos.get(nome, (None, None))
+        linhas.append({
+            'camada': nome,
+            'tipo': 'st.cache_data',
+            'entradas': entradas,
+            'bytes': bytes_,
+            'acertos': contadores['chamadas'] - contadores['falhas'],
+            'falhas': contadores['falhas'],
+            'despejos': None,
+            'expiradas': None,
+        })
+    
+    tabela = pd.DataFrame(linhas)
+    consultas = tabela['acertos'] + tabela['falhas']
+    tabela['taxa_acerto'] = (tabela['acertos'] / consultas.where(consultas > 0)).round(3)
+    return tabela
+
+
+CACHES_ADMIN = os.environ.get('CACHES_ADMIN', '').strip().lower() in ('1', 'true', 'sim')  # Libera a limpeza na página Caches
+
+
+def limpar_camada(nome):
+    """Esvazia uma única camada de cache; retorna False se o nome não existe"""
+    camadas = _camadas_lru()
+    if nome in camadas:
+        camadas[nome].limpar()
+        return True
+    if nome in _funcoes_cache_data:
+        _funcoes_cache_data[nome].clear()
+        return True
+    return False
+
+
+def memoria_sessao():
+    """Bytes estimados de cada chave do session_state desta sessão, maiores primeiro"""
+    linhas = [
+        {'chave': str(chave), 'tipo': type(valor).__name__, 'bytes': tamanho_estimado(valor)}
+        for chave, valor in st.session_state.items()
+    ]
+    return pd.DataFrame(linhas, columns=['chave', 'tipo', 'bytes']).sort_values('bytes', ascending=False)
+
 
 # ===================== GEOLOCALIZAÇÃO =====================
 
-@st.cache_data(ttl=86400)  # Cache por 24h
-def geocode_cidade(cidade, uf=None):
+NOMINATIM_INTERVALO = float(os.environ.get('NOMINATIM_INTERVALO', 1.0))  # Política de uso: 1 req/s
+NOMINATIM_DOMINIO = os.environ.get('NOMINATIM_DOMINIO', 'nominatim.openstreetmap.org')
+NOMINATIM_ESQUEMA = os.environ.get('NOMINATIM_ESQUEMA', 'https')
+_lock_nominatim = threading.Lock()
+_ultima_consulta_nominatim = [0.0]
+
+
+@st.cache_resource
+def get_cache_geocodes():
+    """Cache de coordenadas por (cidade, uf) compartilhado por todas as sessões (24h)"""
+    return CacheLRU(max_itens=20000, ttl=86400)
+
+
+def _consultar_nominatim(geolocator, consulta):
+    """Consulta o Nominatim respeitando o intervalo mínimo entre requisições"""
+    with _lock_nominatim:
+        espera = _ultima_consulta_nominatim[0] + NOMINATIM_INTERVALO - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+        try:
+            return geolocator.geocode(consulta)
+        finally:
+            _ultima_consulta_nominatim[0] = time.monotonic()
+
+
+@rastrear('geocodificacao/nominatim')
+def _geocode_remoto(cidade, uf):
+    """Geocodifica no Nominatim, tentando com UF e depois só com a cidade"""
+    from geopy.geocoders import Nominatim
+    
+    geolocator = Nominatim(user_agent="dashboard_frota", timeout=10,
+                           domain=NOMINATIM_DOMINIO, scheme=NOMINATIM_ESQUEMA)
+    
+    if uf:
+        location = _consultar_nominatim(geolocator, f"{cidade}, {uf}, Brasil")
+    else:
+        location = _consultar_nominatim(geolocator, f"{cidade}, Brasil")
+    
+    if location:
+        return location.latitude, location.longitude
+    
+    location = _consultar_nominatim(geolocator, f"{cidade}, Brasil")
+    if location:
+        return location.latitude, location.longitude
+    
+    return None, None
+
+
+def geocode_cidade(cidade, uf=None, cache=None):
     """Obtém coordenadas (lat, lon) de uma cidade"""
     if pd.isna(cidade) or cidade == '':
         return None, None
     
+    uf = None if uf is None or pd.isna(uf) else uf
+    cache = get_cache_geocodes() if cache is None else cache
+    
+    coords = cache.get((cidade, uf))
+    if coords is not None:
+        return coords
+    
+    from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+    
     try:
-        geolocator = Nominatim(user_agent="dashboard_frota", timeout=10)
-        
-        if uf and not pd.isna(uf):
-            location = geolocator.geocode(f"{cidade}, {uf}, Brasil")
-        else:
-            location = geolocator.geocode(f"{cidade}, Brasil")
-        
-        if location:
-            return location.latitude, location.longitude
-        
-        location = geolocator.geocode(f"{cidade}, Brasil")
-        if location:
-            return location.latitude, location.longitude
-        
-        return None, None
+        coords = _geocode_remoto(cidade, uf)
+        cache.set((cidade, uf), coords)
+        return coords
     
     except (GeocoderTimedOut, GeocoderServiceError):
+        # Falha temporária: não vai para o cache
         time.sleep(1)
         return None, None
     except Exception:
         return None, None
 
 
-def get_viagens_com_coords(df_viagens):
-    """Adiciona coordenadas às viagens - VERSÃO CORRIGIDA"""
+def cidades_unicas(df):
+    """Pares (cidade, uf) distintos entre origem e destinos 1 a 4"""
+    colunas = [('CIDADE_DE_PARTIDA', 'UF_PARTIDA')] + [
+        (f'CIDADE_DE_DESTINO_{i}', f'UF_DESTINO_{i}') for i in range(1, 5)
+    ]
+    
+    pares = set()
+    for col_cidade, col_uf in colunas:
+        if col_cidade not in df.columns:
+            continue
+        tmp = pd.DataFrame({
+            'cidade': df[col_cidade],
+            'uf': df[col_uf] if col_uf in df.columns else None
+        }).dropna(subset=['cidade']).drop_duplicates()
+        pares.update(tmp.itertuples(index=False, name=None))
+    
+    return pares
+
+
+@rastrear('geocodificacao/viagens')
+def get_viagens_com_coords(df_viagens, progresso=None, cache=None):
+    """Adiciona coordenadas às viagens - VERSÃO CORRIGIDA
+    
+    `progresso` é um callable opcional (feitas, total) chamado a cada cidade.
+    """
     df = df_viagens.copy()
     
     # Verificar se há dados
     if df.empty:
         return df, {}
     
-    # Lista de cidades únicas
-    cidades_unicas = set()
-    
-    # Coletar cidades de todas as viagens
-    for _, row in df.iterrows():
-        # Origem
-        if pd.notna(row.get('CIDADE_DE_PARTIDA')):
-            uf = row.get('UF_PARTIDA') if 'UF_PARTIDA' in df.columns else None
-            cidades_unicas.add((row['CIDADE_DE_PARTIDA'], uf))
-        
-        # Destinos (1 a 4)
-        for i in range(1, 5):
-            col_cidade = f'CIDADE_DE_DESTINO_{i}'
-            col_uf = f'UF_DESTINO_{i}'
-            if col_cidade in df.columns and pd.notna(row.get(col_cidade)):
-                uf = row.get(col_uf) if col_uf in df.columns else None
-                cidades_unicas.add((row[col_cidade], uf))
+    # Uma UF por cidade (a primeira encontrada)
+    cidades = {}
+    for cidade, uf in cidades_unicas(df):
+        if cidade:
+            cidades.setdefault(cidade, uf)
     
     # Geocodificar cidades únicas
     coords_cache = {}
-    for cidade, uf in cidades_unicas:
-        if cidade and cidade not in coords_cache:
-            lat, lon = geocode_cidade(cidade, uf)
-            coords_cache[cidade] = (lat, lon)
+    for feitas, (cidade, uf) in enumerate(cidades.items(), start=1):
+        coords_cache[cidade] = geocode_cidade(cidade, uf, cache=cache)
+        if progresso:
+            progresso(feitas, len(cidades))
     
     # Adicionar coordenadas ao dataframe
     df['lat_origem'] = df['CIDADE_DE_PARTIDA'].map(
@@ -218,52 +1121,1795 @@ def get_viagens_com_coords(df_viagens):
     return df, coords_cache
 
 
+def montar_paradas(viagem, coords_cache):
+    """Sequência de paradas (origem + destinos 1 a 4) com coordenadas de uma viagem"""
+    paradas = []
+    
+    # Origem
+    if pd.notna(viagem['lat_origem']) and pd.notna(viagem['lon_origem']):
+        paradas.append({
+            'nome': str(viagem['CIDADE_DE_PARTIDA']),
+            'lat': float(viagem['lat_origem']),
+            'lon': float(viagem['lon_origem'])
+        })
+    
+    # Destinos (1 a 4)
+    for i in range(1, 5):
+        col_cidade = f'CIDADE_DE_DESTINO_{i}'
+        if col_cidade in viagem.index and pd.notna(viagem[col_cidade]):
+            cidade = str(viagem[col_cidade])
+            if cidade in coords_cache:
+                lat, lon = coords_cache[cidade]
+                if lat and lon:
+                    paradas.append({
+                        'nome': cidade,
+                        'lat': float(lat),
+                        'lon': float(lon)
+                    })
+    
+    return paradas
+
+
 # ===================== ROTEAMENTO REAL =====================
 
-try:
-    import openrouteservice as ors
-    ORS_AVAILABLE = True
-except ImportError:
-    ORS_AVAILABLE = False
+# Importado só no primeiro roteador (o cliente ORS é pesado e nem toda página roteia)
+ORS_AVAILABLE = importlib.util.find_spec('openrouteservice') is not None
 
 
-@st.cache_data(ttl=86400)
-def get_rota_real(lat_origem, lon_origem, lat_destino, lon_destino, api_key):
-    """Obtém rota real pelas rodovias"""
-    if not ORS_AVAILABLE:
-        return [(lat_origem, lon_origem), (lat_destino, lon_destino)], None, None
+ORS_PERFIL = 'driving-hgv'
+ORS_BASE_URL = os.environ.get('ORS_BASE_URL', 'https://api.openrouteservice.org')
+ORS_MAX_PARALELO = int(os.environ.get('ORS_MAX_PARALELO', 4))
+ORS_COTA_MINUTO = int(os.environ.get('ORS_COTA_MINUTO', 40))    # Plano gratuito: 40/min
+ORS_COTA_DIA = int(os.environ.get('ORS_COTA_DIA', 2000))        # Plano gratuito: 2000/dia
+ORS_MAX_TENTATIVAS = 5
+ORS_MAX_ELEMENTOS_MATRIZ = 3500  # Limite de origens x destinos por requisição
+
+
+class CotaEsgotada(Exception):
+    """Cota diária de requisições do ORS esgotada"""
+
+
+class CotaRequisicoes:
+    """Contabiliza requisições por minuto e por dia (thread-safe)
     
-    try:
-        client = ors.Client(key=api_key)
-        
-        coords = [
-            [lon_origem, lat_origem],
-            [lon_destino, lat_destino]
-        ]
-        
-        route = client.directions(
-            coordinates=coords,
-            profile='driving-hgv',
-            format='geojson',
-            validate=False,
-            preference='recommended'
-        )
-        
-        geometry = route['features'][0]['geometry']['coordinates']
-        rota_coords = [(coord[1], coord[0]) for coord in geometry]
+    `adquirir()` bloqueia até haver espaço na janela de 1 minuto e respeita
+    pausas impostas por `pausar()` (ex.: após um HTTP 429).
+    """
+    
+    def __init__(self, por_minuto, por_dia):
+        self.por_minuto = por_minuto
+        self.por_dia = por_dia
+        self._lock = threading.Lock()
+        self._janela = deque()
+        self._dia = date.today()
+        self.usadas_hoje = 0
+        self.pausado_ate = 0.0
+        self.total_429 = 0
+    
+    def adquirir(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                
+                if date.today() != self._dia:
+                    self._dia = date.today()
+                    self.usadas_hoje = 0
+                
+                if self.usadas_hoje >= self.por_dia:
+                    raise CotaEsgotada(f"Cota diária de {self.por_dia} requisições atingida")
+                
+                while self._janela and agora - self._janela[0] >= 60:
+                    self._janela.popleft()
+                
+                if agora >= self.pausado_ate and len(self._janela) < self.por_minuto:
+                    self._janela.append(agora)
+                    self.usadas_hoje += 1
+                    return
+                
+                espera = max(
+                    self.pausado_ate - agora,
+                    60 - (agora - self._janela[0]) if len(self._janela) >= self.por_minuto else 0,
+                    0.05
+                )
+            time.sleep(espera)
+    
+    def pausar(self, segundos):
+        with self._lock:
+            self.total_429 += 1
+            self.pausado_ate = max(self.pausado_ate, time.monotonic() + segundos)
+    
+    def resumo(self):
+        with self._lock:
+            agora = time.monotonic()
+            return {
+                'ultimo_minuto': sum(1 for t in self._janela if agora - t < 60),
+                'por_minuto': self.por_minuto,
+                'hoje': self.usadas_hoje,
+                'por_dia': self.por_dia,
+                'http_429': self.total_429,
+            }
+
+
+NIVEIS_ZOOM_LOD = (5, 8, 11)  # Zooms com geometria simplificada pré-calculada
+
+
+def tolerancia_zoom(zoom, pixels=1.0):
+    """Tolerância (graus) equivalente a `pixels` de tela no nível de zoom dado"""
+    return pixels * 360 / (256 * 2 ** zoom)
+
+
+def simplificar_polilinha(coords, tolerancia):
+    """Simplificação de Douglas–Peucker vetorizada de uma polilinha [(lat, lon), ...]
+    
+    A distância de cada ponto à corda é calculada de uma vez com NumPy; só a
+    pilha de subdivisões é iterada. Retorna um array (N, 2) com os pontos mantidos.
+    """
+    pontos = np.asarray(coords, dtype=float)
+    n = len(pontos)
+    if n < 3:
+        return pontos
+    
+    # Longitude escalada pelo cosseno da latitude: distâncias ~isotrópicas
+    xy = pontos.copy()
+    xy[:, 1] *= np.cos(np.radians(pontos[:, 0].mean()))
+    
+    manter = np.zeros(n, dtype=bool)
+    manter[[0, -1]] = True
+    pilha = [(0, n - 1)]
+    
+    while pilha:
+        i, j = pilha.pop()
+        if j <= i + 1:
+            continue
         
-        properties = route['features'][0]['properties']
-        distancia_real = properties['segments'][0]['distance'] / 1000
-        tempo_estimado = properties['segments'][0]['duration'] / 3600
+        corda = xy[j] - xy[i]
+        rel = xy[i + 1:j] - xy[i]
+        comprimento = np.hypot(corda[0], corda[1])
+        if comprimento == 0:
+            dist = np.hypot(rel[:, 0], rel[:, 1])
+        else:
+            dist = np.abs(corda[0] * rel[:, 1] - corda[1] * rel[:, 0]) / comprimento
         
-        return rota_coords, distancia_real, tempo_estimado
+        k = int(np.argmax(dist))
+        if dist[k] > tolerancia:
+            k += i + 1
+            manter[k] = True
+            pilha.append((i, k))
+            pilha.append((k, j))
     
-    except Exception:
-        return [(lat_origem, lon_origem), (lat_destino, lon_destino)], None, None
+    return pontos[manter]
+
+
+def compactar_coords(coords):
+    """Geometria como array float32 contíguo (N, 2) — ~8 bytes por ponto"""
+    return np.ascontiguousarray(np.asarray(coords, dtype=np.float32).reshape(-1, 2))
+
+
+def decodificar_coords(coords):
+    """Lista [[lat, lon], ...] para desenhar (só no momento de renderizar)"""
+    if isinstance(coords, np.ndarray):
+        return coords.astype(float).tolist()
+    return coords
+
+
+def niveis_de_detalhe(coords):
+    """Geometrias simplificadas por nível de zoom (NIVEIS_ZOOM_LOD), em float32"""
+    niveis = {}
+    base = coords
+    # Do zoom mais próximo ao mais distante: cada nível parte do anterior
+    for zoom in sorted(NIVEIS_ZOOM_LOD, reverse=True):
+        base = simplificar_polilinha(base, tolerancia_zoom(zoom))
+        niveis[zoom] = compactar_coords(base)
+    return niveis
+
+
+def coords_para_zoom(trecho, zoom):
+    """Geometria decodificada adequada ao zoom (completa se não houver simplificação)"""
+    niveis = trecho.get('lod')
+    if not niveis:
+        return decodificar_coords(trecho['coords'])
+    candidatos = [z for z in niveis if z <= zoom]
+    return decodificar_coords(niveis[max(candidatos)] if candidatos else niveis[min(niveis)])
+
+
+def novo_trecho(coords, distancia, tempo):
+    """Entrada do cache de rotas: geometria completa (para distâncias) + níveis de detalhe
+    
+    As geometrias ficam em arrays float32; listas Python só são criadas ao desenhar.
+    """
+    coords = compactar_coords(coords)
+    return {
+        'coords': coords,
+        'lod': niveis_de_detalhe(coords),
+        'distancia': distancia,
+        'tempo': tempo
+    }
+
+
+def chave_trecho(origem, destino):
+    """Chave de um trecho no cache de rotas: coordenadas arredondadas (~1 m)"""
+    return (round(origem[0], 5), round(origem[1], 5), round(destino[0], 5), round(destino[1], 5))
+
+
+@st.cache_resource
+def get_cache_rotas():
+    """Cache de trechos roteados compartilhado por todas as sessões"""
+    return CacheLRU(max_itens=50000)
+
+
+def _trechos_linha_reta(paradas):
+    """Trechos em linha reta entre paradas consecutivas (sem distância/tempo)"""
+    return [
+        ([paradas[i], paradas[i + 1]], None, None)
+        for i in range(len(paradas) - 1)
+    ]
+
+
+def _dividir_rota_em_trechos(route, n_paradas):
+    """Divide a resposta de uma rota multi-paradas em trechos (um por par de paradas)"""
+    feature = route['features'][0]
+    # GeoJSON vem em (lon, lat): inverte as colunas direto no array compacto
+    geometry = compactar_coords(np.asarray(feature['geometry']['coordinates'])[:, 1::-1])
+    properties = feature['properties']
+    way_points = properties['way_points']
+    segmentos = properties['segments']
+    
+    if len(way_points) != n_paradas or len(segmentos) != n_paradas - 1:
+        raise ValueError("Resposta do ORS não corresponde às paradas enviadas")
+    
+    trechos = []
+    for i, segmento in enumerate(segmentos):
+        inicio, fim = way_points[i], way_points[i + 1]
+        trechos.append((
+            geometry[inicio:fim + 1],
+            segmento.get('distance', 0) / 1000,
+            segmento.get('duration', 0) / 3600
+        ))
+    return trechos
+
+
+class RoteadorORS:
+    """Cliente ORS único com pool de conexões, paralelismo limitado e controle de cota"""
+    
+    def __init__(self, api_key, base_url=ORS_BASE_URL, max_paralelo=ORS_MAX_PARALELO,
+                 por_minuto=ORS_COTA_MINUTO, por_dia=ORS_COTA_DIA):
+        import openrouteservice as ors
+        
+        self._erro_api = ors.exceptions.ApiError
+        self.client = ors.Client(
+            key=api_key or None,
+            base_url=base_url,
+            timeout=30,
+            retry_over_query_limit=False
+        )
+        
+        # Um slot de conexão HTTP por worker
+        sessao = getattr(self.client, '_session', None)
+        if sessao is not None:
+            import requests
+            adaptador = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_paralelo)
+            sessao.mount('http://', adaptador)
+            sessao.mount('https://', adaptador)
+        
+        self.cota = CotaRequisicoes(por_minuto, por_dia)
+        self.executor = ThreadPoolExecutor(max_workers=max_paralelo, thread_name_prefix='ors')
+    
+    def _chamar(self, metodo, **kwargs):
+        """Chama o ORS respeitando a cota, com backoff exponencial em HTTP 429"""
+        for tentativa in range(ORS_MAX_TENTATIVAS):
+            self.cota.adquirir()
+            try:
+                return getattr(self.client, metodo)(**kwargs)
+            except self._erro_api as e:
+                if e.status != 429 or tentativa == ORS_MAX_TENTATIVAS - 1:
+                    raise
+                self.cota.pausar(min(2 ** tentativa, 60))
+    
+    def rota_viagem(self, paradas):
+        """Trechos (coords, distancia_km, tempo_h) de uma viagem em uma única requisição"""
+        route = self._chamar(
+            'directions',
+            coordinates=[[lon, lat] for lat, lon in paradas],
+            profile=ORS_PERFIL,
+            format='geojson',
+            validate=False,
+            preference='recommended'
+        )
+        return _dividir_rota_em_trechos(route, len(paradas))
+    
+    def matriz(self, locations, sources, destinations):
+        """Bloco da matriz de distâncias (km) e tempos (h)"""
+        resposta = self._chamar(
+            'distance_matrix',
+            locations=locations,
+            profile=ORS_PERFIL,
+            sources=sources,
+            destinations=destinations,
+            metrics=['distance', 'duration'],
+            units='km',
+            validate=False
+        )
+        return (
+            np.array(resposta['distances'], dtype=float),
+            np.array(resposta['durations'], dtype=float) / 3600
+        )
+    
+    def calcular_viagens(self, viagens, cache=None):
+        """Roteia várias viagens em paralelo, gravando cada trecho no cache assim que chega
+        
+        `viagens` é um dict {id_viagem: [(lat, lon), ...]}. Gera (id_viagem, trechos)
+        conforme as requisições terminam; viagens com falha geram trechos em linha reta
+        (que não são gravados no cache). Para de enviar ao esgotar a cota diária.
+        """
+        cache = get_cache_rotas() if cache is None else cache
+        futuros = {
+            self.executor.submit(self.rota_viagem, paradas): (id_viagem, paradas)
+            for id_viagem, paradas in viagens.items()
+        }
+        
+        try:
+            for futuro in as_completed(futuros):
+                id_viagem, paradas = futuros[futuro]
+                try:
+                    trechos = futuro.result()
+                except CotaEsgotada:
+                    raise
+                except Exception:
+                    yield id_viagem, _trechos_linha_reta(paradas)
+                    continue
+                
+                for i, (coords, dist, tempo) in enumerate(trechos):
+                    cache.set(chave_trecho(paradas[i], paradas[i + 1]), novo_trecho(coords, dist, tempo))
+                yield id_viagem, trechos
+        finally:
+            for futuro in futuros:
+                futuro.cancel()
+
+
+@st.cache_resource
+def get_roteador(api_key):
+    """Roteador ORS compartilhado (um pool e uma cota por API Key)"""
+    if not ORS_AVAILABLE:
+        return None
+    return RoteadorORS(api_key)
+
+
+def blocos_de_pares(pares, max_elementos=ORS_MAX_ELEMENTOS_MATRIZ):
+    """Agrupa pares (origem, destino) em blocos de matriz com origens x destinos <= max_elementos
+    
+    Só as origens e destinos dos pares pedidos entram em cada bloco (nada de N x N).
+    """
+    destinos_por_origem = {}
+    for origem, destino in pares:
+        destinos_por_origem.setdefault(origem, set()).add(destino)
+    
+    blocos = []
+    origens, destinos = [], set()
+    for origem in sorted(destinos_por_origem):
+        novos = destinos | destinos_por_origem[origem]
+        if origens and (len(origens) + 1) * len(novos) > max_elementos:
+            blocos.append((origens, sorted(destinos)))
+            origens, novos = [], set(destinos_por_origem[origem])
+        origens.append(origem)
+        destinos = novos
+    if origens:
+        blocos.append((origens, sorted(destinos)))
+    return blocos
+
+
+@st.cache_resource
+def get_cache_distancias():
+    """(km, h) por trecho vindos do endpoint matrix (sem geometria), compartilhados entre sessões"""
+    return CacheLRU(max_itens=200000, ttl=86400)
+
+
+@rastrear('roteamento/trechos')
+def calcular_trechos_pendentes(sequencias, api_key, recalcular=False, progresso=None,
+                               roteador=None, cache=None):
+    """Roteia em paralelo as viagens com trechos ainda fora do cache compartilhado
+    
+    `sequencias` é um dict {id_viagem: [(lat, lon), ...]} e `progresso` um
+    callable opcional (concluidas, total). Retorna o número de viagens roteadas.
+    Propaga `CotaEsgotada` se a cota diária acabar no meio do lote.
+    """
+    cache = get_cache_rotas() if cache is None else cache
+    pendentes = {
+        id_viagem: paradas
+        for id_viagem, paradas in sequencias.items()
+        if len(paradas) >= 2 and (recalcular or any(
+            chave_trecho(a, b) not in cache for a, b in zip(paradas, paradas[1:])
+        ))
+    }
+    
+    roteador = get_roteador(api_key) if roteador is None else roteador
+    if not pendentes or roteador is None:
+        return 0
+    
+    for concluidas, _ in enumerate(roteador.calcular_viagens(pendentes, cache), start=1):
+        if progresso:
+            progresso(concluidas, len(pendentes))
+    
+    return len(pendentes)
+
+
+def trechos_da_viagem(paradas):
+    """Trechos de uma viagem lidos do cache compartilhado (linha reta se ausente)"""
+    cache = get_cache_rotas()
+    trechos = []
+    for origem, destino in zip(paradas, paradas[1:]):
+        trecho = cache.get(chave_trecho(origem, destino))
+        if trecho is None:
+            trecho = {'coords': compactar_coords([origem, destino]), 'distancia': None, 'tempo': None}
+        trechos.append(trecho)
+    return trechos
+
+
+def _pares_consecutivos(sequencias):
+    """Pares (origem, destino) distintos entre paradas consecutivas das viagens"""
+    return {(a, b) for paradas in sequencias.values() for a, b in zip(paradas, paradas[1:]) if a != b}
+
+
+@rastrear('roteamento/matriz')
+def calcular_distancias_pendentes(sequencias, api_key, roteador=None, cache=None):
+    """Distâncias rodoviárias dos trechos consecutivos ainda fora do cache, via endpoint matrix
+    
+    Trechos já roteados (cache de rotas) são copiados sem requisição. Os demais vão
+    em blocos paralelos só com as origens e destinos necessários; cada bloco é
+    gravado no cache assim que chega. Propaga `CotaEsgotada` (os blocos já pagos
+    ficam no cache); blocos com outra falha ficam de fora. Retorna o nº de trechos pedidos.
+    """
+    cache = get_cache_distancias() if cache is None else cache
+    rotas = get_cache_rotas()
+    pendentes = []
+    for origem, destino in _pares_consecutivos(sequencias):
+        chave = chave_trecho(origem, destino)
+        if chave in cache:
+            continue
+        trecho = rotas.get(chave)
+        if trecho is not None and trecho['distancia'] is not None:
+            cache.set(chave, (trecho['distancia'], trecho['tempo']))
+        else:
+            pendentes.append((origem, destino))
+    
+    roteador = get_roteador(api_key) if roteador is None else roteador
+    if not pendentes or roteador is None:
+        return 0
+    
+    def calcular_bloco(origens, destinos):
+        locations = [[float(lon), float(lat)] for lat, lon in origens + destinos]
+        return roteador.matriz(
+            locations,
+            list(range(len(origens))),
+            list(range(len(origens), len(locations)))
+        )
+    
+    futuros = {
+        roteador.executor.submit(calcular_bloco, origens, destinos): (origens, destinos)
+        for origens, destinos in blocos_de_pares(pendentes)
+    }
+    pedidos = set(pendentes)
+    esgotada = None
+    try:
+        for futuro in as_completed(futuros):
+            origens, destinos = futuros[futuro]
+            try:
+                distancias, tempos = futuro.result()
+            except CotaEsgotada as e:
+                # Não envia mais blocos, mas grava os que já estavam em voo
+                esgotada = esgotada or e
+                for pendente in futuros:
+                    pendente.cancel()
+                continue
+            except Exception:
+                continue
+            for i, origem in enumerate(origens):
+                for j, destino in enumerate(destinos):
+                    if (origem, destino) in pedidos and np.isfinite(distancias[i, j]):
+                        cache.set(chave_trecho(origem, destino), (float(distancias[i, j]), float(tempos[i, j])))
+    finally:
+        for futuro in futuros:
+            futuro.cancel()
+    
+    if esgotada is not None:
+        raise esgotada
+    return len(pendentes)
+
+
+def get_distancias_viagens(sequencias, cache=None):
+    """Soma a distância rodoviária (km) e o tempo (h) de cada viagem a partir do cache
+    
+    `sequencias` é um dict {id_viagem: [(lat, lon), ...]}. Retorna
+    {id_viagem: (distancia_km, tempo_h)}; viagens com algum trecho desconhecido ficam de fora.
+    """
+    cache = get_cache_distancias() if cache is None else cache
+    resultado = {}
+    for id_viagem, paradas in sequencias.items():
+        if len(paradas) < 2:
+            continue
+        distancia = tempo = 0.0
+        for origem, destino in zip(paradas, paradas[1:]):
+            if origem == destino:
+                continue
+            trecho = cache.get(chave_trecho(origem, destino))
+            if trecho is None:
+                break
+            distancia += trecho[0]
+            tempo += trecho[1] or 0
+        else:
+            resultado[id_viagem] = (distancia, tempo)
+    return resultado
+
+
+# ===================== PRÉ-AQUECIMENTO =====================
+
+ORS_API_KEY = os.environ.get('ORS_API_KEY', '')
+
+# Só carregados no primeiro uso; a pré-importação os traz para a memória depois do primeiro paint
+MODULOS_PESADOS = ('plotly.express', 'geopy.geocoders', 'openrouteservice', 'folium', 'streamlit_folium')
+
+
+@st.cache_resource
+def _preimportacao():
+    """Thread única por processo que importa os MODULOS_PESADOS em segundo plano"""
+    def importar():
+        for modulo in MODULOS_PESADOS:
+            try:
+                importlib.import_module(modulo)
+            except ImportError:
+                pass
+    
+    thread = threading.Thread(target=importar, name='preimportacao', daemon=True)
+    thread.start()
+    return thread
+
+
+def preimportar_modulos():
+    """Dispara a pré-importação (uma vez por processo); chamar ao fim da página"""
+    _preimportacao()
+
+
+def sequencias_de_paradas(df_com_coords, coords_cache):
+    """{id_viagem: [(lat, lon), ...]} das viagens com origem e destino geocodificados"""
+    df_mapa = df_com_coords.dropna(subset=['lat_origem', 'lon_origem', 'lat_destino', 'lon_destino'])
+    return {
+        int(viagem['ID_VIAGEM']): [(p['lat'], p['lon']) for p in montar_paradas(viagem, coords_cache)]
+        for _, viagem in df_mapa.iterrows()
+    }
+
+
+class PreaquecimentoCaches:
+    """Preenche os caches de coordenadas e rotas em segundo plano após o upload
+    
+    Os caches e o roteador são recebidos prontos porque a thread não tem
+    contexto de script do Streamlit.
+    """
+    
+    def __init__(self, conteudo, cache_geocodes, cache_rotas=None, roteador=None):
+        self.etapa = "Na fila"
+        self.feitas = 0
+        self.total = 0
+        self.cidades = 0
+        self.viagens = 0
+        self.erro = None
+        self.concluido = False
+        self._conteudo = conteudo
+        self._cache_geocodes = cache_geocodes
+        self._cache_rotas = cache_rotas
+        self._roteador = roteador
+        self._thread = threading.Thread(target=self._executar, name='preaquecimento', daemon=True)
+    
+    def iniciar(self):
+        self._thread.start()
+    
+    def _progresso(self, feitas, total):
+        self.feitas, self.total = feitas, total
+    
+    def _executar(self):
+        try:
+            self.etapa = "Lendo planilha"
+            df = pd.read_excel(io.BytesIO(self._conteudo), sheet_name='DADOS_VIAGEM')
+            
+            self.etapa = "Geocodificando cidades"
+            df_coords, coords_cache = get_viagens_com_coords(
+                df, progresso=self._progresso, cache=self._cache_geocodes
+            )
+            self.cidades = len(coords_cache)
+            
+            if self._roteador is not None:
+                self.etapa = "Calculando rotas"
+                self.feitas, self.total = 0, 0
+                sequencias = sequencias_de_paradas(df_coords, coords_cache)
+                self.viagens = calcular_trechos_pendentes(
+                    sequencias, None, progresso=self._progresso,
+                    roteador=self._roteador, cache=self._cache_rotas
+                )
+            
+            self.etapa = "Concluído"
+        except Exception as e:
+            self.erro = str(e)
+        finally:
+            self._conteudo = None  # O job pode continuar listado; os bytes do arquivo não
+            self.concluido = True
+
+
+PREAQUECIMENTO_MAX_JOBS = 8
+
+
+@st.cache_resource
+def _jobs_preaquecimento():
+    """Jobs de pré-aquecimento por conteúdo de arquivo (compartilhados entre sessões, LRU)"""
+    return CacheLRU(max_itens=PREAQUECIMENTO_MAX_JOBS)
+
+
+def iniciar_preaquecimento(uploaded_file):
+    """Dispara (uma vez por arquivo) o pré-aquecimento dos caches de geocodificação e rotas"""
+    # O hash do conteúdo (que junta uploads iguais de sessões diferentes) só é
+    # recalculado quando o upload muda, não a cada rerun
+    arquivo_id = getattr(uploaded_file, 'file_id', None)
+    anterior_id, hash_arquivo = st.session_state.get('preaquecimento_arquivo', (None, None))
+    if arquivo_id is None or arquivo_id != anterior_id:
+        hash_arquivo = hashlib.md5(uploaded_file.getvalue()).hexdigest()
+        st.session_state['preaquecimento_arquivo'] = (arquivo_id, hash_arquivo)
+    
+    api_key = st.session_state.get('ors_api_key') or ORS_API_KEY
+    chave = (hash_arquivo, bool(api_key))
+    st.session_state['preaquecimento'] = chave
+    
+    jobs = _jobs_preaquecimento()
+    if chave in jobs:
+        return
+    
+    job = PreaquecimentoCaches(
+        uploaded_file.getvalue(),
+        cache_geocodes=get_cache_geocodes(),
+        cache_rotas=get_cache_rotas() if api_key else None,
+        roteador=get_roteador(api_key) if api_key else None
+    )
+    jobs.set(chave, job)
+    job.iniciar()
+
+
+def _status_preaquecimento(job):
+    """Linha de status do pré-aquecimento na sidebar"""
+    if job.erro:
+        st.caption(f"⚠️ Pré-carregamento falhou: {job.erro}")
+    elif job.concluido:
+        texto = f"🔥 Mapa pré-carregado: {job.cidades} cidades"
+        if job.viagens:
+            texto += f" • {job.viagens} viagens roteadas"
+        st.caption(texto)
+    else:
+        fracao = job.feitas / job.total if job.total else 0.0
+        st.progress(fracao, text=f"🔥 {job.etapa}... {job.feitas}/{job.total}")
+
+
+def render_preaquecimento():
+    """Mostra na sidebar o progresso do pré-aquecimento da sessão atual"""
+    job = _jobs_preaquecimento().get(st.session_state.get('preaquecimento'))
+    if job is None:
+        return
+    
+    with st.sidebar:
+        if _fragmento is not None and not job.concluido:
+            _fragmento(run_every=2)(_status_preaquecimento)(job)
+        else:
+            _status_preaquecimento(job)
+
+
+# ===================== MAPA =====================
+
+PALETA_ARESTAS = ['#fdd49e', '#fdae61', '#f46d43', '#d73027', '#a50026']
+
+
+def colunas_paradas(df):
+    """Colunas de cidade das paradas em ordem: partida e destinos 1 a 4 presentes"""
+    return ['CIDADE_DE_PARTIDA'] + [
+        f'CIDADE_DE_DESTINO_{i}' for i in range(1, 5) if f'CIDADE_DE_DESTINO_{i}' in df.columns
+    ]
+
+
+def extrair_paradas(df):
+    """Tabela longa (ID_VIAGEM, ORDEM, CIDADE): origem com ORDEM 0 e destinos 1 a 4"""
+    colunas = colunas_paradas(df)
+    
+    longo = df[['ID_VIAGEM'] + colunas].melt(
+        id_vars='ID_VIAGEM', value_vars=colunas, var_name='COLUNA', value_name='CIDADE'
+    )
+    longo['ORDEM'] = longo['COLUNA'].map({col: i for i, col in enumerate(colunas)})
+    longo = longo.dropna(subset=['CIDADE'])
+    
+    return (longo.sort_values(['ID_VIAGEM', 'ORDEM'], kind='stable')
+            [['ID_VIAGEM', 'ORDEM', 'CIDADE']]
+            .reset_index(drop=True))
+
+
+def extrair_trechos(df, coords_cache):
+    """Um registro por trecho entre paradas consecutivas com coordenadas
+    
+    Cidades sem coordenadas são puladas, como em `montar_paradas`.
+    Colunas: ID_VIAGEM, TRECHO, ORIGEM, DESTINO, LAT_O, LON_O, LAT_D, LON_D.
+    """
+    colunas = ['ID_VIAGEM', 'TRECHO', 'ORIGEM', 'DESTINO', 'LAT_O', 'LON_O', 'LAT_D', 'LON_D']
+    if df.empty or not coords_cache:
+        return pd.DataFrame(columns=colunas)
+    
+    coords = pd.DataFrame(
+        [(cidade, lat, lon) for cidade, (lat, lon) in coords_cache.items() if lat and lon],
+        columns=['CIDADE', 'LAT', 'LON']
+    )
+    paradas = extrair_paradas(df).merge(coords, on='CIDADE', how='inner')
+    paradas = paradas.sort_values(['ID_VIAGEM', 'ORDEM'], kind='stable').reset_index(drop=True)
+    
+    proxima = paradas.groupby('ID_VIAGEM')[['CIDADE', 'LAT', 'LON']].shift(-1)
+    validos = proxima['CIDADE'].notna()
+    
+    trechos = pd.DataFrame({
+        'ID_VIAGEM': paradas.loc[validos, 'ID_VIAGEM'],
+        'ORIGEM': paradas.loc[validos, 'CIDADE'],
+        'DESTINO': proxima.loc[validos, 'CIDADE'],
+        'LAT_O': paradas.loc[validos, 'LAT'],
+        'LON_O': paradas.loc[validos, 'LON'],
+        'LAT_D': proxima.loc[validos, 'LAT'],
+        'LON_D': proxima.loc[validos, 'LON'],
+    })
+    trechos.insert(1, 'TRECHO', trechos.groupby('ID_VIAGEM').cumcount())
+    
+    return trechos[colunas].reset_index(drop=True)
+
+
+def agregar_arestas(df, trechos):
+    """Agrupa trechos idênticos (origem → destino) em arestas ponderadas
+    
+    KM e custo de cada viagem são rateados igualmente entre os seus trechos.
+    Colunas: ORIGEM, DESTINO, coordenadas, VIAGENS, KM, CUSTO e IDS (lista de viagens).
+    """
+    if trechos.empty:
+        return pd.DataFrame(columns=['ORIGEM', 'DESTINO', 'LAT_O', 'LON_O', 'LAT_D', 'LON_D',
+                                     'VIAGENS', 'KM', 'CUSTO', 'IDS'])
+    
+    n_trechos = trechos.groupby('ID_VIAGEM')['TRECHO'].transform('size')
+    viagens = df.drop_duplicates('ID_VIAGEM').set_index('ID_VIAGEM')
+    
+    tmp = trechos.assign(
+        KM=trechos['ID_VIAGEM'].map(viagens['KM_TOTAL_PERCORRIDO']).fillna(0) / n_trechos,
+        CUSTO=trechos['ID_VIAGEM'].map(viagens['GASTO_FINAL_TOTAL']).fillna(0) / n_trechos,
+    )
+    
+    arestas = tmp.groupby(['ORIGEM', 'DESTINO'], sort=False).agg(
+        LAT_O=('LAT_O', 'first'),
+        LON_O=('LON_O', 'first'),
+        LAT_D=('LAT_D', 'first'),
+        LON_D=('LON_D', 'first'),
+        VIAGENS=('ID_VIAGEM', 'nunique'),
+        KM=('KM', 'sum'),
+        CUSTO=('CUSTO', 'sum'),
+        IDS=('ID_VIAGEM', lambda ids: sorted(set(int(i) for i in ids))),
+    ).reset_index()
+    
+    return arestas.sort_values('VIAGENS', ascending=False).reset_index(drop=True)
+
+
+def feature_linha(coords, propriedades):
+    """Feature GeoJSON LineString a partir de [(lat, lon), ...]"""
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'LineString',
+            'coordinates': [[round(float(lon), 5), round(float(lat), 5)] for lat, lon in coords]
+        },
+        'properties': propriedades
+    }
+
+
+def geojson_arestas(arestas, metrica='VIAGENS', zoom=5, usar_rotas_reais=False):
+    """FeatureCollection com uma LineString por aresta e estilo derivado da `metrica`
+    
+    Com rotas reais, usa a geometria do cache (no nível de detalhe do zoom).
+    """
+    if arestas.empty:
+        return {'type': 'FeatureCollection', 'features': []}
+    
+    valores = arestas[metrica].astype(float).to_numpy()
+    maximo = valores.max() if valores.max() > 0 else 1.0
+    pesos = valores / maximo
+    faixas = np.minimum((pesos * len(PALETA_ARESTAS)).astype(int), len(PALETA_ARESTAS) - 1)
+    
+    cache = get_cache_rotas() if usar_rotas_reais else None
+    features = []
+    for aresta, peso, faixa in zip(arestas.itertuples(index=False), pesos, faixas):
+        origem, destino = (aresta.LAT_O, aresta.LON_O), (aresta.LAT_D, aresta.LON_D)
+        trecho = cache.get(chave_trecho(origem, destino)) if cache is not None else None
+        coords = coords_para_zoom(trecho, zoom) if trecho else [origem, destino]
+        
+        features.append(feature_linha(coords, {
+            'origem': str(aresta.ORIGEM),
+            'destino': str(aresta.DESTINO),
+            'viagens': int(aresta.VIAGENS),
+            'km': round(float(aresta.KM)),
+            'custo': round(float(aresta.CUSTO), 2),
+            'cor': PALETA_ARESTAS[faixa],
+            'espessura': round(2 + 8 * float(peso), 1),
+        }))
+    
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+CORES_MOTORISTAS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#FFA07A', '#98D8C8', '#F38181', '#AA96DA', '#95E1D3']
+
+
+def hash_conteudo(*partes):
+    """Hash estável (hex) de DataFrames/Series/arrays e valores simples
+    
+    DataFrames e Series entram com nomes e dtypes das colunas (o hash do pandas
+    só vê os valores), arrays com dtype e formato.
+    """
+    h = hashlib.sha1()
+    for parte in partes:
+        if isinstance(parte, pd.DataFrame):
+            h.update(repr([(col, str(tipo)) for col, tipo in parte.dtypes.items()]).encode())
+            h.update(pd.util.hash_pandas_object(parte, index=False).to_numpy().tobytes())
+        elif isinstance(parte, pd.Series):
+            h.update(repr((parte.name, str(parte.dtype))).encode())
+            h.update(pd.util.hash_pandas_object(parte, index=False).to_numpy().tobytes())
+        elif isinstance(parte, np.ndarray):
+            h.update(repr((str(parte.dtype), parte.shape)).encode())
+            h.update(np.ascontiguousarray(parte).tobytes())
+        else:
+            h.update(repr(parte).encode())
+        h.update(b'|')
+    return h.hexdigest()
+
+
+def hash_viagens(df):
+    """Hash do conjunto de viagens (IDs ordenados) — não depende da ordem das linhas"""
+    return hash_conteudo(df['ID_VIAGEM'].sort_values(kind='stable').reset_index(drop=True))
+
+
+MAPAS_MAX_MB = float(os.environ.get('MAPAS_MAX_MB', 256))  # Cada entrada é um folium.Map inteiro
+
+
+@st.cache_resource
+def get_cache_mapas():
+    """Mapas prontos por (viagens, modo de rota, estilo), compartilhados entre sessões"""
+    return CacheLRU(max_itens=16, max_bytes=MAPAS_MAX_MB * 2**20)
+
+
+@rastrear('agregacao/cidades')
+def agregar_por_cidade(df):
+    """KM, combustível, dias e visitas por cidade (origem e destinos 1 a 4)
+    
+    Cada parada soma os totais da viagem inteira, como na página Por Cidade.
+    """
+    paradas = extrair_paradas(df)
+    totais = df.drop_duplicates('ID_VIAGEM').set_index('ID_VIAGEM')[
+        ['KM_TOTAL_PERCORRIDO', 'CUSTO_TOTAL_COMBUSTIVEL', 'DIAS_TOTAL_VIAGEM']
+    ]
+    
+    agregado = paradas.join(totais, on='ID_VIAGEM').groupby('CIDADE').agg(
+        km=('KM_TOTAL_PERCORRIDO', 'sum'),
+        combustivel=('CUSTO_TOTAL_COMBUSTIVEL', 'sum'),
+        dias=('DIAS_TOTAL_VIAGEM', 'sum'),
+        visitas=('ID_VIAGEM', 'size'),
+    ).reset_index()
+    agregado.columns = ['Cidade', 'KM Total', 'Custo Combustível', 'Dias Total', 'Visitas']
+    
+    return agregado.sort_values('KM Total', ascending=False)
+
+
+@rastrear('mapa/visitas')
+def contar_visitas_por_cidade(df, coords_cache):
+    """Visitas por cidade considerando TODAS as paradas (origem + destinos)"""
+    contagem = extrair_paradas(df)['CIDADE'].value_counts()
+    return {cidade: int(contagem.get(cidade, 0)) for cidade in coords_cache}
+
+
+def cores_por_motorista(df):
+    """Cor fixa por motorista, na ordem em que aparecem"""
+    return {
+        motorista: CORES_MOTORISTAS[i % len(CORES_MOTORISTAS)]
+        for i, motorista in enumerate(df['MOTORISTA'].unique().tolist())
+    }
+
+
+def _legenda_mapa(cores_motoristas, total_trechos, arestas, rota_real):
+    """HTML fixo da legenda (motoristas + estatísticas)"""
+    legenda_html = f'''
+        <div style="position: fixed; 
+                    bottom: 50px; right: 50px; 
+                    background-color: white; 
+                    border: 2px solid grey; 
+                    border-radius: 5px;
+                    padding: 10px;
+                    font-size: 14px;
+                    z-index: 9999;
+                    box-shadow: 0 2px 4px rgba(0,0,0,0.2);">
+            <b>🚗 Motoristas ({len(cores_motoristas)})</b><br>
+        '''
+    for motorista, cor in cores_motoristas.items():
+        legenda_html += f'<span style="color: {cor}; font-size: 18px;">●</span> {motorista}<br>'
+    
+    legenda_html += '<hr style="margin: 5px 0;">'
+    legenda_html += f'<b>📊 Estatísticas:</b><br>'
+    legenda_html += f'Trechos totais: {total_trechos}<br>'
+    if arestas is not None:
+        legenda_html += f'Arestas distintas: {len(arestas)}<br>'
+    
+    if rota_real:
+        legenda_html += f'<span style="color: green;">🛣️</span> Rotas reais ativas<br>'
+    else:
+        legenda_html += f'<span style="color: gray;">📏</span> Linhas retas<br>'
+    
+    legenda_html += '</div>'
+    return legenda_html
+
+
+ZOOM_MARCADORES = 9  # Nas camadas de densidade, marcadores individuais só a partir deste zoom
+PALETA_DENSIDADE = ['#ffffcc', '#c7e9b4', '#7fcdbb', '#41b6c4', '#2c7fb8', '#253494']
+
+
+def pontos_de_parada(df, coords_cache):
+    """Uma linha por parada com coordenadas e pesos (VISITAS, KM, CUSTO)
+    
+    KM e custo de cada viagem são rateados igualmente entre as suas paradas.
+    """
+    coords = pd.DataFrame(
+        [(cidade, lat, lon) for cidade, (lat, lon) in coords_cache.items() if lat and lon],
+        columns=['CIDADE', 'LAT', 'LON']
+    )
+    paradas = extrair_paradas(df).merge(coords, on='CIDADE', how='inner')
+    if paradas.empty:
+        return paradas.assign(VISITAS=[], KM=[], CUSTO=[])
+    
+    n_paradas = paradas.groupby('ID_VIAGEM')['ORDEM'].transform('size')
+    viagens = df.drop_duplicates('ID_VIAGEM').set_index('ID_VIAGEM')
+    
+    return paradas.assign(
+        VISITAS=1.0,
+        KM=paradas['ID_VIAGEM'].map(viagens['KM_TOTAL_PERCORRIDO']).fillna(0) / n_paradas,
+        CUSTO=paradas['ID_VIAGEM'].map(viagens['GASTO_FINAL_TOTAL']).fillna(0) / n_paradas,
+    )
+
+
+def hexbin(lat, lon, pesos, raio):
+    """Agrupa pontos em hexágonos de `raio` graus (vetorizado)
+    
+    Usa coordenadas axiais com arredondamento cúbico sobre uma projeção
+    equiretangular (longitude escalada pelo cosseno da latitude média).
+    Retorna DataFrame com Q, R, LAT, LON (centro), PESO e PONTOS por hexágono,
+    e a escala de longitude usada (para desenhar os polígonos).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    pesos = np.asarray(pesos, dtype=float)
+    escala = np.cos(np.radians(lat.mean())) if len(lat) else 1.0
+    
+    # Hexágonos "pointy-top": x = leste, y = norte
+    x = lon * escala / raio
+    y = lat / raio
+    q = (np.sqrt(3) / 3) * x - y / 3
+    r = (2 / 3) * y
+    
+    # Arredondamento cúbico
+    cx, cz = q, r
+    cy = -cx - cz
+    rx, ry, rz = np.round(cx), np.round(cy), np.round(cz)
+    dx, dy, dz = np.abs(rx - cx), np.abs(ry - cy), np.abs(rz - cz)
+    ajusta_x = (dx > dy) & (dx > dz)
+    ajusta_z = ~ajusta_x & (dz >= dy)
+    rx = np.where(ajusta_x, -ry - rz, rx)
+    rz = np.where(ajusta_z, -rx - ry, rz)
+    
+    chaves = np.stack([rx, rz], axis=1).astype(np.int64)
+    unicas, inverso = np.unique(chaves, axis=0, return_inverse=True)
+    inverso = inverso.ravel()
+    
+    qh, rh = unicas[:, 0].astype(float), unicas[:, 1].astype(float)
+    return pd.DataFrame({
+        'Q': unicas[:, 0],
+        'R': unicas[:, 1],
+        'LAT': 1.5 * rh * raio,
+        'LON': np.sqrt(3) * (qh + rh / 2) * raio / escala,
+        'PESO': np.bincount(inverso, weights=pesos, minlength=len(unicas)),
+        'PONTOS': np.bincount(inverso, minlength=len(unicas)),
+    }), escala
+
+
+def geojson_hexagonos(bins, raio, escala):
+    """FeatureCollection de polígonos hexagonais coloridos por faixa de peso"""
+    if bins.empty:
+        return {'type': 'FeatureCollection', 'features': []}
+    
+    angulos = np.radians(np.arange(6) * 60 + 30)
+    dlat = raio * np.sin(angulos)
+    dlon = raio * np.cos(angulos) / escala
+    
+    pesos = bins['PESO'].to_numpy()
+    maximo = pesos.max() if pesos.max() > 0 else 1.0
+    faixas = np.minimum((pesos / maximo * len(PALETA_DENSIDADE)).astype(int), len(PALETA_DENSIDADE) - 1)
+    
+    features = []
+    for (lat, lon, peso, pontos), faixa in zip(bins[['LAT', 'LON', 'PESO', 'PONTOS']].itertuples(index=False), faixas):
+        anel = [[round(lon + a, 5), round(lat + b, 5)] for a, b in zip(dlon, dlat)]
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [anel + anel[:1]]},
+            'properties': {
+                'peso': round(float(peso), 1),
+                'paradas': int(pontos),
+                'cor': PALETA_DENSIDADE[faixa],
+            }
+        })
+    
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def camada_por_zoom(mapa, camada, zoom_min=0, zoom_max=30):
+    """Mostra a camada só entre `zoom_min` e `zoom_max` (alternada no navegador)"""
+    from branca.element import MacroElement
+    from jinja2 import Template
+    
+    controle = MacroElement()
+    controle._template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var mapa = {{ this.mapa }}, camada = {{ this.camada }};
+            function ajustar() {
+                var z = mapa.getZoom();
+                var visivel = z >= {{ this.zoom_min }} && z <= {{ this.zoom_max }};
+                if (visivel && !mapa.hasLayer(camada)) { mapa.addLayer(camada); }
+                if (!visivel && mapa.hasLayer(camada)) { mapa.removeLayer(camada); }
+            }
+            mapa.on('zoomend', ajustar);
+            ajustar();
+        })();
+        {% endmacro %}
+    """)
+    controle.mapa = mapa.get_name()
+    controle.camada = camada.get_name()
+    controle.zoom_min = zoom_min
+    controle.zoom_max = zoom_max
+    mapa.add_child(controle)
+
+
+def adicionar_camada_densidade(mapa, pontos, modo, peso='VISITAS', zoom=5):
+    """Camada agregada de paradas: 'hexagonos' (hexbin) ou 'calor' (heatmap)"""
+    import folium
+    from folium.plugins import HeatMap
+    
+    if pontos.empty:
+        return
+    
+    raio = tolerancia_zoom(zoom, pixels=18)
+    bins, escala = hexbin(pontos['LAT'], pontos['LON'], pontos[peso], raio)
+    
+    if modo == 'calor':
+        # Pontos já agregados por hexágono: o navegador recebe poucos pontos
+        maximo = bins['PESO'].max() or 1.0
+        HeatMap(
+            bins[['LAT', 'LON', 'PESO']].assign(PESO=bins['PESO'] / maximo).round(5).values.tolist(),
+            name="Densidade de paradas",
+            radius=25,
+            blur=20,
+            min_opacity=0.3
+        ).add_to(mapa)
+    else:
+        folium.GeoJson(
+            geojson_hexagonos(bins, raio, escala),
+            name="Densidade de paradas",
+            style_function=lambda f: {
+                'fillColor': f['properties']['cor'],
+                'color': '#555555',
+                'weight': 0.5,
+                'fillOpacity': 0.6
+            },
+            tooltip=folium.GeoJsonTooltip(fields=['paradas', 'peso'], aliases=['Paradas', peso.title()])
+        ).add_to(mapa)
+
+
+# Faixas de zoom (mín, máx) com agrupamentos pré-calculados; acima delas, marcadores individuais
+FAIXAS_AGRUPAMENTO = ((0, 5), (6, 7), (8, ZOOM_MARCADORES - 1))
+TAMANHO_GRUPO_PX = 60
+
+
+def agrupar_por_grade(lat, lon, pesos, tamanho):
+    """Índice espacial em grade: agrupa pontos em células de `tamanho` graus
+    
+    Retorna o DataFrame de grupos (LAT/LON = centro ponderado, PESO, MEMBROS)
+    e o índice do grupo de cada ponto.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    pesos = np.asarray(pesos, dtype=float)
+    
+    celulas = np.floor(np.stack([lat, lon], axis=1) / tamanho).astype(np.int64)
+    unicas, grupo = np.unique(celulas, axis=0, return_inverse=True)
+    grupo = grupo.ravel()
+    
+    n = len(unicas)
+    soma = np.bincount(grupo, weights=pesos, minlength=n)
+    divisor = np.where(soma > 0, soma, 1.0)
+    return pd.DataFrame({
+        'LAT': np.bincount(grupo, weights=lat * pesos, minlength=n) / divisor,
+        'LON': np.bincount(grupo, weights=lon * pesos, minlength=n) / divisor,
+        'PESO': soma,
+        'MEMBROS': np.bincount(grupo, minlength=n),
+    }), grupo
+
+
+def adicionar_agrupamentos(mapa, visitas_por_cidade, coords_cache):
+    """Uma camada de grupos de cidades por faixa de zoom, com soma de visitas"""
+    import folium
+    
+    cidades = [
+        (cidade, lat, lon, visitas)
+        for cidade, visitas in visitas_por_cidade.items()
+        if visitas > 0
+        for lat, lon in [coords_cache.get(cidade, (None, None))]
+        if lat and lon
+    ]
+    if not cidades:
+        return
+    
+    _, lat, lon, visitas = (np.array(col) for col in zip(*cidades))
+    
+    for zoom_min, zoom_max in FAIXAS_AGRUPAMENTO:
+        grupos, _ = agrupar_por_grade(lat, lon, visitas, tolerancia_zoom(zoom_max, pixels=TAMANHO_GRUPO_PX))
+        camada = folium.FeatureGroup(name=f"Grupos (zoom {zoom_min}-{zoom_max})")
+        
+        for grupo in grupos.itertuples(index=False):
+            total = int(grupo.PESO)
+            tamanho = int(24 + 8 * np.log10(max(total, 1)))
+            folium.Marker(
+                location=[round(grupo.LAT, 5), round(grupo.LON, 5)],
+                icon=folium.DivIcon(
+                    html=(f'<div style="width:{tamanho}px;height:{tamanho}px;line-height:{tamanho}px;'
+                          f'border-radius:50%;background:rgba(31,119,180,0.75);color:white;'
+                          f'text-align:center;font-size:11px;font-weight:bold;">{total}</div>'),
+                    icon_size=(tamanho, tamanho),
+                    icon_anchor=(tamanho // 2, tamanho // 2)
+                ),
+                tooltip=f"{int(grupo.MEMBROS)} cidades • {total} visitas"
+            ).add_to(camada)
+        
+        camada.add_to(mapa)
+        camada_por_zoom(mapa, camada, zoom_min=zoom_min, zoom_max=zoom_max)
+
+
+PERIODOS_LINHA_DO_TEMPO = {'D': 'P1D', 'W': 'P7D'}
+
+
+def frames_da_frota(df, periodo='D'):
+    """Fatia as viagens em quadros diários ('D') ou semanais ('W'), uma única vez
+    
+    Estrutura compacta indexada no tempo:
+    - 'inicios': início de cada quadro (datetime64)
+    - 'ids', 'ini', 'fim': por viagem, índice (int32) do primeiro e do último quadro
+    - 'ativas': viagens em andamento em cada quadro (int32)
+    """
+    inicio = df['DATA_INICIO_VIAGEM'].dt.to_period(periodo).dt.start_time
+    fim = df['DATA_RETORNO'].dt.to_period(periodo).dt.start_time
+    fim = fim.where(fim >= inicio, inicio)
+    
+    passo = pd.Timedelta(days=7 if periodo == 'W' else 1)
+    inicios = pd.date_range(inicio.min(), fim.max(), freq=passo).to_numpy()
+    
+    ini = np.searchsorted(inicios, inicio.to_numpy()).astype(np.int32)
+    fim_idx = np.searchsorted(inicios, fim.to_numpy()).astype(np.int32)
+    
+    # Viagens ativas por quadro: +1 no início, -1 após o fim, soma acumulada
+    delta = np.zeros(len(inicios) + 1, dtype=np.int32)
+    np.add.at(delta, ini, 1)
+    np.add.at(delta, fim_idx + 1, -1)
+    
+    return {
+        'periodo': periodo,
+        'inicios': inicios,
+        'ids': df['ID_VIAGEM'].to_numpy(),
+        'ini': ini,
+        'fim': fim_idx,
+        'ativas': np.cumsum(delta[:-1]).astype(np.int32),
+    }
+
+
+def geojson_linha_do_tempo(df_mapa, coords_cache, frames, cores_motoristas, rota_real=False, zoom=5):
+    """Uma LineString por viagem com um instante por vértice (TimestampedGeoJson)
+    
+    O percurso é distribuído linearmente entre o primeiro e o último quadro da
+    viagem, então o navegador anima a frota sem reconstruir o mapa.
+    """
+    rotulos = pd.DatetimeIndex(frames['inicios']).strftime('%Y-%m-%d').to_numpy()
+    posicao = {id_viagem: k for k, id_viagem in enumerate(frames['ids'])}
+    
+    features = []
+    for _, viagem in df_mapa.iterrows():
+        k = posicao.get(viagem['ID_VIAGEM'])
+        pontos = [(p['lat'], p['lon']) for p in montar_paradas(viagem, coords_cache)]
+        if k is None or len(pontos) < 2:
+            continue
+        
+        if rota_real:
+            partes = [coords_para_zoom(t, zoom) for t in trechos_da_viagem(pontos)]
+            coords = [tuple(c) for parte in partes for c in parte]
+        else:
+            coords = pontos
+        
+        ini, fim = int(frames['ini'][k]), int(frames['fim'][k])
+        fracao = np.linspace(0, 1, len(coords))
+        quadros = ini + np.floor(fracao * (fim - ini + 0.999)).astype(int)
+        
+        feature = feature_linha(coords, {
+            'times': rotulos[np.minimum(quadros, fim)].tolist(),
+            'style': {'color': cores_motoristas.get(viagem['MOTORISTA'], '#1f77b4'), 'weight': 3},
+            'popup': f"Viagem #{int(viagem['ID_VIAGEM'])}",
+        })
+        features.append(feature)
+    
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+@rastrear('mapa/construir')
+def construir_mapa(df_mapa, coords_cache, agregar=False, metrica='VIAGENS', rota_real=False, zoom=5,
+                   camada_paradas='marcadores', peso_paradas='VISITAS', linha_do_tempo=None):
+    """Monta o mapa folium completo (paradas, rotas e legenda)
+    
+    Rotas reais são lidas só do cache compartilhado: rotear antes com
+    `calcular_trechos_pendentes`. `camada_paradas` é 'marcadores', 'agrupados',
+    'hexagonos' ou 'calor'; nas três últimas os marcadores individuais só
+    aparecem a partir de ZOOM_MARCADORES. Com `linha_do_tempo` ('D' ou 'W'),
+    as rotas viram uma camada animada por quadros diários/semanais. Retorna um
+    dict com o mapa e os dados derivados que a página reaproveita (visitas,
+    cores, trechos, arestas, quadros).
+    """
+    import folium
+    from folium.plugins import TimestampedGeoJson
+    
+    center_lat = float(df_mapa[['lat_origem', 'lat_destino']].mean().mean())
+    center_lon = float(df_mapa[['lon_origem', 'lon_destino']].mean().mean())
+    
+    m = folium.Map(
+        location=[center_lat, center_lon],
+        zoom_start=zoom,
+        tiles='OpenStreetMap'
+    )
+    
+    visitas_por_cidade = contar_visitas_por_cidade(df_mapa, coords_cache)
+    
+    if camada_paradas == 'agrupados':
+        adicionar_agrupamentos(m, visitas_por_cidade, coords_cache)
+    elif camada_paradas != 'marcadores':
+        adicionar_camada_densidade(m, pontos_de_parada(df_mapa, coords_cache), camada_paradas,
+                                   peso=peso_paradas, zoom=zoom)
+    
+    # Marcadores das cidades
+    marcadores = folium.FeatureGroup(name="Cidades")
+    for cidade, (lat, lon) in coords_cache.items():
+        if lat and lon:
+            visitas = visitas_por_cidade.get(cidade, 0)
+            
+            if visitas > 0:  # Só mostrar cidades com visitas
+                radius = float(5 + (visitas * 2))
+                
+                folium.CircleMarker(
+                    location=[float(lat), float(lon)],
+                    radius=radius,
+                    popup=folium.Popup(f"<b>{cidade}</b><br>{visitas} visitas", max_width=200),
+                    tooltip=str(cidade),
+                    color='#1f77b4',
+                    fill=True,
+                    fillColor='#1f77b4',
+                    fillOpacity=0.6
+                ).add_to(marcadores)
+    marcadores.add_to(m)
+    
+    cores_motoristas = cores_por_motorista(df_mapa)
+    arestas = None
+    frames = None
+    
+    if linha_do_tempo:
+        # Linha do tempo: quadros pré-calculados, reprodução inteira no navegador
+        frames = frames_da_frota(df_mapa, linha_do_tempo)
+        dados = geojson_linha_do_tempo(df_mapa, coords_cache, frames, cores_motoristas,
+                                       rota_real=rota_real, zoom=zoom)
+        total_trechos = len(extrair_trechos(df_mapa, coords_cache))
+        periodo = PERIODOS_LINHA_DO_TEMPO[linha_do_tempo]
+        
+        TimestampedGeoJson(
+            dados,
+            period=periodo,
+            duration=periodo,
+            add_last_point=False,
+            auto_play=False,
+            loop=False,
+            date_options='DD/MM/YYYY',
+            time_slider_drag_update=True
+        ).add_to(m)
+    elif agregar:
+        # Arestas agregadas: uma camada GeoJSON
+        trechos = extrair_trechos(df_mapa, coords_cache)
+        arestas = agregar_arestas(df_mapa, trechos)
+        total_trechos = len(trechos)
+        
+        folium.GeoJson(
+            geojson_arestas(arestas, metrica=metrica, zoom=zoom, usar_rotas_reais=rota_real),
+            name="Arestas",
+            style_function=lambda f: {
+                'color': f['properties']['cor'],
+                'weight': f['properties']['espessura'],
+                'opacity': 0.8
+            },
+            tooltip=folium.GeoJsonTooltip(
+                fields=['origem', 'destino', 'viagens', 'km', 'custo'],
+                aliases=['Origem', 'Destino', 'Viagens', 'KM', 'Custo (R$)']
+            )
+        ).add_to(m)
+    else:
+        # Trechos individuais: GeoJSON leve, detalhe sob demanda
+        features = []
+        total_trechos = 0
+        
+        for _, viagem in df_mapa.iterrows():
+            cor = cores_motoristas.get(viagem['MOTORISTA'], '#1f77b4')
+            id_viagem = int(viagem['ID_VIAGEM'])
+            
+            pontos = [(p['lat'], p['lon']) for p in montar_paradas(viagem, coords_cache)]
+            
+            # Se não tem paradas suficientes, pular
+            if len(pontos) < 2:
+                continue
+            
+            if rota_real:
+                # Geometria simplificada para o mapa; a completa fica no cache
+                geometrias = [coords_para_zoom(t, zoom) for t in trechos_da_viagem(pontos)]
+            else:
+                geometrias = [[a, b] for a, b in zip(pontos, pontos[1:])]
+            
+            # Só ID da viagem e índice do trecho: o detalhe vem no clique
+            for i, coords in enumerate(geometrias):
+                features.append(feature_linha(coords, {'id_viagem': id_viagem, 'trecho': i + 1, 'cor': cor}))
+            total_trechos += len(geometrias)
+        
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features},
+            name="Trechos",
+            style_function=lambda f: {
+                'color': f['properties']['cor'],
+                'weight': 3 if rota_real else 2,
+                'opacity': 0.7
+            },
+            tooltip=folium.GeoJsonTooltip(fields=['id_viagem', 'trecho'], aliases=['Viagem #', 'Trecho'])
+        ).add_to(m)
+    
+    if camada_paradas != 'marcadores':
+        camada_por_zoom(m, marcadores, zoom_min=ZOOM_MARCADORES)
+    
+    m.get_root().html.add_child(folium.Element(
+        _legenda_mapa(cores_motoristas, total_trechos, arestas, rota_real)
+    ))
+    
+    return {
+        'mapa': m,
+        'visitas_por_cidade': visitas_por_cidade,
+        'cores_motoristas': cores_motoristas,
+        'total_trechos': total_trechos,
+        'arestas': arestas,
+        'frames': frames,
+    }
+
+
+# ===================== FILTRO GEOGRÁFICO =====================
+
+REGIOES_UF = {
+    'Norte': ['AC', 'AP', 'AM', 'PA', 'RO', 'RR', 'TO'],
+    'Nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
+    'Centro-Oeste': ['DF', 'GO', 'MT', 'MS'],
+    'Sudeste': ['ES', 'MG', 'RJ', 'SP'],
+    'Sul': ['PR', 'RS', 'SC'],
+}
+RAIO_TERRA_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distância de grande círculo (km), vetorizada com NumPy"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class IndiceEspacial:
+    """Índice em grade (baldes de `celula` graus) sobre as cidades geocodificadas
+    
+    Consultas por raio só avaliam as cidades dos baldes que tocam o
+    retângulo envolvente do círculo, com distâncias vetorizadas.
+    """
+    
+    def __init__(self, coords, celula=1.0):
+        validas = [(cidade, lat, lon) for cidade, (lat, lon) in coords.items() if lat and lon]
+        self.celula = celula
+        self.cidades = np.array([c for c, _, _ in validas], dtype=object)
+        self.lat = np.array([lat for _, lat, _ in validas], dtype=float)
+        self.lon = np.array([lon for _, _, lon in validas], dtype=float)
+        
+        self._baldes = {}
+        chaves = np.floor(np.stack([self.lat, self.lon], axis=1) / celula).astype(np.int64) if validas else []
+        for i, (bi, bj) in enumerate(chaves):
+            self._baldes.setdefault((int(bi), int(bj)), []).append(i)
+        self._baldes = {k: np.array(v) for k, v in self._baldes.items()}
+    
+    def _candidatos(self, lat_min, lat_max, lon_min, lon_max):
+        i0, i1 = int(np.floor(lat_min / self.celula)), int(np.floor(lat_max / self.celula))
+        j0, j1 = int(np.floor(lon_min / self.celula)), int(np.floor(lon_max / self.celula))
+        partes = [
+            self._baldes[(i, j)]
+            for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)
+            if (i, j) in self._baldes
+        ]
+        return np.concatenate(partes) if partes else np.array([], dtype=int)
+    
+    def no_raio(self, lat, lon, raio_km):
+        """Cidades a até `raio_km` de (lat, lon)"""
+        dlat = np.degrees(raio_km / RAIO_TERRA_KM)
+        dlon = dlat / max(np.cos(np.radians(lat)), 0.01)
+        idx = self._candidatos(lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+        dentro = haversine_km(lat, lon, self.lat[idx], self.lon[idx]) <= raio_km
+        return set(self.cidades[idx[dentro]])
+
+
+@st.cache_resource
+def _cache_indices():
+    """Índices espaciais e mapas viagem–cidade por hash de conteúdo"""
+    return CacheLRU(max_itens=8)
+
+
+def coords_conhecidas(df):
+    """Coordenadas já presentes no cache compartilhado (sem consultar a rede)"""
+    cache = get_cache_geocodes()
+    coords = {}
+    for cidade, uf in cidades_unicas(df):
+        uf = None if uf is None or pd.isna(uf) else uf
+        latlon = cache.get((cidade, uf))
+        if latlon and latlon[0] is not None and cidade not in coords:
+            coords[cidade] = latlon
+    return coords
+
+
+def get_indice_espacial(coords):
+    """Índice espacial memoizado pelo conteúdo de `coords`"""
+    chave = ('indice', hash_conteudo(sorted(coords.items())))
+    indice = _cache_indices().get(chave)
+    if indice is None:
+        indice = IndiceEspacial(coords)
+        _cache_indices().set(chave, indice)
+    return indice
+
+
+def viagens_por_cidade(df):
+    """{cidade: array de ID_VIAGEM} a partir de todas as paradas (memoizado)"""
+    chave = ('viagens', hash_conteudo(df[['ID_VIAGEM'] + colunas_paradas(df)]))
+    mapa = _cache_indices().get(chave)
+    if mapa is None:
+        paradas = extrair_paradas(df)
+        mapa = {
+            cidade: ids.unique()
+            for cidade, ids in paradas.groupby('CIDADE')['ID_VIAGEM']
+        }
+        _cache_indices().set(chave, mapa)
+    return mapa
+
+
+def viagens_nas_cidades(df, cidades):
+    """IDs das viagens com alguma parada em `cidades`"""
+    mapa = viagens_por_cidade(df)
+    partes = [mapa[c] for c in cidades if c in mapa]
+    return set(np.concatenate(partes).tolist()) if partes else set()
+
+
+def viagens_na_regiao(df, regiao):
+    """IDs das viagens com alguma parada (origem ou destino) nas UFs da região"""
+    ufs = REGIOES_UF[regiao]
+    colunas = [c for c in ['UF_PARTIDA'] + [f'UF_DESTINO_{i}' for i in range(1, 5)] if c in df.columns]
+    if not colunas:
+        return set()
+    toca = df[colunas].apply(lambda col: col.astype(str).str.strip().str.upper().isin(ufs)).any(axis=1)
+    return set(df.loc[toca, 'ID_VIAGEM'].tolist())
+
+
+def filtro_geografico(df_viagens):
+    """Widgets do filtro geográfico na sidebar; retorna IDs permitidos ou None (sem filtro)"""
+    st.sidebar.subheader("🌎 Área")
+    modo = st.sidebar.selectbox("Filtrar por", ["Todas", "Raio de uma cidade", "Região"], key="filtro_geo")
+    
+    if modo == "Região":
+        regiao = st.sidebar.selectbox("Região", list(REGIOES_UF), key="filtro_geo_regiao")
+        return viagens_na_regiao(df_viagens, regiao)
+    
+    if modo == "Raio de uma cidade":
+        coords = coords_conhecidas(df_viagens)
+        if not coords:
+            st.sidebar.caption("⏳ Coordenadas ainda não carregadas — aguarde o pré-carregamento.")
+            return None
+        
+        cidade = st.sidebar.selectbox("Cidade", sorted(coords, key=str), key="filtro_geo_cidade")
+        raio = st.sidebar.slider("Raio (km)", 10, 1000, 150, step=10, key="filtro_geo_raio")
+        
+        lat, lon = coords[cidade]
+        cidades = get_indice_espacial(coords).no_raio(lat, lon, raio)
+        return viagens_nas_cidades(df_viagens, cidades)
+    
+    return None
+
+
+# ===================== ORIGEM–DESTINO =====================
+
+METRICAS_OD = {'VIAGENS': 'Viagens', 'KM': 'KM', 'CUSTO': 'Custo (R$)', 'LITROS': 'Diesel (L)'}
+
+
+@rastrear('agregacao/origem_destino')
+def matriz_od(df):
+    """Matriz origem–destino esparsa entre paradas consecutivas
+    
+    Cidades viram códigos inteiros e cada par um índice linear `o * n + d`;
+    as métricas são acumuladas com `np.bincount` só sobre os pares que existem.
+    KM, custo e litros de cada viagem são rateados entre os seus trechos.
+    Colunas: O, D (códigos), ORIGEM, DESTINO, VIAGENS, KM, CUSTO, LITROS.
+    """
+    colunas = ['O', 'D', 'ORIGEM', 'DESTINO'] + list(METRICAS_OD)
+    paradas = extrair_paradas(df)
+    if len(paradas) < 2:
+        return pd.DataFrame(columns=colunas)
+    
+    codigos, cidades = pd.factorize(paradas['CIDADE'])
+    ids = paradas['ID_VIAGEM'].to_numpy()
+    consecutivo = ids[1:] == ids[:-1]
+    
+    o = codigos[:-1][consecutivo].astype(np.int64)
+    d = codigos[1:][consecutivo].astype(np.int64)
+    viagem = ids[:-1][consecutivo]
+    if len(o) == 0:
+        return pd.DataFrame(columns=colunas)
+    
+    # Rateio por trecho
+    cod_viagem, viagens_unicas = pd.factorize(viagem)
+    n_trechos = np.bincount(cod_viagem)[cod_viagem]
+    totais = df.drop_duplicates('ID_VIAGEM').set_index('ID_VIAGEM').reindex(viagens_unicas)
+    
+    def rateio(coluna):
+        if coluna not in totais.columns:
+            return np.zeros(len(o))
+        return pd.to_numeric(totais[coluna], errors='coerce').fillna(0).to_numpy()[cod_viagem] / n_trechos
+    
+    chave = o * len(cidades) + d
+    pares, inverso = np.unique(chave, return_inverse=True)
+    
+    # Viagens distintas por par (uma viagem pode repetir o mesmo trecho)
+    par_viagem = np.unique(inverso.astype(np.int64) * len(viagens_unicas) + cod_viagem)
+    
+    od = pd.DataFrame({
+        'O': pares // len(cidades),
+        'D': pares % len(cidades),
+        'VIAGENS': np.bincount(par_viagem // len(viagens_unicas), minlength=len(pares)),
+        'KM': np.bincount(inverso, weights=rateio('KM_TOTAL_PERCORRIDO'), minlength=len(pares)),
+        'CUSTO': np.bincount(inverso, weights=rateio('GASTO_FINAL_TOTAL'), minlength=len(pares)),
+        'LITROS': np.bincount(inverso, weights=rateio('TOTAL_LITROS_DIESEL'), minlength=len(pares)),
+    })
+    od.insert(2, 'ORIGEM', cidades[od['O']])
+    od.insert(3, 'DESTINO', cidades[od['D']])
+    
+    return od.sort_values('VIAGENS', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def corredores(od, metrica='VIAGENS', n=10):
+    """Top `n` corredores (pares sem direção) com ida, volta e assimetria
+    
+    ASSIMETRIA vai de -1 (só volta) a 1 (só ida), sendo ida o sentido A → B.
+    """
+    colunas = ['CIDADE_A', 'CIDADE_B', 'IDA', 'VOLTA', 'TOTAL', 'ASSIMETRIA']
+    od = od[od['O'] != od['D']]
+    if od.empty:
+        return pd.DataFrame(columns=colunas)
+    
+    o, d = od['O'].to_numpy(), od['D'].to_numpy()
+    a, b = np.minimum(o, d), np.maximum(o, d)
+    valor = od[metrica].to_numpy(dtype=float)
+    
+    n_cidades = int(max(o.max(), d.max())) + 1
+    pares, inverso = np.unique(a * n_cidades + b, return_inverse=True)
+    ida = np.bincount(inverso, weights=np.where(o == a, valor, 0), minlength=len(pares))
+    volta = np.bincount(inverso, weights=np.where(o == a, 0, valor), minlength=len(pares))
+    
+    nomes = pd.concat([od[['O', 'ORIGEM']].set_axis(['C', 'N'], axis=1),
+                       od[['D', 'DESTINO']].set_axis(['C', 'N'], axis=1)]).drop_duplicates('C').set_index('C')['N']
+    
+    resultado = pd.DataFrame({
+        'CIDADE_A': nomes.reindex(pares // n_cidades).to_numpy(),
+        'CIDADE_B': nomes.reindex(pares % n_cidades).to_numpy(),
+        'IDA': ida,
+        'VOLTA': volta,
+        'TOTAL': ida + volta,
+    })
+    resultado['ASSIMETRIA'] = (resultado['IDA'] - resultado['VOLTA']) / resultado['TOTAL'].where(resultado['TOTAL'] > 0)
+    
+    return resultado.nlargest(n, 'TOTAL')[colunas].reset_index(drop=True)
+
+
+def pivot_od(od, metrica='VIAGENS', n=15):
+    """Matriz densa n × n das `n` cidades com maior fluxo (entrada + saída), para heatmap"""
+    if od.empty:
+        return pd.DataFrame()
+    
+    fluxo = pd.concat([
+        od.groupby('ORIGEM')[metrica].sum(),
+        od.groupby('DESTINO')[metrica].sum()
+    ]).groupby(level=0).sum()
+    top = fluxo.nlargest(n).index
+    
+    sub = od[od['ORIGEM'].isin(top) & od['DESTINO'].isin(top)]
+    posicao = {cidade: i for i, cidade in enumerate(top)}
+    
+    matriz = np.zeros((len(top), len(top)))
+    np.add.at(matriz, (sub['ORIGEM'].map(posicao).to_numpy(), sub['DESTINO'].map(posicao).to_numpy()),
+              sub[metrica].to_numpy(dtype=float))
+    
+    return pd.DataFrame(matriz, index=top, columns=top)
+
+
+# ===================== CONFERÊNCIA DE KM =====================
+
+FATOR_ESTRADA = 1.25  # Estradas são, em média, ~25% mais longas que a linha reta
+
+
+def km_linha_reta(df, coords, retorno=True):
+    """KM em linha reta (haversine) ao longo das paradas de cada viagem, vetorizado
+    
+    Com `retorno`, inclui a volta da última parada à origem. Viagens com alguma
+    cidade sem coordenadas ficam com NaN. Retorna Series indexada por ID_VIAGEM.
+    """
+    paradas = extrair_paradas(df)
+    if paradas.empty:
+        return pd.Series(dtype=float, name='KM_LINHA_RETA')
+    
+    if retorno:
+        origens = paradas[paradas['ORDEM'] == 0].assign(ORDEM=paradas['ORDEM'].max() + 1)
+        paradas = pd.concat([paradas, origens]).sort_values(['ID_VIAGEM', 'ORDEM'], kind='stable')
+    
+    lat = paradas['CIDADE'].map({c: latlon[0] for c, latlon in coords.items()}).to_numpy(dtype=float)
+    lon = paradas['CIDADE'].map({c: latlon[1] for c, latlon in coords.items()}).to_numpy(dtype=float)
+    ids = paradas['ID_VIAGEM'].to_numpy()
+    
+    consecutivo = ids[1:] == ids[:-1]
+    distancias = haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])[consecutivo]
+    
+    codigos, viagens = pd.factorize(ids[:-1][consecutivo])
+    total = np.bincount(codigos, weights=np.nan_to_num(distancias), minlength=len(viagens))
+    faltando = np.bincount(codigos, weights=np.isnan(distancias), minlength=len(viagens)) > 0
+    total[faltando] = np.nan
+    
+    # Viagens de uma parada só: 0 km
+    serie = pd.Series(total, index=viagens, name='KM_LINHA_RETA')
+    return serie.reindex(paradas['ID_VIAGEM'].unique(), fill_value=0.0)
+
+
+@rastrear('agregacao/conferencia_km')
+def conferencia_km(df, coords, razao_min=0.8, razao_max=1.5, fator_estrada=FATOR_ESTRADA, retorno=True):
+    """Compara KM_TOTAL_PERCORRIDO com a distância estimada pelas paradas
+    
+    KM_ESTIMADO = linha reta × `fator_estrada`; RAZAO = registrado / estimado.
+    STATUS: 'OK', 'Abaixo', 'Acima', 'Local' (sem deslocamento entre cidades)
+    ou 'Sem coordenadas'.
+    """
+    colunas = [c for c in ['ID_VIAGEM', 'DATA_INICIO_VIAGEM', 'MOTORISTA', 'MODELO_VEICULO'] if c in df.columns]
+    resultado = df.drop_duplicates('ID_VIAGEM')[colunas + ['KM_TOTAL_PERCORRIDO']].copy()
+    
+    linha_reta = km_linha_reta(df, coords, retorno=retorno)
+    resultado['KM_LINHA_RETA'] = resultado['ID_VIAGEM'].map(linha_reta).to_numpy(dtype=float)
+    resultado['KM_ESTIMADO'] = resultado['KM_LINHA_RETA'] * fator_estrada
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resultado['RAZAO'] = resultado['KM_TOTAL_PERCORRIDO'] / resultado['KM_ESTIMADO'].where(resultado['KM_ESTIMADO'] > 0)
+    
+    resultado['STATUS'] = np.select(
+        [resultado['KM_LINHA_RETA'].isna(),
+         resultado['KM_LINHA_RETA'] == 0,
+         resultado['RAZAO'] < razao_min,
+         resultado['RAZAO'] > razao_max],
+        ['Sem coordenadas', 'Local', 'Abaixo', 'Acima'],
+        default='OK'
+    )
+    
+    return resultado.reset_index(drop=True)
+
+
+LIMITES_DIFERENCA_KM = (50, 100)  # verde abaixo do 1º, laranja abaixo do 2º, vermelho acima
+
+
+def km_rotas_em_cache(df, coords, cache=None):
+    """KM rodoviário de cada viagem somando os trechos já presentes no cache de rotas
+    
+    Não faz requisições: viagens com algum trecho fora do cache (ou cidade sem
+    coordenadas) ficam com NaN. Retorna DataFrame ID_VIAGEM, KM_ROTA, TEMPO_ROTA.
+    """
+    cache = get_cache_rotas() if cache is None else cache
+    paradas = extrair_paradas(df)
+    if paradas.empty:
+        return pd.DataFrame(columns=['ID_VIAGEM', 'KM_ROTA', 'TEMPO_ROTA'])
+    
+    lat = paradas['CIDADE'].map({c: latlon[0] for c, latlon in coords.items()}).to_numpy(dtype=float)
+    lon = paradas['CIDADE'].map({c: latlon[1] for c, latlon in coords.items()}).to_numpy(dtype=float)
+    ids = paradas['ID_VIAGEM'].to_numpy()
+    consecutivo = ids[1:] == ids[:-1]
+    
+    # Mesma função de chave de quem grava no cache (round do Python, não np.round: difere nos empates)
+    origens = zip(lat[:-1][consecutivo].tolist(), lon[:-1][consecutivo].tolist())
+    destinos = zip(lat[1:][consecutivo].tolist(), lon[1:][consecutivo].tolist())
+    chaves = [chave_trecho(origem, destino) for origem, destino in zip(origens, destinos)]
+    
+    # Uma consulta ao cache por trecho distinto
+    consultas = {}
+    for chave in set(chaves):
+        if chave[:2] == chave[2:]:
+            consultas[chave] = (0.0, 0.0)
+            continue
+        trecho = cache.get(chave) if not np.isnan(chave).any() else None
+        consultas[chave] = (
+            (trecho['distancia'], trecho['tempo'] or 0.0)
+            if trecho is not None and trecho['distancia'] is not None else (np.nan, np.nan)
+        )
+    valores = np.array([consultas[c] for c in chaves], dtype=float).reshape(-1, 2)
+    
+    codigos, viagens = pd.factorize(ids[:-1][consecutivo])
+    faltando = np.bincount(codigos, weights=np.isnan(valores[:, 0]), minlength=len(viagens)) > 0
+    km = np.bincount(codigos, weights=np.nan_to_num(valores[:, 0]), minlength=len(viagens))
+    tempo = np.bincount(codigos, weights=np.nan_to_num(valores[:, 1]), minlength=len(viagens))
+    km[faltando] = np.nan
+    tempo[faltando] = np.nan
+    
+    return pd.DataFrame({'ID_VIAGEM': viagens, 'KM_ROTA': km, 'TEMPO_ROTA': tempo})
+
+
+@rastrear('agregacao/reconciliacao')
+def reconciliacao_rotas(df, coords, cache=None):
+    """Diferença entre KM_TOTAL_PERCORRIDO e o KM das rotas em cache, por viagem
+    
+    Mesma convenção do popup do mapa: DIFERENCA = rota − registrado e FAIXA
+    'Verde'/'Laranja'/'Vermelho' por `LIMITES_DIFERENCA_KM`; 'Sem rota' se faltar trecho.
+    """
+    colunas = [c for c in ['ID_VIAGEM', 'DATA_INICIO_VIAGEM', 'MOTORISTA', 'MODELO_VEICULO'] if c in df.columns]
+    resultado = df.drop_duplicates('ID_VIAGEM')[colunas + ['KM_TOTAL_PERCORRIDO']].merge(
+        km_rotas_em_cache(df, coords, cache), on='ID_VIAGEM', how='left'
+    )
+    resultado['DIFERENCA'] = resultado['KM_ROTA'] - resultado['KM_TOTAL_PERCORRIDO']
+    
+    abs_dif = resultado['DIFERENCA'].abs()
+    resultado['FAIXA'] = np.select(
+        [resultado['KM_ROTA'].isna(), abs_dif < LIMITES_DIFERENCA_KM[0], abs_dif < LIMITES_DIFERENCA_KM[1]],
+        ['Sem rota', 'Verde', 'Laranja'],
+        default='Vermelho'
+    )
+    
+    return resultado.sort_values('DIFERENCA', key=lambda s: s.abs(), ascending=False, na_position='last').reset_index(drop=True)
+
+
+def resumo_reconciliacao(rec, coluna):
+    """Agrega a reconciliação por `coluna` (MOTORISTA, MODELO_VEICULO...), maiores desvios primeiro"""
+    com_rota = rec.dropna(subset=['KM_ROTA'])
+    if com_rota.empty:
+        return pd.DataFrame(columns=[coluna, 'VIAGENS', 'KM_REGISTRADO', 'KM_ROTA', 'DIFERENCA', 'DESVIO_MEDIO', 'VERMELHAS'])
+    
+    return com_rota.assign(
+        DESVIO=com_rota['DIFERENCA'].abs(),
+        VERMELHA=com_rota['FAIXA'] == 'Vermelho'
+    ).groupby(coluna).agg(
+        VIAGENS=('ID_VIAGEM', 'count'),
+        KM_REGISTRADO=('KM_TOTAL_PERCORRIDO', 'sum'),
+        KM_ROTA=('KM_ROTA', 'sum'),
+        DIFERENCA=('DIFERENCA', 'sum'),
+        DESVIO_MEDIO=('DESVIO', 'mean'),
+        VERMELHAS=('VERMELHA', 'sum'),
+    ).reset_index().sort_values('DESVIO_MEDIO', ascending=False).reset_index(drop=True)
 
 
 # ===================== INSIGHTS =====================
 
+@rastrear('insights/gerais')
 def insights_gerais(df):
     """Calcula insights gerais da frota"""
     if df is None or df.empty:
@@ -320,6 +2966,7 @@ def insights_gerais(df):
     return insights
 
 
+@rastrear('insights/motorista')
 def insights_motorista(df):
     """Insights específicos de um motorista"""
     if df is None or df.empty:
@@ -362,6 +3009,7 @@ def insights_motorista(df):
     return insights
 
 
+@rastrear('insights/veiculo')
 def insights_veiculo(df):
     """Insights de um veículo"""
     if df is None or df.empty:
@@ -404,6 +3052,7 @@ def insights_veiculo(df):
     return insights
 
 
+@rastrear('insights/cidade')
 def insights_cidade(df_cidades):
     """Insights de cidades"""
     if df_cidades is None or df_cidades.empty: